@@ -0,0 +1,4 @@
+# coding=utf-8
+"""
+benchmarks: 示例策略的性能基准测试
+"""
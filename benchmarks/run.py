@@ -0,0 +1,227 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from collections import OrderedDict
+import numpy as np
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from etatools.replay.engine import ReplayEngine
+from etatools.replay.sdk import install, load_strategy
+from benchmarks.synthetic import SyntheticData
+
+'''
+示例策略的回调延迟基准测试:
+每个 (策略, 股票池大小) 在独立的子进程中用合成行情和本地回放引擎运行, 记录onBeforeMarketOpen/onBar/onHandleData
+每次调用耗时的p50/p99和进程的峰值内存, 结果写成JSON; 指定--baseline时与之前保存的结果比较, 超过阈值的项目视为性能回退.
+有策略运行失败(异常或超时)或出现性能回退时以非0状态退出, 失败的策略没有延迟和内存数据, 不能作为基准
+    python -m benchmarks.run --universe 50 300 --output bench.json
+    python -m benchmarks.run --strategies stockTiming multiFactor --baseline bench.json --threshold 0.2
+策略目录先复制到临时目录再运行, 模型缓存等文件不会写入仓库, 每次运行的结果互不影响
+'''
+
+STRATEGIES = OrderedDict([
+    ('net_trade', '期货网格交易策略python/net_trade.py'),
+    ('turtleTradingRule', '期货海龟交易策略python/turtleTradingRule.py'),
+    ('dualTrust', '期货日内交易策略python/dualTrust.py'),
+    ('interCommoditySpread', '期货跨市场套利策略python/interCommoditySpread.py'),
+    ('calendarArbitrage', '期货跨期套利策略python/calendarArbitrage.py'),
+    ('intradayStockTrade', '股票日内回转交易策略python/intradayStockTrade.py'),
+    ('industryRotation', '股票行业轮动策略python/industryRotation.py'),
+    ('index_hedge_alpha', '股票期货对冲策略python/index_hedge_alpha.py'),
+    ('machineLearning', '股票机器学习策略python/machineLearning.py'),
+    ('stockTiming', '股票择时策略python/stockTiming.py'),
+    ('multiFactor', '股票多因子选股策略python/multiFactor.py'),
+])
+
+CALLBACKS = ('onBeforeMarketOpen', 'onBar', 'onHandleData')
+
+
+def timed(func, samples):
+    clock = time.perf_counter
+
+    def wrapper(*args):
+        started = clock()
+        try:
+            return func(*args)
+        finally:
+            samples.append(clock() - started)
+    return wrapper
+
+
+def latency(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1e6
+    return OrderedDict([('count', len(values)),
+                        ('p50_us', float(np.percentile(values, 50))),
+                        ('p99_us', float(np.percentile(values, 99))),
+                        ('max_us', float(values.max())),
+                        ('total_ms', float(values.sum() / 1000))])
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux的单位是KB, macOS是字节
+    return peak / (1024. * 1024. if sys.platform == 'darwin' else 1024.)
+
+
+def run_one(name, universe, seed, start, days, warmup):
+    """
+    在当前进程内运行一个策略, 返回结果记录
+    """
+    install()
+    source = os.path.join(ROOT, 'example', STRATEGIES[name])
+    workdir = os.path.join(tempfile.mkdtemp(prefix='bench_'), os.path.basename(os.path.dirname(source)))
+    shutil.copytree(os.path.dirname(source), workdir, ignore=shutil.ignore_patterns('__pycache__', 'models'))
+    try:
+        os.chdir(workdir)
+        sys.path.insert(0, workdir)
+        # 模型缓存等写入用户缓存目录的文件也放在临时目录中
+        os.environ['XDG_CACHE_HOME'] = os.path.dirname(workdir)
+        random.seed(seed)
+        np.random.seed(seed)
+        module = load_strategy(os.path.join(workdir, os.path.basename(source)))
+        samples = dict((callback, []) for callback in CALLBACKS)
+        for callback in CALLBACKS:
+            func = getattr(module, callback, None)
+            if func is not None:
+                setattr(module, callback, timed(func, samples[callback]))
+
+        data = SyntheticData(seed=seed, universe=universe, start_date=start, days=days, warmup=warmup)
+        engine = ReplayEngine(module, data, start_date=int(data.calendar[warmup]))
+        # 策略自身的输出不计入耗时统计
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = engine.run()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(os.path.dirname(workdir), ignore_errors=True)
+
+    return OrderedDict([('strategy', name), ('universe', universe), ('days', len(result.equity)),
+                        ('bars', result.bars), ('elapsed_s', result.elapsed),
+                        ('peak_memory_mb', peak_memory_mb()),
+                        ('callbacks', OrderedDict((callback, latency(samples[callback]))
+                                                  for callback in CALLBACKS if samples[callback]))])
+
+
+def run_worker(args, name, universe):
+    # 每个策略使用独立的子进程, 峰值内存和导入的模块互不影响
+    command = [sys.executable, '-m', 'benchmarks.run', '--worker', name, '--universe', str(universe),
+               '--seed', str(args.seed), '--start', str(args.start), '--days', str(args.days),
+               '--warmup', str(args.warmup)]
+    try:
+        process = subprocess.run(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return OrderedDict([('strategy', name), ('universe', universe), ('error', 'timeout')])
+    lines = process.stdout.decode('utf-8', 'replace').strip().splitlines()
+    if process.returncode != 0 or not lines:
+        error = process.stderr.decode('utf-8', 'replace').strip().splitlines()
+        return OrderedDict([('strategy', name), ('universe', universe),
+                            ('error', error[-1] if error else 'exit code %d' % process.returncode)])
+    return json.loads(lines[-1], object_pairs_hook=OrderedDict)
+
+
+def compare(results, baseline, threshold, memory_threshold, floor_us):
+    """
+    返回性能回退列表: p50/p99超过基准的(1 + threshold)倍且差值大于floor_us, 或峰值内存超过(1 + memory_threshold)倍
+    """
+    previous = dict(((record['strategy'], record['universe']), record) for record in baseline['results']
+                    if 'error' not in record)
+    regressions = []
+    for record in results:
+        old = previous.get((record['strategy'], record['universe']))
+        if old is None or 'error' in record:
+            continue
+        label = '%s@%s' % (record['strategy'], record['universe'])
+        for callback, stats in record['callbacks'].items():
+            old_stats = old['callbacks'].get(callback)
+            if old_stats is None:
+                continue
+            for key in ('p50_us', 'p99_us'):
+                if stats[key] > old_stats[key] * (1 + threshold) and stats[key] - old_stats[key] > floor_us:
+                    regressions.append('%s %s %s: %.1f -> %.1f' % (label, callback, key, old_stats[key], stats[key]))
+        if record['peak_memory_mb'] and old['peak_memory_mb'] and \
+                record['peak_memory_mb'] > old['peak_memory_mb'] * (1 + memory_threshold):
+            regressions.append('%s peak_memory_mb: %.1f -> %.1f' % (label, old['peak_memory_mb'],
+                                                                    record['peak_memory_mb']))
+    return regressions
+
+
+def report(results):
+    print('%-22s %8s %-20s %8s %10s %10s %10s' % ('strategy', 'universe', 'callback', 'count', 'p50(us)',
+                                                  'p99(us)', 'peak(MB)'))
+    for record in results:
+        if 'error' in record:
+            print('%-22s %8s ERROR: %s' % (record['strategy'], record['universe'], record['error']))
+            continue
+        for callback, stats in record['callbacks'].items():
+            print('%-22s %8s %-20s %8d %10.1f %10.1f %10.1f' % (
+                record['strategy'], record['universe'], callback, stats['count'], stats['p50_us'],
+                stats['p99_us'], record['peak_memory_mb'] or 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument('--universe', nargs='+', type=int, default=[50], help='指数/板块的成分股数量')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', type=int, default=20180102, help='回测开始日期')
+    parser.add_argument('--days', type=int, default=20, help='回测交易日数')
+    parser.add_argument('--warmup', type=int, default=300, help='回测开始前的日K线交易日数')
+    parser.add_argument('--timeout', type=float, default=1800, help='单个策略的超时秒数')
+    parser.add_argument('--output', help='结果JSON文件')
+    parser.add_argument('--baseline', help='用于比较的基准结果JSON文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='延迟回退的相对阈值')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='峰值内存回退的相对阈值')
+    parser.add_argument('--floor-us', type=float, default=5.0, help='小于该差值(微秒)的延迟变化不算回退')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        record = run_one(args.worker, args.universe[0], args.seed, args.start, args.days, args.warmup)
+        print(json.dumps(record))
+        return 0
+
+    results = [run_worker(args, name, universe) for universe in args.universe for name in args.strategies]
+    report(results)
+    output = OrderedDict([('meta', OrderedDict([('seed', args.seed), ('start', args.start), ('days', args.days),
+                                                ('warmup', args.warmup), ('python', platform.python_version()),
+                                                ('numpy', np.__version__), ('platform', platform.platform())])),
+                          ('results', results)])
+    if args.output:
+        with io.open(args.output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(output, indent=2, ensure_ascii=False))
+
+    failures = [record for record in results if 'error' in record]
+    for record in failures:
+        print('[FAILED] %s@%s: %s' % (record['strategy'], record['universe'], record['error']))
+    regressions = []
+    if args.baseline:
+        with io.open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.memory_threshold, args.floor_us)
+        for line in regressions:
+            print('[REGRESSION]', line)
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import zlib
+import numpy as np
+import pandas as pd
+from etatools.replay.data import BAR_DTYPE, DAY_CLOSE, LocalData, RefData, date_millis
+
+'''
+确定性的合成行情:
+任何代码第一次被请求时按 (seed, 代码) 生成整段K线, 同样的参数在任何机器上得到完全相同的数据;
+指数和板块(.IDX/.PLA)的成分从universe * 2只股票中抽取universe只, 品种(.PRD)固定为contracts个合约,
+xxZ0.CF连续合约映射到该品种的第一个合约; 分钟K线只覆盖回测区间和之前minute_warmup个交易日
+'''
+
+# 每个交易日的分钟K线: 09:31-11:30, 13:01-15:00
+SESSION_MINUTES = np.concatenate([np.arange(9 * 60 + 31, 11 * 60 + 31), np.arange(13 * 60 + 1, 15 * 60 + 1)])
+CONTRACT_MONTHS = ('1801', '1805', '1809', '1901', '1905', '1909')
+FIELDS = ('MKT_CAP', 'PB', 'PE')
+
+
+class SyntheticData(LocalData):
+    """
+    与LocalData接口相同的内存数据源
+    start_date: 回测开始日期, days: 回测交易日数, warmup: 回测开始前的日K线交易日数
+    """
+
+    def __init__(self, seed=0, universe=50, start_date=20180102, days=20, warmup=300, minute_warmup=5,
+                 contracts=4):
+        LocalData.__init__(self, root='')
+        self.seed = seed
+        self.universe = universe
+        self.contracts = contracts
+        dates = pd.bdate_range(end=pd.Timestamp(str(start_date)) - pd.Timedelta(days=1), periods=warmup)
+        dates = dates.append(pd.bdate_range(start=str(start_date), periods=days))
+        self.calendar = np.asarray(dates.year * 10000 + dates.month * 100 + dates.day, dtype=np.int64)
+        self.minute_dates = self.calendar[max(0, warmup - minute_warmup):]
+        self.stocks = ['%06d.CS' % (600000 + i) for i in range(universe * 2)]
+
+    def rng(self, *keys):
+        key = '|'.join(str(k) for k in (self.seed,) + keys)
+        return np.random.RandomState(zlib.crc32(key.encode('utf-8')) & 0xffffffff)
+
+    def bars(self, span, symbol):
+        key = (span, symbol)
+        bars = self.bar_cache.get(key)
+        if bars is None:
+            bars = self.bar_cache[key] = self.generate(span, symbol)
+        return bars
+
+    def generate(self, span, symbol):
+        rng = self.rng(span, symbol)
+        future = symbol.endswith('.CF')
+        stock = symbol.endswith('.CS')
+        if span == 'DAY_1':
+            dates = self.calendar
+            times = date_millis(dates, *DAY_CLOSE)
+            sigma = 0.02
+        else:
+            dates = np.repeat(self.minute_dates, len(SESSION_MINUTES))
+            minutes = np.tile(SESSION_MINUTES, len(self.minute_dates))
+            times = date_millis(dates) + minutes * 60000
+            sigma = 0.0015
+        count = len(dates)
+        bars = np.zeros(count, dtype=BAR_DTYPE)
+        level = rng.uniform(3000, 5000) if future else rng.uniform(5, 50)
+        close = level * np.exp(np.cumsum(rng.normal(0, sigma, count)))
+        opens = close * np.exp(rng.normal(0, sigma / 2, count))
+        spread = close * np.abs(rng.normal(0, sigma / 2, count))
+        bars['time'] = times
+        bars['tradeDate'] = dates
+        bars['open'] = opens
+        bars['close'] = close
+        bars['high'] = np.maximum(opens, close) + spread
+        bars['low'] = np.minimum(opens, close) - spread
+        bars['volume'] = rng.randint(100, 10000, count)
+        bars['totalVolume'] = bars['volume']
+        bars['adjFactor'] = 1.0
+        if stock:
+            bars['isSuspended'] = rng.uniform(size=count) < 0.01
+            # 一次除权, 覆盖前复权的处理
+            bars['adjFactor'][rng.randint(count // 2, count):] = rng.uniform(1.05, 1.3)
+        return bars
+
+    def ref(self, symbol):
+        if self.refdata is None:
+            self.refdata = {}
+        ref = self.refdata.get(symbol)
+        if ref is None:
+            if symbol.endswith('.CF'):
+                ref = RefData(symbol, 'future', valuePerUnit=10.0, priceTick=1.0, marginRatio=0.1)
+            else:
+                ref = RefData(symbol, 'stock')
+            self.refdata[symbol] = ref
+        return ref
+
+    def constituents(self, instset, date):
+        if instset.endswith('.PRD'):
+            product = instset[:-len('.PRD')]
+            return ['%s%s.CF' % (product, month) for month in CONTRACT_MONTHS[:self.contracts]]
+        picked = self.rng('instset', instset).choice(len(self.stocks), self.universe, replace=False)
+        return [self.stocks[i] for i in np.sort(picked)]
+
+    def continuous_symbol(self, symbol, date):
+        if symbol.endswith('Z0.CF'):
+            return self.constituents(symbol[:-len('Z0.CF')] + '.PRD', date)[0]
+        return symbol
+
+    def fields_one_day(self, date):
+        day = self.field_days.get(int(date))
+        if day is None:
+            rng = self.rng('fields', date)
+            size = len(self.stocks)
+            day = self.field_days[int(date)] = pd.DataFrame(
+                {'MKT_CAP': rng.lognormal(23, 1, size), 'PB': rng.lognormal(0.5, 0.5, size),
+                 'PE': rng.lognormal(3, 0.5, size)}, index=pd.Index(self.stocks, name='symbol'), columns=FIELDS)
+        return day
+
+    def trade_dates(self, symbols, span):
+        return self.calendar
@@ -0,0 +1,13 @@
+# coding=utf-8
+"""
+etatools: 示例策略共用的工具
+"""
+from __future__ import absolute_import
+
+from etatools.bars import BarArray, get_bars
+from etatools.factors import RollingFactorModel
+from etatools.fundamentals import FundamentalsLoader
+from etatools.history import BarHistory
+from etatools.panel import BarPanel
+from etatools.parallel import ParallelEvaluator
+from etatools.schedule import TradingCalendar, Scheduler
@@ -0,0 +1,91 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pandas as pd
+
+'''
+K线结果的结构化数组表示：
+BarArray包装一段按时间排序的结构化数组, close等字段以属性或下标取得, 返回同一块连续内存上的视图, 不做拷贝;
+按整数下标或迭代得到的是可以按属性访问字段的记录, 切片仍是BarArray; 只有访问df时才构造DataFrame, 构造后缓存.
+get_bars()在api(本地回放或BarHistory)提供getBarsArray时直接取得视图, 否则把getBarsHistory(df=True)的结果转换一次;
+视图可能指向数据源的缓存, 需要长期保存时调用copy()
+'''
+
+
+class BarArray(object):
+    """
+    values: 结构化数组, 字段与getBarsHistory返回的列相同
+    """
+    __slots__ = ('values', 'frame')
+
+    def __init__(self, values):
+        self.values = values
+        self.frame = None
+
+    @classmethod
+    def from_frame(cls, frame):
+        # 一次拷贝成连续的结构化数组, 字符串等列保存为object
+        columns = [(str(name), frame[name].to_numpy()) for name in frame.columns]
+        dtype = [(name, values.dtype if values.dtype.kind in 'biufcmM' else object) for name, values in columns]
+        values = np.empty(len(frame), dtype=dtype)
+        for name, column in columns:
+            values[name] = column
+        return cls(values)
+
+    @classmethod
+    def from_bars(cls, bars, fields):
+        # 由bar对象列表转换, fields为需要保留的字段
+        values = np.empty(len(bars), dtype=[(str(field), np.float64) for field in fields])
+        for field in fields:
+            values[field] = [getattr(bar, field) for bar in bars]
+        return cls(values)
+
+    @property
+    def fields(self):
+        return self.values.dtype.names
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getattr__(self, name):
+        try:
+            return self.values[name]
+        except (ValueError, KeyError, IndexError):
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.values[key]
+        if isinstance(key, slice):
+            return BarArray(self.values[key])
+        return self.values.view(np.recarray)[key]
+
+    def __iter__(self):
+        return iter(self.values.view(np.recarray))
+
+    def __repr__(self):
+        return 'BarArray(%d bars, fields=%s)' % (len(self.values), ', '.join(self.fields or ()))
+
+    @property
+    def df(self):
+        if self.frame is None:
+            self.frame = pd.DataFrame(dict((name, self.values[name]) for name in self.fields), columns=self.fields)
+        return self.frame
+
+    def copy(self):
+        return BarArray(self.values.copy())
+
+
+def get_bars(api, symbol, timeSpan, count=1, priceMode=None, skipSuspended=None, fields=None):
+    """
+    与getBarsHistory参数相同, 返回BarArray; priceMode/skipSuspended为None时使用api的默认值
+    """
+    options = {}
+    if priceMode is not None:
+        options['priceMode'] = priceMode
+    if skipSuspended is not None:
+        options['skipSuspended'] = skipSuspended
+    fetch = getattr(api, 'getBarsArray', None)
+    if fetch is not None:
+        return fetch(symbol, timeSpan, count=count, fields=fields, **options)
+    return BarArray.from_frame(api.getBarsHistory(symbol, timeSpan, count=count, fields=fields, df=True, **options))
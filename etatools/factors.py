@@ -0,0 +1,130 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pandas as pd
+
+'''
+滚动时间序列因子回归：
+保存最近window天的因子日收益率 (天 x 因子) 和股票日收益率 (天 x 股票),
+对所有股票做同一个回归 r = alpha + beta * f + e, 设计矩阵X = [f, 1]对所有股票相同,
+只需维护XtX和XtR, 每天加入新的一行并减去移出窗口的一行, 解一次 (因子数+1) 阶的方程组即可得到全部股票的系数.
+窗口内有缺失收益率的股票不参与估计, 结果为nan
+'''
+
+
+class RollingFactorModel(object):
+    """
+    window: 回归用的天数, factors: 因子名称列表, 因子个数不限
+    refresh: 每隔多少天用窗口数据重新累加一次XtX和XtR, 消除增量更新的舍入误差, 默认为window
+    """
+
+    def __init__(self, window, factors, refresh=None, capacity=64):
+        self.window = window
+        self.factors = list(factors)
+        self.refresh = refresh or window
+        k = len(self.factors) + 1
+        self.x = np.zeros((window, k))
+        self.r = np.full((window, capacity), np.nan)
+        self.xtx = np.zeros((k, k))
+        self.xtr = np.zeros((k, capacity))
+        self.rtr = np.zeros(capacity)
+        self.missing = np.zeros(capacity, dtype=np.int64)
+        self.slot = {}
+        self.symbols = []
+        self.count = 0
+        self.updates = 0
+
+    @property
+    def ready(self):
+        return self.count >= self.window
+
+    def columns(self, symbols):
+        # 股票对应的列号, 新股票分配新列, 之前的日期视为缺失
+        columns = []
+        for symbol in symbols:
+            column = self.slot.get(symbol)
+            if column is None:
+                if len(self.symbols) == self.r.shape[1]:
+                    self.grow()
+                column = self.slot[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+                self.missing[column] = min(self.count, self.window)
+            columns.append(column)
+        return np.array(columns, dtype=np.int64)
+
+    def grow(self):
+        capacity = self.r.shape[1]
+        self.r = np.hstack([self.r, np.full((self.window, capacity), np.nan)])
+        self.xtr = np.hstack([self.xtr, np.zeros((self.xtr.shape[0], capacity))])
+        self.rtr = np.concatenate([self.rtr, np.zeros(capacity)])
+        self.missing = np.concatenate([self.missing, np.zeros(capacity, dtype=np.int64)])
+
+    def update(self, factor_returns, symbols, stock_returns):
+        """
+        加入一天的数据: factor_returns与factors顺序一致, stock_returns与symbols对应, 未给出的股票视为缺失
+        """
+        columns = self.columns(symbols)
+        size = len(self.symbols)
+        x = np.append(np.asarray(factor_returns, dtype=np.float64), 1.0)
+        r = np.full(size, np.nan)
+        r[columns] = stock_returns
+        position = self.count % self.window
+        if self.count >= self.window:
+            self.accumulate(self.x[position], self.r[position, :size], -1)
+        self.x[position] = x
+        self.r[position, :size] = r
+        self.r[position, size:] = np.nan
+        self.accumulate(x, r, 1)
+        self.count += 1
+        self.updates += 1
+        if self.updates >= self.refresh:
+            self.recompute()
+
+    def accumulate(self, x, r, sign):
+        size = len(r)
+        missing = np.isnan(r)
+        r = np.where(missing, 0., r)
+        self.xtx += sign * np.outer(x, x)
+        self.xtr[:, :size] += sign * np.outer(x, r)
+        self.rtr[:size] += sign * r * r
+        self.missing[:size] += sign * missing
+
+    def recompute(self):
+        rows = min(self.count, self.window)
+        size = len(self.symbols)
+        x = self.x[:rows]
+        r = self.r[:rows, :size]
+        missing = np.isnan(r)
+        r = np.where(missing, 0., r)
+        self.xtx = x.T.dot(x)
+        self.xtr[:, :size] = x.T.dot(r)
+        self.rtr[:size] = (r * r).sum(axis=0)
+        self.missing[:size] = missing.sum(axis=0)
+        self.updates = 0
+
+    def fit(self, symbols=None):
+        """
+        返回以股票代码为索引的表, 列为alpha, 各因子的beta和alpha的t统计量; 窗口未满时返回空表
+        """
+        names = ['alpha'] + ['beta_' + name for name in self.factors] + ['tstat']
+        if not self.ready:
+            return pd.DataFrame(columns=names)
+        symbols = list(self.symbols) if symbols is None else list(symbols)
+        columns = np.array([self.slot.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        known = columns >= 0
+        result = np.full((len(symbols), len(names)), np.nan)
+        complete = np.zeros(len(symbols), dtype=bool)
+        complete[known] = self.missing[columns[known]] == 0
+        if complete.any():
+            used = columns[complete]
+            # 所有股票共用的 (XtX)^-1
+            xtx_inv = np.linalg.pinv(self.xtx)
+            coef = xtx_inv.dot(self.xtr[:, used])
+            dof = self.window - self.xtx.shape[0]
+            sse = self.rtr[used] - (coef * self.xtr[:, used]).sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stderr = np.sqrt(np.maximum(sse, 0.) / dof * xtx_inv[-1, -1]) if dof > 0 else np.nan
+                result[complete, 0] = coef[-1]
+                result[complete, 1:-1] = coef[:-1].T
+                result[complete, -1] = coef[-1] / stderr
+        return pd.DataFrame(result, index=symbols, columns=names)
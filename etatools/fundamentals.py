@@ -0,0 +1,42 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pandas as pd
+
+'''
+截面基本面数据加载：
+用一次getFieldsOneDay请求取得整个股票列表前一交易日的因子数据, 返回按股票代码索引的DataFrame,
+同一交易日内的结果会被缓存. 当日停牌只能用isSuspend逐个查询, 由策略在选出的股票上按需检查
+'''
+
+
+class FundamentalsLoader(object):
+    """
+    按交易日缓存的截面基本面数据
+    fields: 需要的因子, 如['MKT_CAP', 'PB']
+    """
+
+    def __init__(self, api, fields):
+        self.api = api
+        self.fields = list(fields)
+        self.trade_date = None
+        self.block = None
+
+    def load(self, symbols, trade_date):
+        symbols = list(symbols)
+        # 新的交易日清空缓存
+        if trade_date != self.trade_date:
+            self.trade_date = trade_date
+            self.block = self.fetch(symbols, trade_date)
+        else:
+            missing = [symbol for symbol in symbols if symbol not in self.block.index]
+            if missing:
+                self.block = pd.concat([self.block, self.fetch(missing, trade_date)])
+        return self.block.reindex(symbols)
+
+    def fetch(self, symbols, trade_date):
+        # 因子取前一交易日的数据, 与getFieldsCountDays(count=1)在盘前取得的数据一致
+        data = self.api.getFieldsOneDay(symbols, self.fields, self.api.getPrevTradeDate(trade_date), df=True)
+        block = data.set_index('symbol').reindex(symbols)[self.fields].astype(np.float64)
+        block.index.name = 'symbol'
+        return block
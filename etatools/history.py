@@ -0,0 +1,213 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pandas as pd
+from etatools.bars import BarArray
+
+'''
+getBarsHistory的缓存代理：
+按 (代码, 周期, 复权方式, 是否跳过停牌) 缓存取到过的最长窗口, 更短的count或部分字段直接切片返回;
+api.timeNow()变化后先取最近几根K线核对: 找到缓存的最后一根K线且收盘价不变时, 把之后的新K线追加到缓存末尾,
+找不到(新K线太多)或收盘价变化(复权因子变化)时重新下载; 核对取的K线数按上次两次调用之间新增的K线数调整.
+缓存的所有字段保存在一个两倍长度的结构化缓冲区中, 追加时不搬动数据, getBarsArray()直接返回其中一段的视图; 总字节数超过max_bytes时淘汰最久未使用的标的
+'''
+
+# 依次尝试作为K线标识的列
+ID_COLUMNS = ('time', 'timeStr', 'tradeDate')
+
+
+class HistoryEntry(object):
+    __slots__ = ('columns', 'buffer', 'start', 'end', 'complete', 'stamp', 'id_column', 'probe', 'nbytes')
+
+    def __init__(self, frame, count, stamp):
+        self.columns = [str(column) for column in frame.columns]
+        size = len(frame)
+        values = [frame[column].to_numpy() for column in frame.columns]
+        # 所有字段放在同一个结构化缓冲区中, 窗口是一段连续内存
+        dtype = [(name, column.dtype if column.dtype.kind in 'biufcmM' else object)
+                 for name, column in zip(self.columns, values)]
+        self.buffer = np.empty(2 * max(size, 1), dtype=dtype)
+        for name, column in zip(self.columns, values):
+            self.buffer[name][:size] = column
+        self.start = 0
+        self.end = size
+        # 取到的K线少于count说明已经是全部历史
+        self.complete = size < count
+        self.stamp = stamp
+        self.id_column = next((column for column in ID_COLUMNS if column in self.columns), None)
+        # 核对时取的K线数, 按上次两次调用之间新增的K线数调整
+        self.probe = 2
+        self.nbytes = self.buffer.nbytes
+
+    def __len__(self):
+        return self.end - self.start
+
+    def window(self, count):
+        return self.buffer[max(self.start, self.end - count):self.end]
+
+    def column(self, name, count):
+        return self.window(count)[name]
+
+    def last(self, name):
+        return self.buffer[name][self.end - 1]
+
+    def after(self, bar_id):
+        # bar_id之后的K线数, 窗口中没有该K线时返回None
+        found = np.flatnonzero(self.column(self.id_column, len(self)) == bar_id)
+        return len(self) - 1 - found[-1] if len(found) else None
+
+    def append(self, frame, first):
+        """
+        追加frame中first之后的行; 窗口长度不变, 已是全部历史的窗口会变长
+        """
+        rows = len(frame) - first
+        size = len(self)
+        if self.end + rows > len(self.buffer):
+            # 写满后把最近的数据搬回缓冲区开头, 仍然不够时扩大缓冲区
+            need = 2 * (size + rows if self.complete else size)
+            if len(self.buffer) < need:
+                grown = np.empty(need, dtype=self.buffer.dtype)
+                grown[:size] = self.buffer[self.start:self.end]
+                self.buffer = grown
+            else:
+                self.buffer[:size] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, size
+            self.nbytes = self.buffer.nbytes
+        for column in self.columns:
+            self.buffer[column][self.end:self.end + rows] = frame[column].to_numpy()[first:]
+        self.end += rows
+        if not self.complete:
+            self.start = self.end - size
+
+
+class BarHistory(object):
+    """
+    用法与api.getBarsHistory相同: api.history = BarHistory(api); api.history.getBarsHistory(...)
+    install()后直接替换api.getBarsHistory, etatools中的工具类也会使用缓存
+    max_bytes: 缓存占用的内存上限
+    """
+
+    def __init__(self, api, max_bytes=64 << 20):
+        self.api = api
+        self.fetch = api.getBarsHistory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.records = {}
+        self.hits = 0
+        self.probes = 0
+        self.fetches = 0
+
+    def install(self):
+        self.api.getBarsHistory = self.getBarsHistory
+        return self
+
+    def getBarsHistory(self, symbol, timeSpan, count=1, priceMode=None, skipSuspended=None, fields=None, df=False):
+        return self.result(self.lookup(symbol, timeSpan, count, priceMode, skipSuspended), count, fields, df)
+
+    def getBarsArray(self, symbol, timeSpan, count=1, priceMode=None, skipSuspended=None, fields=None):
+        """
+        返回缓存上的BarArray视图, 不拷贝; 同一标的的下一次调用可能改写缓存, 需要保存时调用copy()
+        """
+        values = self.lookup(symbol, timeSpan, count, priceMode, skipSuspended).window(count)
+        if fields:
+            values = values[[name for name in fields if name in values.dtype.names]]
+        return BarArray(values)
+
+    def lookup(self, symbol, timeSpan, count, priceMode, skipSuspended):
+        key = (symbol, timeSpan, priceMode, skipSuspended)
+        entry = self.entries.get(key)
+        stamp = self.api.timeNow()
+        # 重新下载时保持之前的最长窗口
+        longest = count
+        previous = None
+        if entry is not None and entry.stamp != stamp:
+            longest = max(count, len(entry))
+            previous = entry
+            entry = self.validate(key, entry, stamp)
+        if entry is None or (len(entry) < count and not entry.complete):
+            entry = self.load(key, longest, stamp)
+            if previous is not None and entry.id_column is not None and len(previous):
+                # 根据两次下载之间新增的K线数决定下次核对取多少根
+                gap = entry.after(previous.last(entry.id_column))
+                probe = max(previous.probe, int(gap) + 2 if gap is not None else 2 * previous.probe)
+                entry.probe = min(probe, max(len(entry), 2))
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def request(self, key, count):
+        symbol, time_span, price_mode, skip_suspended = key
+        options = {}
+        if price_mode is not None:
+            options['priceMode'] = price_mode
+        if skip_suspended is not None:
+            options['skipSuspended'] = skip_suspended
+        return self.fetch(symbol, time_span, count=count, fields=None, df=True, **options)
+
+    def load(self, key, count, stamp):
+        self.fetches += 1
+        self.drop(key)
+        entry = HistoryEntry(self.request(key, count), count, stamp)
+        self.entries[key] = entry
+        self.nbytes += entry.nbytes
+        self.evict()
+        return entry
+
+    def evict(self):
+        # 超过内存上限时淘汰最久未使用的标的, 至少保留最近使用的一个
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.drop(next(iter(self.entries)))
+
+    def validate(self, key, entry, stamp):
+        # 时间推进后取最近的probe根K线, 与缓存的最后一根K线对齐
+        self.probes += 1
+        if entry.id_column is None or not len(entry):
+            self.drop(key)
+            return None
+        tail = self.request(key, entry.probe)
+        ids = tail[entry.id_column].to_numpy() if len(tail) else ()
+        found = np.flatnonzero(ids == entry.last(entry.id_column)) if len(ids) else ()
+        if not len(found):
+            self.drop(key)
+            return None
+        position = found[-1]
+        rows = len(tail) - 1 - position
+        # 最后一根K线的收盘价变化说明复权因子变了
+        same = np.isclose(tail['close'].to_numpy()[position], entry.last('close'), rtol=1e-9, atol=0, equal_nan=True)
+        if not same or (rows >= len(entry) and not entry.complete):
+            self.drop(key)
+            return None
+        if rows:
+            nbytes = entry.nbytes
+            entry.append(tail, position + 1)
+            self.nbytes += entry.nbytes - nbytes
+            if entry.nbytes != nbytes:
+                # 缓冲区扩大后同样受内存上限约束, 当前标的先移到最近使用的位置
+                self.entries.move_to_end(key)
+                self.evict()
+        entry.stamp = stamp
+        return entry
+
+    def drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+    def invalidate(self, symbol=None):
+        for key in list(self.entries):
+            if symbol is None or key[0] == symbol:
+                self.drop(key)
+
+    def result(self, entry, count, fields, df):
+        names = [name for name in fields if name in entry.columns] if fields else entry.columns
+        if df:
+            # 返回副本, 调用方修改结果不影响缓存
+            return pd.DataFrame(OrderedDict((name, entry.column(name, count).copy()) for name in names),
+                                columns=names)
+        record = self.records.get(tuple(names))
+        if record is None:
+            record = self.records[tuple(names)] = namedtuple('Bar', names)
+        return [record(*values) for values in zip(*[entry.column(name, count).tolist() for name in names])]
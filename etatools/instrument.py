@@ -0,0 +1,234 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import io
+import json
+import time
+import tempfile
+from collections import OrderedDict
+
+'''
+策略回调与api调用的耗时统计:
+在策略文件末尾调用instrument.strategy(globals()), 设置环境变量ETATOOLS_INSTRUMENT=1后生效:
+回调函数被替换为计时的包装函数, onInitialize时把api的数据和交易方法也替换为计时版本, onTerminate时打印汇总表.
+每个名称记录调用次数、总耗时、自身耗时(扣除其中api调用的时间)和按2的幂次分桶的延迟直方图;
+ETATOOLS_INSTRUMENT_EXPORT指定JSON文件时, 每隔ETATOOLS_INSTRUMENT_INTERVAL秒(默认60)导出一次.
+未开启时strategy()直接返回, 回调和api都是原来的函数, 没有任何额外开销
+'''
+
+CALLBACKS = ('onInitialize', 'onBeforeMarketOpen', 'onBar', 'onHandleData', 'onTimer', 'onTerminate')
+
+API_METHODS = ('getBarsHistory', 'getBarsArray', 'getFieldsOneDay', 'getSymbolPosition', 'getSymbolPositions',
+               'getPositionSymbols', 'getAccount', 'getRefData', 'getConstituentSymbols', 'getContinuousSymbol',
+               'getSymbolPool', 'getPrevTradeDate', 'getCurrTradeDate', 'isSuspend', 'timeNow', 'targetPosition',
+               'setFocusSymbols')
+
+# 直方图第k个桶的上限为2^k微秒, 最后一个桶不设上限
+BUCKETS = 28
+
+
+class LatencyStats(object):
+    __slots__ = ('count', 'total', 'own', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.own = 0.
+        self.max = 0.
+        self.buckets = [0] * BUCKETS
+
+    def add(self, elapsed, own):
+        self.count += 1
+        self.total += elapsed
+        self.own += own
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[min(int(elapsed * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        # 返回所在桶的上限(秒), 误差不超过2倍
+        target = self.count * q / 100.
+        seen = 0
+        for k, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min((1 << k) * 1e-6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return OrderedDict([('count', self.count), ('total_ms', self.total * 1e3), ('self_ms', self.own * 1e3),
+                            ('p50_us', self.percentile(50) * 1e6), ('p99_us', self.percentile(99) * 1e6),
+                            ('max_us', self.max * 1e6), ('buckets', list(self.buckets))])
+
+
+class Recorder(object):
+    """
+    export_path: 定期导出的JSON文件, interval: 导出间隔秒数
+    """
+
+    def __init__(self, export_path=None, interval=60.):
+        self.stats = OrderedDict()
+        # 调用栈上每一层已经统计到的子调用耗时
+        self.children = [0.]
+        self.export_path = export_path
+        self.interval = interval
+        self.exported = time.perf_counter()
+
+    def stats_for(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = LatencyStats()
+        return stats
+
+    def wrap(self, func, name):
+        stats = self.stats_for(name)
+        children = self.children
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            children.append(0.)
+            started = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - started
+                stats.add(elapsed, elapsed - children.pop())
+                children[-1] += elapsed
+        wrapper.__name__ = str(getattr(func, '__name__', name))
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def attach(self, api, methods=API_METHODS):
+        # 用实例属性覆盖api的方法, 之后通过api调用的地方(包括etatools中的工具类)都会被统计
+        for name in methods:
+            method = getattr(api, name, None)
+            if method is None or getattr(method, '__wrapped__', None) is not None:
+                continue
+            try:
+                setattr(api, name, self.wrap(method, 'api.' + name))
+            except (AttributeError, TypeError):
+                pass
+
+    def callback(self, func, name):
+        timed = self.wrap(func, name)
+        if name == 'onInitialize':
+            def wrapper(api, *args):
+                self.attach(api)
+                return timed(api, *args)
+        elif name == 'onTerminate':
+            def wrapper(api, *args):
+                try:
+                    return timed(api, *args)
+                finally:
+                    print(self.summary())
+                    if self.export_path:
+                        self.export(self.export_path)
+        else:
+            def wrapper(api, *args):
+                try:
+                    return timed(api, *args)
+                finally:
+                    if self.export_path and time.perf_counter() - self.exported >= self.interval:
+                        self.export(self.export_path)
+        wrapper.__name__ = str(name)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def section(self, name):
+        """
+        统计一段代码, 如指标计算: with recorder.section('talib.EMA'): ...
+        """
+        return Section(self, name)
+
+    def summary(self):
+        lines = ['%-32s %9s %11s %11s %10s %10s %10s' % ('name', 'count', 'total(ms)', 'self(ms)', 'p50(us)',
+                                                        'p99(us)', 'max(us)')]
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total):
+            if not stats.count:
+                continue
+            values = stats.to_dict()
+            lines.append('%-32s %9d %11.2f %11.2f %10.0f %10.0f %10.0f' % (
+                name, stats.count, values['total_ms'], values['self_ms'], values['p50_us'], values['p99_us'],
+                values['max_us']))
+        return '\n'.join(lines)
+
+    def export(self, path):
+        # 先写临时文件再改名, 读取方不会看到写了一半的文件
+        report = OrderedDict([('time', time.time()),
+                              ('stats', OrderedDict((name, stats.to_dict()) for name, stats in self.stats.items()))])
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with io.open(fd, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(report, indent=2))
+        getattr(os, 'replace', os.rename)(tmp, path)
+        self.exported = time.perf_counter()
+
+
+class Section(object):
+    __slots__ = ('stats', 'children', 'started')
+
+    def __init__(self, recorder, name):
+        self.stats = recorder.stats_for(name)
+        self.children = recorder.children
+        self.started = 0.
+
+    def __enter__(self):
+        self.children.append(0.)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.stats.add(elapsed, elapsed - self.children.pop())
+        self.children[-1] += elapsed
+        return False
+
+
+class NullSection(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+RECORDER = None
+
+
+def enable(export_path=None, interval=60.):
+    global RECORDER
+    RECORDER = Recorder(export_path, interval)
+    return RECORDER
+
+
+def enabled():
+    return RECORDER is not None
+
+
+def strategy(namespace, callbacks=CALLBACKS):
+    """
+    在策略文件末尾调用: instrument.strategy(globals()); 未开启时不做任何事
+    """
+    if RECORDER is None:
+        return
+    if 'onTerminate' in callbacks and 'onTerminate' not in namespace:
+        # 没有onTerminate的策略也要在结束时输出汇总表
+        namespace['onTerminate'] = lambda api, exitInfo: None
+    for name in callbacks:
+        func = namespace.get(name)
+        if callable(func) and getattr(func, '__wrapped__', None) is None:
+            namespace[name] = RECORDER.callback(func, name)
+
+
+NULL_SECTION = NullSection()
+
+
+def section(name):
+    return NULL_SECTION if RECORDER is None else RECORDER.section(name)
+
+
+if os.environ.get('ETATOOLS_INSTRUMENT', '') not in ('', '0'):
+    enable(os.environ.get('ETATOOLS_INSTRUMENT_EXPORT') or None,
+           float(os.environ.get('ETATOOLS_INSTRUMENT_INTERVAL', 60)))
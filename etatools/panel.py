@@ -0,0 +1,163 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+
+'''
+股票池K线面板：
+按 股票 x 时间 保存最近lookback根K线的open/high/low/close/volume/isSuspended,
+首次全量下载, 之后每个交易日只追加一根K线; 股票池成分变化时复用空出来的行.
+每个字段用两倍长度的缓冲区保存, 追加时写入末尾, 写满后把最近lookback-1列搬回开头,
+因此最近lookback根K线始终是一段连续内存, 各字段属性直接返回二维视图, 不做拷贝
+'''
+
+
+class BarPanel(object):
+    """
+    time_span, price_mode: 与getBarsHistory的timeSpan, priceMode相同
+    fields: 需要保存的K线字段, 默认为FIELDS, 必须包含close; 不在FIELDS中的字段用view(field)读取
+    close等字段为 (容量 x lookback) 的视图, 行号由rows()给出, 空行和缺失数据为nan
+    filled[row]在该行重新下载完整窗口时加1, 增量计算的指标据此判断是否需要重算
+    """
+
+    FIELDS = ('open', 'high', 'low', 'close', 'volume', 'isSuspended')
+
+    def __init__(self, api, lookback, time_span, price_mode, capacity=64, fields=None):
+        self.api = api
+        self.fields = tuple(fields) if fields else self.FIELDS
+        self.lookback = lookback
+        self.time_span = time_span
+        self.price_mode = price_mode
+        self.data = dict((field, np.full((capacity, 2 * lookback), np.nan)) for field in self.fields)
+        self.dates = np.zeros(2 * lookback, dtype=np.int64)
+        self.end = lookback
+        self.last_date = None
+        self.slot = {}
+        self.symbols = [None] * capacity
+        self.filled = np.zeros(capacity, dtype=np.int64)
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def view(self, field):
+        return self.data[field][:, self.end - self.lookback:self.end]
+
+    open = property(lambda self: self.view('open'))
+    high = property(lambda self: self.view('high'))
+    low = property(lambda self: self.view('low'))
+    close = property(lambda self: self.view('close'))
+    volume = property(lambda self: self.view('volume'))
+    isSuspended = property(lambda self: self.view('isSuspended'))
+
+    @property
+    def trade_dates(self):
+        return self.dates[self.end - self.lookback:self.end]
+
+    def rows(self, symbols):
+        # 股票对应的行号, 不在面板中的股票为-1
+        return np.array([self.slot.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+
+    def valid_counts(self, rows):
+        # 窗口内有收盘价的K线数量
+        return np.count_nonzero(~np.isnan(self.close[rows]), axis=1)
+
+    def first_valid(self, rows):
+        # 窗口内第一根有收盘价的K线的列号, 中间停牌的空缺不影响; 没有K线的行为0
+        return np.argmax(~np.isnan(self.close[rows]), axis=1)
+
+    def update(self, trade_date, symbols):
+        """
+        盘前调用: 同步股票池成分, 并把面板滚动到trade_date的前一交易日
+        """
+        last_date = self.api.getPrevTradeDate(trade_date)
+        symbols = list(symbols)
+        keep = set(symbols)
+        for symbol in list(self.slot):
+            if symbol not in keep:
+                self.release(symbol)
+
+        if last_date != self.last_date:
+            if self.last_date is not None and self.api.getPrevTradeDate(last_date) == self.last_date:
+                self.roll(last_date)
+            else:
+                # 首次运行或中间缺了交易日, 重建日历并全量下载
+                self.reset_calendar(last_date)
+                for symbol, row in self.slot.items():
+                    self.fill(row, symbol)
+
+        for symbol in symbols:
+            if symbol not in self.slot:
+                self.fill(self.assign(symbol), symbol)
+
+    def reset_calendar(self, last_date):
+        dates = [last_date]
+        for i in range(self.lookback - 1):
+            dates.append(self.api.getPrevTradeDate(dates[-1]))
+        self.end = self.lookback
+        self.dates[:self.lookback] = dates[::-1]
+        self.last_date = last_date
+
+    def roll(self, last_date):
+        # 所有行追加一根K线
+        if self.end == 2 * self.lookback:
+            keep = self.lookback - 1
+            for values in self.data.values():
+                values[:, :keep] = values[:, self.end - keep:self.end]
+            self.dates[:keep] = self.dates[self.end - keep:self.end]
+            self.end = keep
+        column = self.end
+        for values in self.data.values():
+            values[:, column] = np.nan
+        self.dates[column] = last_date
+        self.end += 1
+        self.last_date = last_date
+        close = self.data['close']
+        for symbol, row in self.slot.items():
+            bars = self.api.getBarsHistory(symbol, self.time_span, count=2, priceMode=self.price_mode,
+                                           skipSuspended=0, df=False)
+            if not bars or bars[-1].tradeDate != last_date:
+                continue
+            # 复权因子变化时历史价格整体改变, 重新下载该股票
+            if len(bars) > 1 and not np.isnan(close[row, column - 1]) and \
+                    not np.isclose(bars[-2].close, close[row, column - 1], rtol=1e-9, atol=0):
+                self.fill(row, symbol)
+                continue
+            for field in self.fields:
+                self.data[field][row, column] = getattr(bars[-1], field)
+
+    def fill(self, row, symbol):
+        # 按交易日对齐下载完整窗口
+        self.filled[row] += 1
+        for values in self.data.values():
+            values[row, :] = np.nan
+        bars = self.api.getBarsHistory(symbol, self.time_span, count=self.lookback, priceMode=self.price_mode,
+                                       skipSuspended=0, df=True)
+        if len(bars) == 0:
+            return
+        dates = self.trade_dates
+        position = np.searchsorted(dates, bars['tradeDate'].values)
+        matched = position < len(dates)
+        matched[matched] = dates[position[matched]] == bars['tradeDate'].values[matched]
+        columns = self.end - self.lookback + position[matched]
+        for field in self.fields:
+            self.data[field][row, columns] = bars[field].values[matched]
+
+    def assign(self, symbol):
+        if not self.free:
+            self.grow()
+        row = self.free.pop()
+        self.slot[symbol] = row
+        self.symbols[row] = symbol
+        return row
+
+    def release(self, symbol):
+        row = self.slot.pop(symbol)
+        self.symbols[row] = None
+        for values in self.data.values():
+            values[row, :] = np.nan
+        self.free.append(row)
+
+    def grow(self):
+        capacity = len(self.symbols)
+        for field in self.fields:
+            self.data[field] = np.vstack([self.data[field], np.full_like(self.data[field], np.nan)])
+        self.symbols.extend([None] * capacity)
+        self.filled = np.concatenate([self.filled, np.zeros(capacity, dtype=np.int64)])
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
@@ -0,0 +1,93 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+'''
+股票池信号的并行计算：
+把 (股票 x 时间) 的行情矩阵写入共享内存, 按行切分交给进程池, 子进程直接映射共享内存读取数据而不是接收序列化的DataFrame,
+各分片的结果按行号顺序拼接, 与在当前进程内计算的结果完全一致;
+股票数较少、只有一个进程或当前Python不支持共享内存时在当前进程内计算
+'''
+
+
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def run_shard(func, specs, start, stop, args):
+    # 子进程: 映射共享内存中的[start, stop)行并调用func
+    blocks = [attach(shm_name) for shm_name, shape, dtype in specs.values()]
+    try:
+        arrays = dict((name, np.ndarray(shape, dtype=dtype, buffer=block.buf)[start:stop])
+                      for (name, (shm_name, shape, dtype)), block in zip(specs.items(), blocks))
+        result = np.array(func(arrays, *args), copy=True)
+        del arrays
+        return result
+    finally:
+        for block in blocks:
+            block.close()
+
+
+class ParallelEvaluator(object):
+    """
+    map(func, arrays, args)对arrays中所有矩阵的同一组行调用func(arrays, *args),
+    func必须是模块级函数, 返回第一维与行数相同的数组
+    workers: 进程数, None或1时在当前进程内计算; 行数不足min_rows_per_worker的两倍时也在当前进程内计算
+    """
+
+    def __init__(self, workers=None, min_rows_per_worker=200):
+        self.workers = workers
+        self.min_rows_per_worker = min_rows_per_worker
+        self.executor = None
+        self.blocks = {}
+
+    def shards(self, rows):
+        if shared_memory is None or not self.workers or self.workers <= 1:
+            return 1
+        return max(1, min(self.workers, rows // self.min_rows_per_worker))
+
+    def map(self, func, arrays, args=()):
+        rows = len(next(iter(arrays.values())))
+        shards = self.shards(rows)
+        if shards <= 1:
+            return np.asarray(func(arrays, *args))
+
+        specs = {}
+        for name, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            block = self.block(name, values.nbytes)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[...] = values
+            specs[name] = (block.name, values.shape, values.dtype.str)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        bounds = np.linspace(0, rows, shards + 1).astype(int)
+        futures = [self.executor.submit(run_shard, func, specs, start, stop, args)
+                   for start, stop in zip(bounds[:-1], bounds[1:])]
+        return np.concatenate([future.result() for future in futures])
+
+    def block(self, name, nbytes):
+        # 每个字段复用一块共享内存, 不够大时重新分配
+        block = self.blocks.get(name)
+        if block is None or block.size < nbytes:
+            if block is not None:
+                block.close()
+                block.unlink()
+            block = self.blocks[name] = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        return block
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
@@ -0,0 +1,11 @@
+# coding=utf-8
+"""
+etatools.replay: 不连接云端引擎, 用本地K线文件回放策略
+"""
+from __future__ import absolute_import
+
+from etatools.replay.api import Bar, ReplayApi
+from etatools.replay.broker import Broker
+from etatools.replay.data import LocalData
+from etatools.replay.engine import ReplayEngine, ReplayResult
+from etatools.replay.sdk import install
@@ -0,0 +1,35 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import sys
+import runpy
+import argparse
+from etatools.replay.sdk import install
+
+'''
+命令行回放示例策略:
+    python -m etatools.replay example/股票择时策略python --data /path/to/data --start 20180101 --end 20181231
+在策略目录下运行其main.py, main.py中的StrategyProxy由本地回放实现
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m etatools.replay')
+    parser.add_argument('strategy_dir', help='包含main.py和config.json的策略目录')
+    parser.add_argument('--data', help='本地数据目录, 缺省使用config.json中replay.data')
+    parser.add_argument('--start', type=int, help='回测开始日期YYYYMMDD')
+    parser.add_argument('--end', type=int, help='回测结束日期YYYYMMDD')
+    parser.add_argument('--cash', type=float, help='初始资金')
+    parser.add_argument('--span', help='撮合周期, 如DAY_1, MIN_1')
+    args = parser.parse_args(argv)
+
+    strategy_dir = os.path.abspath(args.strategy_dir)
+    data = os.path.abspath(args.data) if args.data else None
+    install(data=data, start=args.start, end=args.end, cash=args.cash, span=args.span)
+    os.chdir(strategy_dir)
+    sys.path.insert(0, strategy_dir)
+    runpy.run_path(os.path.join(strategy_dir, 'main.py'), run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import datetime
+import numpy as np
+import pandas as pd
+from etatools.bars import BarArray
+from etatools.replay.broker import LONG
+from etatools.replay.data import date_millis
+
+'''
+策略回调中使用的api对象:
+行情只能看到当前时刻之前的K线, 盘前只能看到上一交易日及以前的K线;
+前复权以当前可见的最后一根K线为基准, 与实盘中复权因子随时间变化的效果相同
+'''
+
+BAR_FIELDS = ('tradeDate', 'open', 'high', 'low', 'close', 'volume', 'totalVolume', 'isSuspended')
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+# 盘前回调的时间
+PREMARKET = (9, 0)
+
+
+class Bar(object):
+    __slots__ = ('symbol', 'time', 'tradeDate', 'open', 'high', 'low', 'close', 'volume', 'totalVolume',
+                 'isSuspended')
+
+    def __init__(self, symbol, time, tradeDate, open, high, low, close, volume, totalVolume, isSuspended):
+        self.symbol = symbol
+        self.time = time
+        self.tradeDate = tradeDate
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.totalVolume = totalVolume
+        self.isSuspended = isSuspended
+
+    @property
+    def timeStr(self):
+        return datetime.datetime.fromtimestamp(self.time / 1000).strftime('%Y-%m-%d %H:%M:%S')
+
+    def __repr__(self):
+        return 'Bar(%s, %s, close=%s)' % (self.symbol, self.timeStr, self.close)
+
+
+class ReplayApi(object):
+    """
+    由ReplayEngine创建并推进时间; 回放状态使用curr_date, trade_calendar等策略不会用到的属性名,
+    策略在api上保存的trade_date, calendar等自定义属性不受影响
+    """
+
+    def __init__(self, data, broker):
+        self.data = data
+        self.broker = broker
+        self.pool_instsets = []
+        self.pool_symbols = []
+        self.pool = []
+        self.focus = None
+        self.group_timeout = None
+        self.only_group = True
+        self.require_bars = []
+        self.require_fields = []
+        self.timer_cycle = None
+        self.trade_calendar = np.zeros(0, dtype=np.int64)
+        self.curr_date = 0
+        self.now = 0
+        self.premarket = True
+
+    # ---- 引擎推进时间 ----
+
+    def begin_day(self, trade_date):
+        self.curr_date = int(trade_date)
+        self.now = int(date_millis([trade_date], *PREMARKET)[0])
+        self.premarket = True
+        self.focus = None
+        self.pool = self.expand(self.pool_instsets, self.pool_symbols)
+
+    def expand(self, instsets, symbols):
+        expanded = []
+        for instset in instsets:
+            expanded.extend(self.data.constituents(instset, self.curr_date))
+        expanded.extend(symbols)
+        # 去重并保持顺序
+        return list(dict.fromkeys(expanded))
+
+    def focus_symbols(self):
+        # 没有调用setFocusSymbols时关注整个股票池, 有持仓的标的总是关注
+        symbols = list(self.pool if self.focus is None else self.focus)
+        symbols.extend(position.symbol for position in self.broker.held())
+        return list(dict.fromkeys(symbols))
+
+    # ---- 初始化设置 ----
+
+    def setSymbolPool(self, instsets=None, symbols=None):
+        self.pool_instsets = [instsets] if isinstance(instsets, str) else list(instsets or [])
+        self.pool_symbols = [symbols] if isinstance(symbols, str) else list(symbols or [])
+
+    def setRequireData(self, instsets=None, symbols=None, fields=None, bars=None):
+        self.setSymbolPool(instsets, symbols)
+        self.require_fields = list(fields or [])
+        self.require_bars = list(bars or [])
+
+    def setRequireBars(self, timeSpan, count):
+        self.require_bars.append((timeSpan, count))
+
+    def setRequireFields(self, fields=None):
+        self.require_fields = list(fields or [])
+
+    def setGroupMode(self, timeOutMs, onlyGroup=True):
+        self.group_timeout = timeOutMs
+        self.only_group = onlyGroup
+
+    def setTimerCycle(self, cycle):
+        # 回测中不触发定时器
+        self.timer_cycle = cycle
+
+    def setFocusSymbols(self, symbols):
+        self.focus = [symbols] if isinstance(symbols, str) else list(symbols)
+
+    # ---- 查询 ----
+
+    def getSymbolPool(self):
+        return list(self.pool)
+
+    def getConstituentSymbols(self, instset, date=None):
+        return self.data.constituents(instset, self.curr_date if date is None else date)
+
+    def getContinuousSymbol(self, symbol, date=None):
+        return self.data.continuous_symbol(symbol, self.curr_date if date is None else date)
+
+    def getRefData(self, symbol):
+        return self.data.ref(symbol)
+
+    def getCurrTradeDate(self):
+        return self.curr_date
+
+    def getPrevTradeDate(self, date=None):
+        date = self.curr_date if date is None else int(date)
+        position = np.searchsorted(self.trade_calendar, date, side='left')
+        if position > 0:
+            return int(self.trade_calendar[position - 1])
+        # 早于本地日历的日期按工作日推算
+        day = datetime.date(date // 10000, date // 100 % 100, date % 100) - datetime.timedelta(days=1)
+        while day.isoweekday() > 5:
+            day -= datetime.timedelta(days=1)
+        return day.year * 10000 + day.month * 100 + day.day
+
+    def timeNow(self):
+        return self.now
+
+    def isSuspend(self, symbol, date=None):
+        date = self.curr_date if date is None else int(date)
+        bars = self.data.bars('DAY_1', symbol)
+        position = np.searchsorted(bars['tradeDate'], date, side='left')
+        if position == len(bars) or bars['tradeDate'][position] != date:
+            return True
+        return bool(bars['isSuspended'][position])
+
+    def getFieldsOneDay(self, symbols, fields, date=None, df=True):
+        date = self.curr_date if date is None else date
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        fields = [fields] if isinstance(fields, str) else list(fields)
+        day = self.data.fields_one_day(date)
+        if day is None:
+            frame = pd.DataFrame(np.nan, index=symbols, columns=fields)
+        else:
+            frame = day.reindex(index=symbols, columns=fields)
+        frame.index.name = 'symbol'
+        frame = frame.reset_index()
+        frame.insert(0, 'tradeDate', int(date))
+        return frame if df else frame.to_dict('records')
+
+    def window(self, symbol, timeSpan, count, skipSuspended):
+        """
+        返回 (全部K线, 当前可见的最近count根K线, 可见K线的结束位置); 没有跳过停牌K线时是全部K线上的视图
+        """
+        bars = self.data.bars(timeSpan, symbol)
+        if self.premarket:
+            stop = np.searchsorted(bars['tradeDate'], self.curr_date, side='left')
+        else:
+            stop = np.searchsorted(bars['time'], self.now, side='right')
+        if skipSuspended:
+            index = self.data.tradable_index(timeSpan, symbol)
+            end = np.searchsorted(index, stop, side='left')
+            rows = index[max(0, end - count):end]
+            if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+                chunk = bars[rows[0]:rows[-1] + 1]
+            else:
+                chunk = bars[rows]
+        else:
+            chunk = bars[max(0, stop - count):stop]
+        return bars, chunk, stop
+
+    def getBarsHistory(self, symbol, timeSpan='DAY_1', count=1, priceMode='REAL', skipSuspended=1, fields=None,
+                       df=False):
+        bars, chunk, stop = self.window(symbol, timeSpan, count, skipSuspended)
+        columns = dict((field, chunk[field]) for field in BAR_FIELDS)
+        if priceMode == 'FORMER' and len(chunk):
+            scale = chunk['adjFactor'] / bars['adjFactor'][stop - 1]
+            for field in PRICE_FIELDS:
+                columns[field] = columns[field] * scale
+
+        if not df:
+            return [Bar(symbol, *values) for values in zip(chunk['time'].tolist(),
+                                                           *[columns[field].tolist() for field in BAR_FIELDS])]
+        names = list(fields) if fields else list(BAR_FIELDS)
+        frame = pd.DataFrame(dict((name, columns[name]) for name in names if name in columns), columns=names)
+        if not fields or 'symbol' in names:
+            frame['symbol'] = symbol
+        if not fields or 'time' in names:
+            frame['time'] = chunk['time']
+        return frame
+
+    def getBarsArray(self, symbol, timeSpan='DAY_1', count=1, priceMode='REAL', skipSuspended=1, fields=None):
+        """
+        与getBarsHistory相同的K线, 以BarArray返回本地数据上的视图(字段见BAR_DTYPE, 没有symbol);
+        只有前复权且窗口内复权因子变化、或跳过的停牌K线在窗口中间时才拷贝
+        """
+        bars, chunk, stop = self.window(symbol, timeSpan, count, skipSuspended)
+        if priceMode == 'FORMER' and len(chunk):
+            scale = chunk['adjFactor'] / bars['adjFactor'][stop - 1]
+            if not (scale == 1).all():
+                chunk = chunk.copy()
+                for field in PRICE_FIELDS:
+                    chunk[field] *= scale
+        if fields:
+            names = [name for name in fields if name in chunk.dtype.names]
+            chunk = chunk[names]
+        return BarArray(chunk)
+
+    # ---- 持仓与交易 ----
+
+    def getSymbolPosition(self, symbol, positionSide=LONG):
+        return self.broker.position(symbol, positionSide)
+
+    def getSymbolPositions(self):
+        return self.broker.held()
+
+    def getPositionSymbols(self):
+        return list(dict.fromkeys(position.symbol for position in self.broker.held()))
+
+    def getAccount(self, symbol=None, market=None):
+        return self.broker.account()
+
+    def targetPosition(self, symbol, qty, positionSide=LONG, remark=''):
+        self.broker.target(symbol, qty, positionSide, remark)
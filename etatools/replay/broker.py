@@ -0,0 +1,152 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+
+'''
+本地撮合与持仓:
+targetPosition只记录目标仓位, 在该标的的下一根K线以开盘价成交(加滑点), 同一标的同一方向以最后一次目标为准;
+股票多头T+1, 当日买入的数量次日才可卖出; 期货按合约乘数逐笔结算平仓盈亏, 持仓按最新价计算浮动盈亏
+'''
+
+LONG = 'LONG'
+SHORT = 'SHORT'
+
+
+class Position(object):
+    __slots__ = ('symbol', 'positionSide', 'posQty', 'posPrice', 'posHigh', 'posLow', 'availableQty')
+
+    def __init__(self, symbol, positionSide):
+        self.symbol = symbol
+        self.positionSide = positionSide
+        self.posQty = 0
+        self.posPrice = 0.
+        self.posHigh = 0.
+        self.posLow = 0.
+        self.availableQty = 0
+
+    def __repr__(self):
+        return 'Position(%s, %s, qty=%s, price=%.4f)' % (self.symbol, self.positionSide, self.posQty, self.posPrice)
+
+
+class Account(object):
+    __slots__ = ('totAssets', 'cashAvailable', 'marketValue', 'cash')
+
+    def __init__(self, totAssets, cashAvailable, marketValue, cash):
+        self.totAssets = totAssets
+        self.cashAvailable = cashAvailable
+        self.marketValue = marketValue
+        self.cash = cash
+
+
+class Fill(object):
+    __slots__ = ('time', 'symbol', 'positionSide', 'qty', 'price', 'fee', 'remark')
+
+    def __init__(self, time, symbol, positionSide, qty, price, fee, remark):
+        self.time = time
+        self.symbol = symbol
+        self.positionSide = positionSide
+        self.qty = qty
+        self.price = price
+        self.fee = fee
+        self.remark = remark
+
+
+class Broker(object):
+    """
+    cash: 初始资金, fee_rate: 按成交金额收取的费率, slippage: 滑点的最小变动价位数
+    """
+
+    def __init__(self, data, cash=1000000., fee_rate=0.0003, slippage=0):
+        self.data = data
+        self.cash = float(cash)
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.positions = {}
+        self.pending = {}
+        self.last_price = {}
+        self.fills = []
+
+    def position(self, symbol, side=LONG):
+        position = self.positions.get((symbol, side))
+        return position if position is not None else Position(symbol, side)
+
+    def held(self):
+        return [position for position in self.positions.values() if position.posQty != 0]
+
+    def target(self, symbol, qty, side=LONG, remark=''):
+        self.pending.setdefault(symbol, {})[side] = (int(qty), remark)
+
+    def settle_day(self):
+        # 新交易日开始, 股票昨日买入的部分可以卖出
+        for position in self.positions.values():
+            position.availableQty = position.posQty
+
+    def on_bar(self, symbol, time, open_, high, low, close):
+        orders = self.pending.pop(symbol, None)
+        if orders:
+            for side, (qty, remark) in orders.items():
+                self.fill(symbol, side, qty, open_, time, remark)
+        self.last_price[symbol] = close
+        for side in (LONG, SHORT):
+            position = self.positions.get((symbol, side))
+            if position is not None and position.posQty:
+                position.posHigh = max(position.posHigh, high)
+                position.posLow = min(position.posLow, low)
+
+    def fill(self, symbol, side, target, price, time, remark):
+        ref = self.data.ref(symbol)
+        if side == SHORT and not ref.is_future:
+            return
+        key = (symbol, side)
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = Position(symbol, side)
+        delta = target - position.posQty
+        if delta < 0 and not ref.is_future:
+            delta = max(delta, -position.availableQty)
+        if delta == 0:
+            return
+        direction = 1 if side == LONG else -1
+        # 买入(开多或平空)价格向上滑, 卖出向下滑
+        buy = (delta > 0) == (side == LONG)
+        price += (1 if buy else -1) * self.slippage * ref.priceTick
+        value = abs(delta) * price * ref.valuePerUnit
+        fee = value * self.fee_rate
+        if delta > 0:
+            if position.posQty == 0:
+                position.posHigh = position.posLow = price
+            position.posPrice = (position.posPrice * position.posQty + price * delta) / (position.posQty + delta)
+            if not ref.is_future:
+                self.cash -= value
+        elif ref.is_future:
+            self.cash += direction * (price - position.posPrice) * -delta * ref.valuePerUnit
+        else:
+            self.cash += value
+        self.cash -= fee
+        position.posQty += delta
+        # 期货T+0; 股票当日买入的部分不可卖出
+        if ref.is_future:
+            position.availableQty = position.posQty
+        elif delta < 0:
+            position.availableQty += delta
+        if position.posQty == 0:
+            position.posPrice = position.posHigh = position.posLow = 0.
+        self.fills.append(Fill(time, symbol, side, delta, price, fee, remark))
+
+    def account(self):
+        stock_value = 0.
+        future_pnl = 0.
+        margin = 0.
+        notional = 0.
+        for position in self.held():
+            ref = self.data.ref(position.symbol)
+            price = self.last_price.get(position.symbol, position.posPrice)
+            value = position.posQty * price * ref.valuePerUnit
+            notional += value
+            if ref.is_future:
+                direction = 1 if position.positionSide == LONG else -1
+                future_pnl += direction * (price - position.posPrice) * position.posQty * ref.valuePerUnit
+                margin += value * ref.marginRatio
+            else:
+                stock_value += value
+        total = self.cash + stock_value + future_pnl
+        return Account(total, self.cash + future_pnl - margin, notional, self.cash)
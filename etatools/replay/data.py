@@ -0,0 +1,187 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import io
+import json
+import time
+import numpy as np
+import pandas as pd
+
+'''
+本地数据目录:
+    bars/<周期>/<代码>.csv    K线, 周期为ETimeSpan的取值(DAY_1, MIN_1等);
+                              列为 time(可选, 'YYYY-MM-DD HH:MM:SS'), tradeDate, open, high, low, close,
+                              volume, totalVolume(可选), isSuspended(可选), adjFactor(可选, 复权因子)
+    bars/<周期>/<代码>.npy    与csv相同内容的BAR_DTYPE结构化数组, 存在时优先读取
+    calendar.csv              交易日列表, 列为tradeDate; 缺省时用各标的日K线的交易日合并得到
+    refdata.csv               合约信息, 列为symbol, market(stock/future), valuePerUnit, priceTick, marginRatio
+    instsets.json             {板块或品种代码: [成分代码]} 或 {板块或品种代码: {生效日期: [成分代码]}}
+    continuous.csv            连续合约映射, 列为tradeDate, symbol, target
+    fields.csv                因子数据, 列为tradeDate, symbol和各因子
+所有时间都换算成本地时间的毫秒时间戳, 与datetime.datetime.fromtimestamp(ms / 1000)互逆
+'''
+
+BAR_DTYPE = np.dtype([('time', np.int64), ('tradeDate', np.int64), ('open', np.float64), ('high', np.float64),
+                      ('low', np.float64), ('close', np.float64), ('volume', np.float64),
+                      ('totalVolume', np.float64), ('isSuspended', np.int64), ('adjFactor', np.float64)])
+
+# 日K线没有时间列时使用的收盘时间
+DAY_CLOSE = (15, 0)
+
+
+def local_millis(stamps):
+    """
+    不带时区的pandas时间 -> 本地时间的毫秒时间戳
+    """
+    values = np.asarray(pd.DatetimeIndex(stamps).values.astype('datetime64[ms]').astype(np.int64))
+    return values + time.timezone * 1000
+
+
+def date_millis(dates, hour=0, minute=0):
+    """
+    YYYYMMDD整数 -> 当天hour:minute的本地毫秒时间戳
+    """
+    dates = np.asarray(dates, dtype=np.int64)
+    stamps = pd.to_datetime(dates.astype(str), format='%Y%m%d') + pd.Timedelta(hours=hour, minutes=minute)
+    return local_millis(stamps)
+
+
+class RefData(object):
+    __slots__ = ('symbol', 'market', 'valuePerUnit', 'priceTick', 'marginRatio')
+
+    def __init__(self, symbol, market, valuePerUnit=1.0, priceTick=0.01, marginRatio=1.0):
+        self.symbol = symbol
+        self.market = market
+        self.valuePerUnit = valuePerUnit
+        self.priceTick = priceTick
+        self.marginRatio = marginRatio
+
+    @property
+    def is_future(self):
+        return self.market == 'future'
+
+
+class LocalData(object):
+    """
+    按需读取并缓存本地数据, bars返回按时间排序的BAR_DTYPE结构化数组, 没有数据时返回空数组
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.bar_cache = {}
+        self.tradable = {}
+        self.refdata = None
+        self.instsets = None
+        self.continuous = None
+        self.fields = None
+        self.field_days = {}
+        self.calendar = None
+
+    def file(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def bars(self, span, symbol):
+        key = (span, symbol)
+        bars = self.bar_cache.get(key)
+        if bars is None:
+            base = self.file('bars', span, symbol)
+            if os.path.exists(base + '.npy'):
+                bars = np.load(base + '.npy')
+            elif os.path.exists(base + '.csv'):
+                bars = self.read_bars(base + '.csv')
+            else:
+                bars = np.zeros(0, dtype=BAR_DTYPE)
+            self.bar_cache[key] = bars
+        return bars
+
+    def tradable_index(self, span, symbol):
+        # 未停牌K线的下标, 用于skipSuspended
+        key = (span, symbol)
+        index = self.tradable.get(key)
+        if index is None:
+            index = self.tradable[key] = np.flatnonzero(self.bars(span, symbol)['isSuspended'] == 0)
+        return index
+
+    @staticmethod
+    def read_bars(path):
+        frame = pd.read_csv(path)
+        bars = np.zeros(len(frame), dtype=BAR_DTYPE)
+        if 'time' in frame:
+            stamps = pd.to_datetime(frame['time'].astype(str))
+            bars['time'] = local_millis(stamps)
+            if 'tradeDate' in frame:
+                bars['tradeDate'] = frame['tradeDate'].values
+            else:
+                bars['tradeDate'] = (stamps.dt.year * 10000 + stamps.dt.month * 100 + stamps.dt.day).values
+        else:
+            bars['tradeDate'] = frame['tradeDate'].values
+            bars['time'] = date_millis(bars['tradeDate'], *DAY_CLOSE)
+        for field in ('open', 'high', 'low', 'close', 'volume'):
+            bars[field] = frame[field].values
+        bars['totalVolume'] = frame['totalVolume'].values if 'totalVolume' in frame else bars['volume']
+        bars['isSuspended'] = frame['isSuspended'].values if 'isSuspended' in frame else 0
+        bars['adjFactor'] = frame['adjFactor'].values if 'adjFactor' in frame else 1.0
+        return bars[np.argsort(bars['time'], kind='mergesort')]
+
+    def ref(self, symbol):
+        if self.refdata is None:
+            self.refdata = {}
+            if os.path.exists(self.file('refdata.csv')):
+                for row in pd.read_csv(self.file('refdata.csv')).to_dict('records'):
+                    self.refdata[row['symbol']] = RefData(row['symbol'], row.get('market', 'stock'),
+                                                          float(row.get('valuePerUnit', 1.0)),
+                                                          float(row.get('priceTick', 0.01)),
+                                                          float(row.get('marginRatio', 1.0)))
+        ref = self.refdata.get(symbol)
+        if ref is None:
+            # 没有配置的合约按代码后缀判断市场
+            ref = self.refdata[symbol] = RefData(symbol, 'future' if symbol.endswith('.CF') else 'stock')
+        return ref
+
+    def constituents(self, instset, date):
+        if self.instsets is None:
+            self.instsets = {}
+            if os.path.exists(self.file('instsets.json')):
+                with io.open(self.file('instsets.json'), encoding='utf-8') as f:
+                    self.instsets = json.load(f)
+        members = self.instsets.get(instset, [])
+        if isinstance(members, dict):
+            # 按生效日期取最近一期成分
+            effective = sorted((int(day), values) for day, values in members.items())
+            chosen = [values for day, values in effective if day <= date]
+            members = chosen[-1] if chosen else []
+        return list(members)
+
+    def continuous_symbol(self, symbol, date):
+        if self.continuous is None:
+            self.continuous = {}
+            if os.path.exists(self.file('continuous.csv')):
+                table = pd.read_csv(self.file('continuous.csv')).sort_values('tradeDate', kind='mergesort')
+                for name, group in table.groupby('symbol'):
+                    self.continuous[name] = (group['tradeDate'].values.astype(np.int64), group['target'].tolist())
+        dates, targets = self.continuous.get(symbol, ((), ()))
+        position = np.searchsorted(dates, date, side='right') - 1 if len(dates) else -1
+        return targets[position] if position >= 0 else symbol
+
+    def fields_one_day(self, date):
+        if self.fields is None:
+            path = self.file('fields.csv')
+            self.fields = pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=['tradeDate', 'symbol'])
+            for day, group in self.fields.groupby('tradeDate'):
+                self.field_days[int(day)] = group.set_index('symbol')
+        return self.field_days.get(int(date))
+
+    def trade_dates(self, symbols, span):
+        """
+        交易日历: 优先使用calendar.csv, 否则合并symbols在日K线(没有时用span周期)中出现过的交易日
+        """
+        if self.calendar is None:
+            if os.path.exists(self.file('calendar.csv')):
+                dates = pd.read_csv(self.file('calendar.csv'))['tradeDate'].values
+            else:
+                dates = [np.unique(self.bars('DAY_1', symbol)['tradeDate']) for symbol in symbols]
+                if not any(len(values) for values in dates):
+                    dates = [np.unique(self.bars(span, symbol)['tradeDate']) for symbol in symbols]
+                dates = np.concatenate(dates) if dates else np.zeros(0, dtype=np.int64)
+            self.calendar = np.unique(np.asarray(dates, dtype=np.int64))
+        return self.calendar
@@ -0,0 +1,163 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import time
+import numpy as np
+import pandas as pd
+from etatools.replay.api import Bar, ReplayApi
+from etatools.replay.broker import Broker
+
+'''
+回放引擎:
+onInitialize之后按交易日循环: 结算T+1可用数量 -> onBeforeMarketOpen -> 当日K线按时间戳分组依次推送,
+每根K线先撮合该标的未成交的目标仓位, 再调用onBar; 设置了按组回调时, 同一时间戳的K线推送完后调用onHandleData;
+推送的标的为关注列表(未设置时为股票池)、持仓和有未成交目标仓位的标的, 停牌的K线不推送.
+当日所有K线合并成一个数组后排序, 循环内只做列表索引, 不创建DataFrame
+'''
+
+
+class ExitInfo(object):
+    __slots__ = ('reason', 'tradeDate')
+
+    def __init__(self, reason, tradeDate):
+        self.reason = reason
+        self.tradeDate = tradeDate
+
+
+class ReplayResult(object):
+    """
+    equity: 以交易日为索引的收盘后总资产, fills: 全部成交记录
+    """
+
+    def __init__(self, equity, fills, bars, elapsed):
+        self.equity = equity
+        self.fills = fills
+        self.bars = bars
+        self.elapsed = elapsed
+
+    @property
+    def bars_per_minute(self):
+        return self.bars / self.elapsed * 60 if self.elapsed > 0 else float('inf')
+
+    def summary(self):
+        final = self.equity.iloc[-1] if len(self.equity) else float('nan')
+        return 'days: %d, bars: %d, fills: %d, elapsed: %.2fs, %.0f bars/min, final assets: %.2f' % (
+            len(self.equity), self.bars, len(self.fills), self.elapsed, self.bars_per_minute, final)
+
+
+class ReplayEngine(object):
+    """
+    strategy: 定义了回调函数的模块或对象, data: LocalData
+    start_date/end_date: 回测区间, 缺省为本地数据的全部交易日; time_span: 撮合周期, 缺省时按setRequireBars推断
+    """
+
+    def __init__(self, strategy, data, start_date=None, end_date=None, cash=1000000., time_span=None,
+                 fee_rate=0.0003, slippage=0):
+        self.strategy = strategy
+        self.data = data
+        self.start_date = start_date
+        self.end_date = end_date
+        self.time_span = time_span
+        self.broker = Broker(data, cash=cash, fee_rate=fee_rate, slippage=slippage)
+        self.api = ReplayApi(data, self.broker)
+        self.bars = 0
+
+    def callback(self, name):
+        return getattr(self.strategy, name, None)
+
+    def match_span(self):
+        if self.time_span:
+            return self.time_span
+        spans = set(span for span, count in self.api.require_bars)
+        return 'MIN_1' if 'MIN_1' in spans else 'DAY_1'
+
+    def trade_dates(self, span):
+        api = self.api
+        # 用回测结束时的股票池合并日历, 最好在数据目录中提供calendar.csv
+        api.curr_date = self.end_date or 99999999
+        calendar = self.data.trade_dates(api.expand(api.pool_instsets, api.pool_symbols), span)
+        api.trade_calendar = calendar
+        dates = calendar
+        if self.start_date:
+            dates = dates[dates >= self.start_date]
+        if self.end_date:
+            dates = dates[dates <= self.end_date]
+        return dates
+
+    def run(self):
+        started = time.time()
+        api = self.api
+        onInitialize = self.callback('onInitialize')
+        if onInitialize is not None:
+            onInitialize(api)
+        span = self.match_span()
+        onBeforeMarketOpen = self.callback('onBeforeMarketOpen')
+        equity = []
+        dates = self.trade_dates(span)
+        for trade_date in dates.tolist():
+            self.broker.settle_day()
+            api.begin_day(trade_date)
+            if onBeforeMarketOpen is not None:
+                onBeforeMarketOpen(api, trade_date)
+            api.premarket = False
+            self.session(trade_date, span)
+            equity.append(self.broker.account().totAssets)
+
+        onTerminate = self.callback('onTerminate')
+        if onTerminate is not None:
+            onTerminate(api, ExitInfo('finished', api.curr_date))
+        return ReplayResult(pd.Series(equity, index=pd.Index(dates, name='tradeDate'), dtype=np.float64),
+                            self.broker.fills, self.bars, time.time() - started)
+
+    def session(self, trade_date, span):
+        api = self.api
+        symbols = api.focus_symbols()
+        focused = set(symbols)
+        symbols.extend(symbol for symbol in self.broker.pending if symbol not in focused)
+        chunks = []
+        owners = []
+        for i, symbol in enumerate(symbols):
+            bars = self.data.bars(span, symbol)
+            start = np.searchsorted(bars['tradeDate'], trade_date, side='left')
+            stop = np.searchsorted(bars['tradeDate'], trade_date, side='right')
+            chunk = bars[start:stop]
+            chunk = chunk[chunk['isSuspended'] == 0]
+            if len(chunk):
+                chunks.append(chunk)
+                owners.append(np.full(len(chunk), i, dtype=np.int64))
+        if not chunks:
+            return
+        day = np.concatenate(chunks)
+        owner = np.concatenate(owners)
+        # 同一时间戳内按关注列表的顺序推送
+        order = np.lexsort((owner, day['time']))
+        day = day[order]
+        owner = owner[order].tolist()
+        times = day['time'].tolist()
+        opens = day['open'].tolist()
+        highs = day['high'].tolist()
+        lows = day['low'].tolist()
+        closes = day['close'].tolist()
+        volumes = day['volume'].tolist()
+        totals = day['totalVolume'].tolist()
+
+        onBar = self.callback('onBar')
+        onHandleData = self.callback('onHandleData')
+        group = api.group_timeout is not None and onHandleData is not None
+        if group and api.only_group:
+            onBar = None
+        on_bar = self.broker.on_bar
+        count = len(times)
+        i = 0
+        while i < count:
+            now = times[i]
+            api.now = now
+            while i < count and times[i] == now:
+                symbol = symbols[owner[i]]
+                on_bar(symbol, now, opens[i], highs[i], lows[i], closes[i])
+                if onBar is not None:
+                    onBar(api, Bar(symbol, now, trade_date, opens[i], highs[i], lows[i], closes[i], volumes[i],
+                                   totals[i], 0))
+                i += 1
+            if group:
+                onHandleData(api, now)
+        self.bars += count
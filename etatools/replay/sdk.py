@@ -0,0 +1,151 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import io
+import sys
+import json
+import types
+import logging
+import importlib.util
+from etatools.replay.data import LocalData
+from etatools.replay.engine import ReplayEngine
+
+'''
+etasdk的本地替身:
+install()把本模块提供的ETimeSpan, EPriceMode, EPositionSide, LOG, GlobalConfig, StrategyProxy等注册为etasdk模块,
+策略和main.py不需要任何修改; StrategyProxy.start()不再连接config.json中的host/port,
+而是读取config.json的"replay"配置(data, startDate, endDate, cash, timeSpan, fee_rate, slippage)在本地回放.
+参数优先级: install(**options) > GlobalConfig.setBackTestParam/setMatchParams > config.json的replay配置
+'''
+
+VERSION = 'replay-1.0'
+
+MARKET_CHINASTOCK = 'stock'
+MARKET_CHINAFUTURE = 'future'
+
+
+class ETimeSpan(object):
+    MIN_1 = 'MIN_1'
+    MIN_5 = 'MIN_5'
+    MIN_15 = 'MIN_15'
+    MIN_30 = 'MIN_30'
+    MIN_60 = 'MIN_60'
+    DAY_1 = 'DAY_1'
+
+
+class EPriceMode(object):
+    REAL = 'REAL'
+    FORMER = 'FORMER'
+
+
+class EPositionSide(object):
+    LONG = 'LONG'
+    SHORT = 'SHORT'
+
+
+class LOG(object):
+    logger = logging.getLogger('etasdk')
+
+    @classmethod
+    def INFO(cls, fmt, *args):
+        cls.logger.info(fmt, *args)
+
+    @classmethod
+    def WARN(cls, fmt, *args):
+        cls.logger.warning(fmt, *args)
+
+    @classmethod
+    def ERROR(cls, fmt, *args):
+        cls.logger.error(fmt, *args)
+
+    @classmethod
+    def DEBUG(cls, fmt, *args):
+        cls.logger.debug(fmt, *args)
+
+
+class GlobalConfig(object):
+    params = {}
+
+    @staticmethod
+    def getVersion():
+        return VERSION
+
+    @classmethod
+    def setBackTestParam(cls, startDate=None, endDate=None, **kwargs):
+        cls.params.update(start=startDate, end=endDate)
+
+    @classmethod
+    def setMatchParams(cls, timeSpan=None, **kwargs):
+        cls.params.update(span=timeSpan)
+
+
+# install()传入的参数
+OPTIONS = {}
+
+
+def load_strategy(path):
+    # 以文件名为模块名导入, 与云端引擎加载策略文件的方式一致
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class StrategyProxy(object):
+    """
+    与云端SDK相同的入口, start()在本地回放config.json中的第一个策略并返回ReplayResult
+    """
+
+    def __init__(self, config):
+        self.config_path = config
+        with io.open(config, encoding='utf-8') as f:
+            self.config = json.load(f)
+
+    def options(self):
+        replay = self.config.get('replay', {})
+        options = {
+            'data': replay.get('data', 'data'),
+            'start': replay.get('startDate'),
+            'end': replay.get('endDate'),
+            'cash': replay.get('cash', 1000000.),
+            'span': replay.get('timeSpan'),
+            'fee_rate': replay.get('fee_rate', 0.0003),
+            'slippage': replay.get('slippage', 0),
+        }
+        options.update((key, value) for key, value in GlobalConfig.params.items() if value is not None)
+        options.update((key, value) for key, value in OPTIONS.items() if value is not None)
+        return options
+
+    def start(self):
+        base = os.path.dirname(os.path.abspath(self.config_path))
+        level = self.config.get('loglevel', 'ERROR')
+        logging.basicConfig(level=getattr(logging, str(level).upper(), logging.ERROR), format='%(message)s')
+        options = self.options()
+        strategy = load_strategy(os.path.join(base, self.config['strategies'][0]['strategy']))
+        data = LocalData(os.path.join(base, options['data']))
+        engine = ReplayEngine(strategy, data, start_date=options['start'], end_date=options['end'],
+                              cash=options['cash'], time_span=options['span'], fee_rate=options['fee_rate'],
+                              slippage=options['slippage'])
+        result = engine.run()
+        print('[replay]', self.config['strategies'][0].get('name', ''), result.summary())
+        return result
+
+
+EXPORTS = ('ETimeSpan', 'EPriceMode', 'EPositionSide', 'LOG', 'GlobalConfig', 'StrategyProxy',
+           'MARKET_CHINASTOCK', 'MARKET_CHINAFUTURE')
+
+
+def install(**options):
+    """
+    注册etasdk模块, options可设置data, start, end, cash, span, fee_rate, slippage
+    """
+    OPTIONS.clear()
+    OPTIONS.update(options)
+    module = types.ModuleType(str('etasdk'))
+    for name in EXPORTS:
+        setattr(module, name, globals()[name])
+    module.__all__ = list(EXPORTS)
+    sys.modules['etasdk'] = module
+    return module
@@ -0,0 +1,97 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import datetime
+
+'''
+交易日历与调仓调度：
+TradingCalendar缓存getPrevTradeDate的结果, 并由日期整数直接推算星期、月内/周内第几个交易日;
+Scheduler按月、按周、按月内第n个交易日或自定义条件触发任务, 只有触发的交易日才执行耗时的盘前逻辑
+'''
+
+
+class TradingCalendar(object):
+    """
+    交易日历, 日期均为YYYYMMDD格式的整数
+    策略拿不到回测区间, 不预先解析整个日历; 每个日期的前一交易日只向api查询一次, 之后都从缓存取得
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.prev = {}
+        self.month_index = {}
+        self.week_index = {}
+
+    def prev_date(self, date):
+        prev = self.prev.get(date)
+        if prev is None:
+            prev = self.prev[date] = int(self.api.getPrevTradeDate(date))
+        return prev
+
+    @staticmethod
+    def to_date(date):
+        return datetime.date(date // 10000, date // 100 % 100, date % 100)
+
+    def weekday(self, date):
+        # 星期一为1, 星期日为7
+        return self.to_date(date).isoweekday()
+
+    def month_day(self, date):
+        # 当月第几个交易日, 从1开始
+        return self.period_day(date, self.month_index, lambda day: day // 100)
+
+    def week_day(self, date):
+        # 当周第几个交易日, 从1开始
+        return self.period_day(date, self.week_index, lambda day: self.to_date(day).isocalendar()[:2])
+
+    def period_day(self, date, cache, period):
+        # 向前找到本期第一个交易日, 沿途的结果都缓存下来
+        path = []
+        day = date
+        while day not in cache:
+            path.append(day)
+            prev = self.prev_date(day)
+            if period(prev) != period(day):
+                cache[day] = 1
+                path.pop()
+                break
+            day = prev
+        index = cache[day]
+        for day in reversed(path):
+            index += 1
+            cache[day] = index
+        return cache[date]
+
+
+class Scheduler(object):
+    """
+    调仓调度器:
+    monthly/weekly注册在每月/每周第nth个交易日触发的任务, custom注册由predicate(calendar, date)决定的任务,
+    盘前调用run执行当日触发的任务, 之后可以用fired(name)判断当日是否触发
+    """
+
+    def __init__(self, api):
+        self.calendar = TradingCalendar(api)
+        self.jobs = []
+        self.today = set()
+
+    def monthly(self, name, func=None, nth=1):
+        self.custom(name, lambda calendar, date: calendar.month_day(date) == nth, func)
+
+    def weekly(self, name, func=None, nth=1):
+        self.custom(name, lambda calendar, date: calendar.week_day(date) == nth, func)
+
+    def custom(self, name, predicate, func=None):
+        self.jobs.append((name, predicate, func))
+
+    def run(self, api, trade_date):
+        trade_date = int(trade_date)
+        self.today = set()
+        for name, predicate, func in self.jobs:
+            if predicate(self.calendar, trade_date):
+                self.today.add(name)
+                if func is not None:
+                    func(api, trade_date)
+        return self.today
+
+    def fired(self, name):
+        return name in self.today
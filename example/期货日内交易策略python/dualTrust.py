@@ -4,6 +4,7 @@ from __future__ import print_function, absolute_import, unicode_literals, divisi
 import numpy as np
 import datetime
 from etasdk import *
+from etatools import instrument
 
 """
 期货日内交易
@@ -59,7 +60,8 @@ def onInitialize(api):
 def onBeforeMarketOpen(api, trade_date):
     # print(trade_date)
     api.trading_day = trade_date
-    api.bars_since_today = 0
+    # 每个交易日重置当日行情状态
+    api.sessions = {}
     api.lots = 1
     api.can_trade = False
     api.long_can_trade = True
@@ -79,12 +81,13 @@ def onBeforeMarketOpen(api, trade_date):
 def onBar(api, bar):
     if api.can_trade:
         time_now = datetime.datetime.fromtimestamp(api.timeNow() / 1000)
-        api.bars_since_today += 1
-        bars = api.getBarsHistory(symbol=bar.symbol, timeSpan=ETimeSpan.MIN_1, count=api.bars_since_today,
-                                  priceMode=EPriceMode.REAL, fields=None, df=True)
+        session = api.sessions.get(bar.symbol)
+        if session is None:
+            session = SessionState()
+            api.sessions[bar.symbol] = session
+        session.update(bar)
         # print("time_now:", time_now)
-        today_open = bars['open'].values[0]
-        buy_line, sell_line = get_buy_and_sell_lines(today_open=today_open, history_range=api.history_range,
+        buy_line, sell_line = get_buy_and_sell_lines(today_open=session.open, history_range=api.history_range,
                                                      k1=api.k, k2=api.k)
 
         position_side = get_position_side(api, bar.symbol)
@@ -154,6 +157,29 @@ def get_history_range(api, symbol, look_back=5):
     return history_range, normalize_tr, last_close
 
 
+class SessionState(object):
+    """
+    单个合约的当日行情状态, 由bar流直接维护, 不再重复下载当日分钟数据：
+    开盘价(当日第一根bar的开盘价), 当日最高价, 当日最低价, 当日bar数
+    """
+
+    def __init__(self):
+        self.open = None
+        self.high = None
+        self.low = None
+        self.bar_count = 0
+
+    def update(self, bar):
+        if self.bar_count == 0:
+            self.open = bar.open
+            self.high = bar.high
+            self.low = bar.low
+        else:
+            self.high = max(self.high, bar.high)
+            self.low = min(self.low, bar.low)
+        self.bar_count += 1
+
+
 def get_buy_and_sell_lines(today_open, history_range, k1=0.45, k2=0.55):
     """计算买入开仓价上轨和卖出开仓价下轨
     BuyLine = today_open + K1*Range
@@ -186,3 +212,7 @@ def get_multiply(api, symbol):
     ref_data = api.getRefData(str(symbol))
     multiplier = ref_data.valuePerUnit
     return multiplier
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
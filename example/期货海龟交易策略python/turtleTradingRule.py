@@ -3,15 +3,10 @@
 
 from __future__ import print_function, absolute_import, unicode_literals
 
-import sys
 import numpy as np
-
-try:
-    import talib
-except:
-    print('请安装TA-Lib库')
-    sys.exit(-1)
+from collections import deque
 from etasdk import *
+from etatools import get_bars, instrument
 
 '''
 期货策略：海龟交易法
@@ -38,6 +33,8 @@ def onInitialize(api):
     api.tar = api.parameter[4]
 
     api.data_len = 600
+    # 每个合约的增量指标
+    api.indicators = {}
 
     api.setSymbolPool(symbols=api.tickersCode)
     api.setRequireBars(ETimeSpan.MIN_1, api.data_len)
@@ -51,18 +48,25 @@ def onBeforeMarketOpen(api, tradeDate):
 
 
 def onBar(api, bar):
-    bar_data = api.getBarsHistory(symbol=bar.symbol, timeSpan=ETimeSpan.MIN_1, count=api.data_len,
-                                  priceMode=EPriceMode.FORMER, fields=None, df=True)
-    close = bar_data["close"].values[-1]
+    indicator = api.indicators.get(bar.symbol)
+    if indicator is None:
+        # 首次只下载一次历史数据初始化指标, 之后按bar增量更新
+        bar_data = get_bars(api, symbol=bar.symbol, timeSpan=ETimeSpan.MIN_1, count=api.data_len,
+                            priceMode=EPriceMode.FORMER, fields=['high', 'low', 'close'])
+        indicator = TurtleIndicator(don_open=api.parameter[0] + 1, don_close=api.parameter[1] + 1,
+                                    ma_short=api.parameter[2] + 1, ma_long=api.parameter[3] + 1,
+                                    atr_period=api.tar)
+        indicator.seed(bar_data.high, bar_data.low, bar_data.close)
+        api.indicators[bar.symbol] = indicator
+    else:
+        indicator.update(bar.high, bar.low, bar.close)
+    close = indicator.close
     # 计算ATR
-    atr = talib.ATR(bar_data["high"].values, bar_data["low"].values, bar_data["close"].values,
-                    timeperiod=api.tar)[-1]
+    atr = indicator.atr
 
     # 计算唐奇安开仓和平仓通道
-    api.don_open = api.parameter[0] + 1
-    upper_band = talib.MAX(bar_data['close'].values[:-1], timeperiod=api.don_open)[-1]
-    api.don_close = api.parameter[1] + 1
-    lower_band = talib.MIN(bar_data['close'].values[:-1], timeperiod=api.don_close)[-1]
+    upper_band = indicator.upper_band
+    lower_band = indicator.lower_band
 
     # 若没有仓位则开仓
     position_long = api.getSymbolPosition(symbol=bar.symbol, positionSide=EPositionSide.LONG)
@@ -73,10 +77,7 @@ def onBar(api, bar):
 
     if not position_long.posQty and not position_short.posQty:
         # 计算长短ma线.DIF
-        ma_short = talib.MA(bar_data['close'].values, timeperiod=(api.parameter[2] + 1))[-1]
-        ma_long = talib.MA(bar_data['close'].values, timeperiod=(api.parameter[3] + 1))[-1]
-
-        diff = ma_short - ma_long
+        diff = indicator.ma_short - indicator.ma_long
 
         # 获取当前价格
         # 上穿唐奇安通道且短ma在长ma上方则开多仓
@@ -142,3 +143,112 @@ def onTerminate(api, exit_info):
     pass
 
 
+class RollingExtreme(object):
+    """
+    单调队列计算滚动窗口最大(小)值, 每根bar均摊O(1)
+    """
+
+    def __init__(self, window, is_max=True):
+        self.window = window
+        self.is_max = is_max
+        self.queue = deque()
+
+    def push(self, index, value):
+        queue = self.queue
+        if self.is_max:
+            while queue and queue[-1][1] <= value:
+                queue.pop()
+        else:
+            while queue and queue[-1][1] >= value:
+                queue.pop()
+        queue.append((index, value))
+        while queue[0][0] <= index - self.window:
+            queue.popleft()
+
+    def value(self, index):
+        # index之前(含)window根bar的最值, 数据不足时返回nan
+        if index + 1 < self.window:
+            return np.nan
+        return self.queue[0][1]
+
+
+class RollingMean(object):
+    """
+    环形缓存加累加和计算简单移动平均, 与talib.MA(SMA)的递推方式一致
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, value):
+        pos = self.count % self.window
+        if self.count >= self.window:
+            self.total -= self.buffer[pos]
+        self.buffer[pos] = value
+        self.total += value
+        self.count += 1
+
+    def value(self):
+        if self.count < self.window:
+            return np.nan
+        return self.total / self.window
+
+
+class TurtleIndicator(object):
+    """
+    海龟交易法的增量指标：
+    Wilder平滑的ATR, 不含当前bar的唐奇安开仓/平仓通道, 长短MA.
+    用历史数据初始化一次, 之后每根bar O(1)更新, 结果与talib的
+    ATR/MAX/MIN/MA对同一段数据的计算值一致
+    """
+
+    def __init__(self, don_open, don_close, ma_short, ma_long, atr_period):
+        self.upper_channel = RollingExtreme(don_open, is_max=True)
+        self.lower_channel = RollingExtreme(don_close, is_max=False)
+        self.ma_short_line = RollingMean(ma_short)
+        self.ma_long_line = RollingMean(ma_long)
+        self.atr_period = atr_period
+        self.count = 0
+        self.tr_total = 0.0
+        self.close = np.nan
+        self.atr = np.nan
+        self.upper_band = np.nan
+        self.lower_band = np.nan
+        self.ma_short = np.nan
+        self.ma_long = np.nan
+
+    def seed(self, highs, lows, closes):
+        for high, low, close in zip(highs, lows, closes):
+            self.update(high, low, close)
+
+    def update(self, high, low, close):
+        high, low, close = float(high), float(low), float(close)
+        index = self.count - 1
+        # 唐奇安通道只用当前bar之前的收盘价
+        if index >= 0:
+            self.upper_band = self.upper_channel.value(index)
+            self.lower_band = self.lower_channel.value(index)
+            # 真实波幅, Wilder平滑
+            prev_close = self.close
+            true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+            if self.count <= self.atr_period:
+                self.tr_total += true_range
+                if self.count == self.atr_period:
+                    self.atr = self.tr_total / self.atr_period
+            else:
+                self.atr = (self.atr * (self.atr_period - 1) + true_range) / self.atr_period
+        self.upper_channel.push(self.count, close)
+        self.lower_channel.push(self.count, close)
+        self.ma_short_line.push(close)
+        self.ma_long_line.push(close)
+        self.ma_short = self.ma_short_line.value()
+        self.ma_long = self.ma_long_line.value()
+        self.close = close
+        self.count += 1
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
@@ -1,8 +1,9 @@
 # coding=utf-8
 from __future__ import print_function, absolute_import, unicode_literals,division
 from etasdk import *
+from etatools import get_bars, instrument
 import numpy as np
-import pandas as pd
+from bisect import bisect_left
 '''
 策略基本思想：本策略为经典的期货日内策略（网格交易），设置不同的临界线，并分配不同的资金仓位。
 策略交易频率：1分钟
@@ -22,32 +23,41 @@ def onInitialize(api):
     # 交易参数设定
     api.k1 = [-40.0,-3.0,-2.0,2.0,3.0,40.0]
     api.weight = [0.5,0.3, 0.0, 0.3, 0.5]
-    api.trade_peroid = 60 # 每小时更新一次网格临界线
+    api.trade_peroid = 1 # 每根bar更新一次网格临界线
     api.minute_num = 0
     api.level  = 3.0
     api.volume = []
     api.band   = []
+    # 每个合约的滚动网格计算器
+    api.grid_bands = {}
 def onBeforeMarketOpen(api, trade_date):
     print(trade_date)
     api.tradeday = trade_date
     ##  订阅行情
     api.setFocusSymbols( api.trade_product)
 def onBar(api,data):
+    grid_band = api.grid_bands.get(data.symbol)
+    if grid_band is None:
+        # 首次只下载一次历史数据初始化, 之后按bar增量更新
+        data01 = get_bars(api, data.symbol, timeSpan=ETimeSpan.MIN_1, count=api.data_len, fields=['close'])
+        grid_band = GridBand(api.data_len, api.k1)
+        for close in data01.close.tolist():
+            grid_band.update(close)
+        api.grid_bands[data.symbol] = grid_band
+    else:
+        grid_band.update(data.close)
     if (api.minute_num % api.trade_peroid) == 0:
-        # 获取过去300个数据计算临界线
-        data01 = api.getBarsHistory(data.symbol, timeSpan=ETimeSpan.MIN_1, count=api.data_len, df=False)
-        close = []
-        for ind01 in data01:
-            close.append(ind01.close)
-        api.band = np.mean(close)+np.array(api.k1)*np.std(close)
+        api.band = grid_band.rebalance()
     # 计算网格状态
-    grid = pd.cut([data.close],api.band,labels=[0,1,2,3,4])[0]
-    print(grid)
+    grid = grid_band.classify(data.close)
     # 更新计算交易量
     api.volume = []
     for weight in api.weight:
         api.volume.append(lots(api, data, weight))
     api.minute_num += 1
+    # 价格在网格之外则不操作
+    if grid is None:
+        return
     # 查询持仓
     position_long = api.getSymbolPosition(symbol=data.symbol, positionSide=EPositionSide.LONG)
     position_short = api.getSymbolPosition(symbol=data.symbol, positionSide=EPositionSide.SHORT)
@@ -86,4 +96,62 @@ def lots(api, data,weight):
     # 获取账户资金计算下单手数
     refdata = api.getRefData(data.symbol)
     multiper = refdata.valuePerUnit
-    return (int(api.capital * api.level*weight / data.close / multiper))
\ No newline at end of file
+    return (int(api.capital * api.level*weight / data.close / multiper))
+
+
+class GridBand(object):
+    """
+    滚动网格临界线：
+    用定长环形缓存保存最近window个收盘价, 同时维护累加和与平方和,
+    每根bar更新均值/标准差为O(1); 临界线 = 均值 + k * 标准差,
+    网格状态用二分查找得到, 与pd.cut(右闭区间)的结果一致
+    """
+
+    def __init__(self, window, k):
+        self.window = window
+        self.k = np.array(k, dtype=np.float64)
+        self.buffer = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.pos = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.band = []
+
+    def update(self, close):
+        close = float(close)
+        old = self.buffer[self.pos]
+        self.buffer[self.pos] = close
+        self.pos = (self.pos + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+            self.total += close
+            self.total_sq += close * close
+        elif self.pos == 0:
+            # 每转一圈重新求和一次, 消除累加误差
+            self.total = float(np.sum(self.buffer))
+            self.total_sq = float(np.dot(self.buffer, self.buffer))
+        else:
+            self.total += close - old
+            self.total_sq += close * close - old * old
+
+    def mean_std(self):
+        mean = self.total / self.count
+        var = max(self.total_sq / self.count - mean * mean, 0.0)
+        return mean, var ** 0.5
+
+    def rebalance(self):
+        # 重新计算网格临界线
+        mean, std = self.mean_std()
+        self.band = (mean + self.k * std).tolist()
+        return self.band
+
+    def classify(self, price):
+        # 返回价格所在的网格编号, 落在(band[i], band[i+1]]时为i, 超出网格返回None
+        grid = bisect_left(self.band, price) - 1
+        if grid < 0 or grid >= len(self.band) - 1:
+            return None
+        return grid
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
@@ -1,7 +1,9 @@
 # coding=utf-8
 from __future__ import print_function, absolute_import, unicode_literals
 import datetime
+from collections import OrderedDict
 from etasdk import *
+from etatools import get_bars, instrument
 import numpy as np
 
 '''
@@ -23,6 +25,10 @@ def onInitialize(api):
     api.data_len = 30
     # 进行套利的品种
     api.tickersCode = ['rb1801.CF', 'hc1801.CF']  # "rb1801.CF"---螺纹1801合约
+    # 价差 = 各腿收盘价按权重求和, 布林带宽度为k倍标准差
+    api.spread_weights = [1.0, -1.0]
+    api.spread_k = 2.0
+    api.spread = None
     # 设置行情数据缓存
     api.setRequireData(instsets=['rb.PRD', 'hc.PRD'], symbols=api.tickersCode, fields=[], bars=[(ETimeSpan.MIN_1, 300)])
 
@@ -32,6 +38,17 @@ def onBeforeMarketOpen(api, tradeDate):
     api.trading_day = tradeDate
     # 订阅行情
     api.setFocusSymbols(api.tickersCode)
+    # 首次下载一次历史数据初始化价差统计, 之后由bar流增量更新
+    if api.spread is None:
+        api.spread = SpreadBuffer(api.tickersCode, api.spread_weights, api.data_len, api.spread_k)
+        times = []
+        closes = []
+        for symbol in api.tickersCode:
+            data = get_bars(api, symbol=symbol, timeSpan=ETimeSpan.MIN_1, count=api.data_len,
+                            priceMode=EPriceMode.FORMER, fields=['time', 'close'])
+            times.append(data.time)
+            closes.append(data.close)
+        api.spread.seed(times, closes)
 
     symbol_positions = api.getSymbolPositions()
     print("symbol_positions:", symbol_positions)
@@ -40,25 +57,23 @@ def onBeforeMarketOpen(api, tradeDate):
     position_rb_short = api.getSymbolPosition(symbol=api.tickersCode[0], positionSide=EPositionSide.SHORT)
 
 
-def onHandleData(api, timeExch):
-    api.trade_date = datetime.datetime.fromtimestamp(timeExch / 1000)
+def onBar(api, bar):
+    # 各腿的bar按时间对齐成价差
+    if api.spread is not None:
+        api.spread.push(bar.symbol, bar.timeStr, bar.close)
 
-    # 获取两个品种的时间序列
-    data_rb = api.getBarsHistory(symbol=api.tickersCode[0], timeSpan=ETimeSpan.MIN_1, count=api.data_len + 1,
-                                 priceMode=EPriceMode.FORMER, fields=None, df=True)
-    close_rb = data_rb["close"].values
 
-    data_hc = api.getBarsHistory(symbol=api.tickersCode[1], timeSpan=ETimeSpan.MIN_1, count=api.data_len + 1,
-                                 priceMode=EPriceMode.FORMER, fields=None, df=True)
-    close_hc = data_hc["close"].values
+def onHandleData(api, timeExch):
+    api.trade_date = datetime.datetime.fromtimestamp(timeExch / 1000)
 
-    # 计算价差
-    spread = close_rb[:-1] - close_hc[:-1]
-    # 计算布林带的上下轨
-    up = np.mean(spread) + 2 * np.std(spread)
-    down = np.mean(spread) - 2 * np.std(spread)
+    # 没有新的完整价差(有腿的bar未到)或数据不足时不操作
+    if api.spread is None or not api.spread.consume() or not api.spread.ready():
+        return
+    # 布林带的上下轨由之前data_len个价差计算
+    up = api.spread.up
+    down = api.spread.down
     # 计算最新价差
-    spread_now = close_rb[-1] - close_hc[-1]
+    spread_now = api.spread.spread_now
 
     # 无交易时若价差上(下)穿布林带上(下)轨则做空(多)价差
     position_rb_long = api.getSymbolPosition(symbol=api.tickersCode[0], positionSide=EPositionSide.LONG)
@@ -109,3 +124,97 @@ def onHandleData(api, timeExch):
 
 def onTerminate(api, exitInfo):
     print("回测结束。。。")
+
+
+class SpreadBuffer(object):
+    """
+    多腿价差的对齐缓存：
+    各腿的bar按时间对齐, 所有腿都到齐后才生成一个价差, 某条腿迟到时较早的不完整数据直接丢弃;
+    最近window个价差保存在环形缓存中, 并维护累加和与平方和, 每个价差O(1)更新布林带
+    """
+
+    def __init__(self, symbols, weights, window, k=2.0, max_pending=10):
+        self.symbols = list(symbols)
+        self.index = dict((symbol, i) for i, symbol in enumerate(self.symbols))
+        self.weights = np.array(weights, dtype=np.float64)
+        self.window = window
+        self.k = k
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.buffer = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.pos = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.spread_now = None
+        self.up = None
+        self.down = None
+        self.fresh = False
+
+    def seed(self, times, closes):
+        # times/closes为各腿历史K线的时间和收盘价, 与push一样按时间对齐, 只使用所有腿都有K线的时间
+        common = np.asarray(times[0])
+        for time in times[1:]:
+            common = np.intersect1d(common, time)
+        matrix = np.vstack([np.asarray(close, dtype=np.float64)[np.searchsorted(time, common)]
+                            for time, close in zip(times, closes)])
+        for spread in np.dot(self.weights, matrix):
+            self.add(spread)
+        self.fresh = False
+
+    def push(self, symbol, key, close):
+        i = self.index.get(symbol)
+        if i is None:
+            return False
+        legs = self.pending.get(key)
+        if legs is None:
+            legs = self.pending[key] = [None] * len(self.symbols)
+            if len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+        legs[i] = close
+        if any(leg is None for leg in legs):
+            return False
+        # 丢弃该时间之前未到齐的数据
+        while True:
+            first, first_legs = self.pending.popitem(last=False)
+            if first == key:
+                break
+        self.add(float(np.dot(self.weights, first_legs)))
+        return True
+
+    def add(self, spread):
+        # 先用之前的价差计算布林带, 再把最新价差加入窗口
+        if self.count >= self.window:
+            mean = self.total / self.window
+            std = max(self.total_sq / self.window - mean * mean, 0.0) ** 0.5
+            self.up = mean + self.k * std
+            self.down = mean - self.k * std
+        self.spread_now = spread
+        self.fresh = True
+        old = self.buffer[self.pos]
+        self.buffer[self.pos] = spread
+        self.pos = (self.pos + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+            self.total += spread
+            self.total_sq += spread * spread
+        elif self.pos == 0:
+            # 每转一圈重新求和一次, 消除累加误差
+            self.total = float(np.sum(self.buffer))
+            self.total_sq = float(np.dot(self.buffer, self.buffer))
+        else:
+            self.total += spread - old
+            self.total_sq += spread * spread - old * old
+
+    def ready(self):
+        return self.up is not None
+
+    def consume(self):
+        # 是否有尚未处理的新价差
+        fresh = self.fresh
+        self.fresh = False
+        return fresh
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
@@ -1,15 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import print_function, absolute_import, unicode_literals
-import sys
 import datetime
 import numpy as np
 from etasdk import *
-try:
-    import statsmodels.tsa.stattools as ts
-except:
-    print('请安装statsmodels库')
-    sys.exit(-1)
+from etatools import BarHistory, get_bars, instrument
+from pairScanner import scan_pairs, batch_adf, adf_pvalues
 
 '''
 期货策略：跨期套利
@@ -17,7 +13,8 @@ except:
 通过计算两个价格序列回归残差的均值和标准差并用均值加减0.9倍标准差得到上下轨
 在价差突破上轨的时候做空价差;在价差突破下轨的时候做多价差
 若有仓位,在残差回归至上下轨内的时候平仓
-回测数据为:rb1801和rb1805的1min数据
+每日开盘前用批量协整扫描(pairScanner)在rb品种的所有合约中选出协整关系最强的合约对
+回测数据为:rb品种(初始为rb1801和rb1805)的1min数据
 回测时间为:2017-09-25 到2017-10-01
 撮合周期：1分钟
 '''
@@ -28,55 +25,76 @@ def onInitialize(api):
     api.setGroupMode(5000, False)
     # 设置bar长度
     api.data_len = 800
-    # 进行套利的品种
+    # 进行套利的品种, 每日开盘前从scan_products的所有合约中重新选择
     api.tickersCode = ['rb1801.CF', 'rb1805.CF']
+    api.scan_products = ['rb.PRD']
+    # 协整扫描使用的进程数, None为在当前进程内计算
+    api.scan_workers = None
     # 设置行情数据缓存
     api.setRequireData(instsets=['rb.PRD'], symbols=api.tickersCode, fields=[], bars=[(ETimeSpan.MIN_1, 900)])
+    # 协整检验结果缓存: 每refresh_bars根bar或残差漂移超过阈值时重新检验, 其间用递归最小二乘更新对冲比例
+    api.coint_cache = CointegrationCache(refresh_bars=120, drift_span=30, drift_threshold=1.5,
+                                         forgetting=1.0 - 1.0 / api.data_len)
+    # 各合约最新收盘价
+    api.last_close = {}
+    # 分钟K线缓存, 重新检验协整时只取新增的K线
+    api.history = BarHistory(api)
 
 
 def onBeforeMarketOpen(api, tradeDate):
     # print(tradeDate)
     api.trading_day = tradeDate
+    # 选出协整关系最强的合约对, 换合约对时平掉全部仓位并重置协整缓存
+    # 新旧合约对共有的合约也要平仓: 它在新合约对中的位置和对冲关系都可能改变
+    pair = select_pair(api)
+    if pair and pair != api.tickersCode:
+        print('切换套利合约对:', api.tickersCode, '->', pair)
+        close_all_positions(api)
+        api.tickersCode = pair
+        api.coint_cache.reset()
+        api.last_close = {}
     # 订阅行情
     api.setFocusSymbols(api.tickersCode)
 
 
+def onBar(api, bar):
+    api.last_close[bar.symbol] = bar.close
+
+
 def onHandleData(api, time_exch):
     api.trade_date = datetime.datetime.fromtimestamp(time_exch / 1000)
+    cache = api.coint_cache
 
-    # 获取两个品种的时间序列
-    data_01 = api.getBarsHistory(symbol=api.tickersCode[0], timeSpan=ETimeSpan.MIN_1, count=api.data_len + 1,
-                                 priceMode=EPriceMode.FORMER, fields=None, df=True)
-    close_01 = data_01["close"].values
-
-    data_02 = api.getBarsHistory(symbol=api.tickersCode[1], timeSpan=ETimeSpan.MIN_1, count=api.data_len + 1,
-                                 priceMode=EPriceMode.FORMER, fields=None, df=True)
-    close_02 = data_02["close"].values
+    if cache.needs_refresh():
+        # 获取两个品种的时间序列
+        # 直接使用缓存上的收盘价视图, 检验结束前不会被改写
+        close_01 = get_bars(api.history, symbol=api.tickersCode[0], timeSpan=ETimeSpan.MIN_1,
+                            count=api.data_len + 1, priceMode=EPriceMode.FORMER).close
+        close_02 = get_bars(api.history, symbol=api.tickersCode[1], timeSpan=ETimeSpan.MIN_1,
+                            count=api.data_len + 1, priceMode=EPriceMode.FORMER).close
 
-    # 展示两个价格序列的协整检验的结果
-    beta, c, resid, result = cointegration_test(close_01, close_02)
+        # 重新进行两个价格序列的协整检验
+        cache.refresh(close_01, close_02)
+        price_01, price_02 = close_01[-1], close_02[-1]
+    else:
+        price_01 = api.last_close.get(api.tickersCode[0])
+        price_02 = api.last_close.get(api.tickersCode[1])
+        if price_01 is None or price_02 is None:
+            return
+        cache.update(price_01, price_02)
 
     # 如果返回协整检验不通过的结果则全平仓位等待
-    if not result:
+    if not cache.result:
         print('协整检验不通过,全平所有仓位')
-        symbol_positions = api.getSymbolPositions()
-        if symbol_positions:
-            for symbol_obj in symbol_positions:
-                if symbol_obj.positionSide == EPositionSide.SHORT:
-                    api.targetPosition(symbol=symbol_obj.symbol, qty=0, positionSide=EPositionSide.SHORT)
-                    LOG.INFO("close old contract short position:%s", symbol_obj.symbol)
-                elif symbol_obj.positionSide == EPositionSide.LONG:
-                    api.targetPosition(symbol=symbol_obj.symbol, qty=0, positionSide=EPositionSide.LONG)
-                    LOG.INFO("close old contract long position:%s", symbol_obj.symbol)
+        close_all_positions(api)
         return
 
     # 计算残差的标准差上下轨
-    mean = np.mean(resid)
-    up = mean + 1.5 * np.std(resid)
-    down = mean - 1.5 * np.std(resid)
+    up = cache.resid_mean + 1.5 * cache.resid_std
+    down = cache.resid_mean - 1.5 * cache.resid_std
 
     # 计算新残差
-    resid_new = close_01[-1] - beta * close_02[-1] - c
+    resid_new = cache.residual(price_01, price_02)
 
     # 获取rb1801的多空仓位
     position_01_long = api.getSymbolPosition(symbol=api.tickersCode[0], positionSide=EPositionSide.LONG)
@@ -126,20 +144,58 @@ def onTerminate(api, exitInfo):
     print("回测结束。。。")
 
 
+# 全平所有合约的多空仓位
+def close_all_positions(api):
+    for symbol_obj in api.getSymbolPositions() or []:
+        if symbol_obj.positionSide == EPositionSide.SHORT:
+            api.targetPosition(symbol=symbol_obj.symbol, qty=0, positionSide=EPositionSide.SHORT)
+            LOG.INFO("close old contract short position:%s", symbol_obj.symbol)
+        elif symbol_obj.positionSide == EPositionSide.LONG:
+            api.targetPosition(symbol=symbol_obj.symbol, qty=0, positionSide=EPositionSide.LONG)
+            LOG.INFO("close old contract long position:%s", symbol_obj.symbol)
+
+
+# 在各品种的全部合约中选择协整p值最小(相同时半衰期最短)的合约对
+def select_pair(api):
+    best = None
+    for product in api.scan_products:
+        symbols = []
+        closes = []
+        for symbol in api.getConstituentSymbols(product):
+            bars = get_bars(api, symbol=symbol, timeSpan=ETimeSpan.MIN_1, count=api.data_len + 1,
+                            priceMode=EPriceMode.FORMER, fields=['close'])
+            if len(bars) < api.data_len + 1:
+                continue
+            symbols.append(symbol)
+            closes.append(bars.close)
+        if len(symbols) < 2:
+            continue
+        table = scan_pairs(np.column_stack(closes), symbols, workers=api.scan_workers)
+        if len(table) == 0:
+            continue
+        top = table.iloc[0]
+        if best is None or (top.pvalue, top.half_life) < (best.pvalue, best.half_life):
+            best = top
+    if best is None:
+        return None
+    return [str(best.symbol01), str(best.symbol02)]
+
+
 # 协整检验的函数
 def cointegration_test(series01, series02):
-    urt_rb1801 = ts.adfuller(np.array(series01), 1)[1]
-    urt_rb1805 = ts.adfuller(np.array(series02), 1)[1]
+    # 与合约对扫描使用相同的ADF回归和MacKinnon p值, 选出的合约对和交易时的检验结果一致
+    series = np.column_stack([series01, series02]).astype(np.float64)
+    urt_rb1801, urt_rb1805 = adf_pvalues(batch_adf(series)[0])
     # 同时平稳或不平稳则差分再次检验
     if (urt_rb1801 > 0.1 and urt_rb1805 > 0.1) or (urt_rb1801 < 0.1 and urt_rb1805 < 0.1):
-        urt_diff_rb1801 = ts.adfuller(np.diff(np.array(series01)), 1)[1]
-        urt_diff_rb1805 = ts.adfuller(np.diff(np.array(series02)), 1)[1]
+        urt_diff_rb1801, urt_diff_rb1805 = adf_pvalues(batch_adf(np.diff(series, axis=0))[0])
         # 同时差分平稳进行OLS回归的残差平稳检验
         if urt_diff_rb1801 < 0.1 and urt_diff_rb1805 < 0.1:
             matrix = np.vstack([series02, np.ones(len(series02))]).T
             beta, c = np.linalg.lstsq(matrix, series01)[0]
             resid = series01 - beta * series02 - c
-            if ts.adfuller(np.array(resid), 1)[1] > 0.1:
+            # 残差检验使用EG两步法的临界值
+            if adf_pvalues(batch_adf(resid[:, None])[0], n_series=2)[0] > 0.1:
                 result = 0.0
             else:
                 result = 1.0
@@ -152,3 +208,76 @@ def cointegration_test(series01, series02):
     else:
         result = 0.0
         return 0.0, 0.0, 0.0, result
+
+
+class CointegrationCache(object):
+    """
+    协整检验结果缓存：
+    保存对冲比例beta, 截距c, 残差均值/标准差和检验结果, 以下两种情况需要重新检验:
+    1.距上次检验已经过了refresh_bars根bar
+    2.按检验时参数计算的标准化残差的指数均值(跨度drift_span)绝对值超过drift_threshold
+    两次检验之间用带遗忘因子的递归最小二乘(RLS)逐bar更新beta和c
+    """
+
+    def __init__(self, refresh_bars=120, drift_span=30, drift_threshold=1.5, forgetting=1.0):
+        self.refresh_bars = refresh_bars
+        self.drift_alpha = 2.0 / (drift_span + 1)
+        self.drift_threshold = drift_threshold
+        self.forgetting = forgetting
+        self.reset()
+
+    def reset(self):
+        # 清空缓存, 下一根bar重新检验
+        self.beta = 0.0
+        self.c = 0.0
+        self.resid_mean = 0.0
+        self.resid_std = 0.0
+        self.result = 0.0
+        self.base = (0.0, 0.0)
+        self.bars_since_refresh = None
+        self.drift = 0.0
+        self.theta = np.zeros(2)
+        self.cov = np.eye(2)
+
+    def needs_refresh(self):
+        if self.bars_since_refresh is None or self.bars_since_refresh >= self.refresh_bars:
+            return True
+        return abs(self.drift) > self.drift_threshold
+
+    def refresh(self, series01, series02):
+        beta, c, resid, result = cointegration_test(series01, series02)
+        self.beta, self.c, self.result = beta, c, result
+        self.bars_since_refresh = 0
+        self.drift = 0.0
+        if result:
+            self.resid_mean = np.mean(resid)
+            self.resid_std = np.std(resid)
+            self.base = (beta, c)
+            # 以检验窗口的OLS结果作为RLS的初始状态
+            matrix = np.vstack([series02, np.ones(len(series02))]).T
+            self.theta = np.array([beta, c])
+            self.cov = np.linalg.inv(np.dot(matrix.T, matrix))
+
+    def update(self, price01, price02):
+        self.bars_since_refresh += 1
+        if not self.result:
+            return
+        # 残差漂移统计量
+        if self.resid_std > 0:
+            base_beta, base_c = self.base
+            z = (price01 - base_beta * price02 - base_c - self.resid_mean) / self.resid_std
+            self.drift += self.drift_alpha * (z - self.drift)
+        # 递归最小二乘更新对冲比例
+        x = np.array([price02, 1.0])
+        px = np.dot(self.cov, x)
+        gain = px / (self.forgetting + np.dot(x, px))
+        self.theta = self.theta + gain * (price01 - np.dot(self.theta, x))
+        self.cov = (self.cov - np.outer(gain, px)) / self.forgetting
+        self.beta, self.c = self.theta
+
+    def residual(self, price01, price02):
+        return price01 - self.beta * price02 - self.c
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
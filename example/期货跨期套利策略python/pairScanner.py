@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, unicode_literals, division
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from statsmodels.tsa.adfvalues import mackinnonp
+except:
+    print('请安装statsmodels库')
+    sys.exit(-1)
+
+'''
+批量协整扫描：
+输入一个品种所有合约的收盘价矩阵(时间 x 合约), 用EG两步法一次性筛选所有合约对:
+1.对所有合约的价格和一阶差分做固定滞后阶数的ADF回归, 要求同阶单整
+2.对所有合约对做OLS回归, 对残差做ADF回归(EG临界值), 残差平稳则认为协整
+所有回归都用NumPy批量最小二乘完成, 合约对较多时分块交给进程池计算
+返回按p值和半衰期排序的协整合约对表
+'''
+
+
+def batch_adf(series, lags=1):
+    """
+    对series(T x K)的每一列做带常数项、固定滞后阶数的ADF回归:
+    dy_t = a + g * y_{t-1} + sum(phi_i * dy_{t-i}) + e_t
+    返回每列g的t统计量和g
+    """
+    series = np.asarray(series, dtype=np.float64)
+    diff = np.diff(series, axis=0)
+    y = diff[lags:].T
+    columns = [np.ones_like(y), series[lags:-1].T]
+    for i in range(1, lags + 1):
+        columns.append(diff[lags - i:-i].T)
+    x = np.stack(columns, axis=2)
+    xtx = np.einsum('knp,knq->kpq', x, x)
+    xty = np.einsum('knp,kn->kp', x, y)
+    xtx_inv = np.linalg.inv(xtx)
+    coef = np.einsum('kpq,kq->kp', xtx_inv, xty)
+    resid = y - np.einsum('knp,kp->kn', x, coef)
+    sigma2 = np.einsum('kn,kn->k', resid, resid) / (y.shape[1] - x.shape[2])
+    gamma = coef[:, 1]
+    return gamma / np.sqrt(sigma2 * xtx_inv[:, 1, 1]), gamma
+
+
+def adf_pvalues(stats, n_series=1):
+    # MacKinnon近似p值, n_series=2时为EG两步法残差检验的临界值
+    return np.array([mackinnonp(stat, regression='c', N=n_series) for stat in stats])
+
+
+def half_life(resid):
+    """
+    残差AR(1)回归 de_t = a + b * e_{t-1} 得到的均值回复半衰期(bar数), b>=0时为inf
+    """
+    lag = resid[:-1] - resid[:-1].mean(axis=0)
+    delta = np.diff(resid, axis=0)
+    delta = delta - delta.mean(axis=0)
+    b = (lag * delta).sum(axis=0) / (lag * lag).sum(axis=0)
+    life = np.full(b.shape, np.inf)
+    revert = (b < 0) & (b > -1)
+    life[revert] = -np.log(2) / np.log(1 + b[revert])
+    return life
+
+
+def evaluate_pairs(series, pairs, lags=1):
+    """
+    对pairs(P x 2)中的每个合约对, 以第一列为因变量、第二列为自变量批量做OLS回归,
+    返回beta, 截距c, 残差ADF的p值和半衰期
+    """
+    y = series[:, pairs[:, 0]]
+    x = series[:, pairs[:, 1]]
+    x_mean = x.mean(axis=0)
+    y_mean = y.mean(axis=0)
+    x_center = x - x_mean
+    beta = (x_center * (y - y_mean)).sum(axis=0) / (x_center * x_center).sum(axis=0)
+    c = y_mean - beta * x_mean
+    resid = y - beta * x - c
+    stats = batch_adf(resid, lags)[0]
+    return beta, c, adf_pvalues(stats, n_series=2), half_life(resid)
+
+
+def scan_pairs(closes, symbols, lags=1, pvalue=0.1, workers=None, min_pairs_per_worker=500):
+    """
+    closes: 时间 x 合约的收盘价矩阵, symbols: 对应的合约代码
+    workers: 进程数, None或1时在当前进程内计算; 合约对数量不足min_pairs_per_worker时也在当前进程内计算
+    返回协整合约对表, 列为symbol01, symbol02, beta, c, half_life, pvalue
+    """
+    columns = ['symbol01', 'symbol02', 'beta', 'c', 'half_life', 'pvalue']
+    closes = np.asarray(closes, dtype=np.float64)
+    # 剔除有缺失数据或价格不变的合约
+    valid = ~np.isnan(closes).any(axis=0) & (np.ptp(closes, axis=0) > 0)
+    closes = closes[:, valid]
+    symbols = [symbol for symbol, flag in zip(symbols, valid) if flag]
+    if len(symbols) < 2:
+        return pd.DataFrame(columns=columns)
+
+    # 价格和一阶差分的单位根检验
+    level_p = adf_pvalues(batch_adf(closes, lags)[0])
+    diff_p = adf_pvalues(batch_adf(np.diff(closes, axis=0), lags)[0])
+    first, second = np.triu_indices(len(symbols), k=1)
+    same_order = (level_p[first] > 0.1) == (level_p[second] > 0.1)
+    diff_stationary = (diff_p[first] < 0.1) & (diff_p[second] < 0.1)
+    pairs = np.column_stack([first, second])[same_order & diff_stationary]
+    if len(pairs) == 0:
+        return pd.DataFrame(columns=columns)
+
+    # 合约对的残差检验
+    if not workers or workers <= 1 or len(pairs) < 2 * min_pairs_per_worker:
+        beta, c, pvalues, life = evaluate_pairs(closes, pairs, lags)
+    else:
+        chunks = np.array_split(pairs, min(workers, len(pairs) // min_pairs_per_worker))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(evaluate_pairs, [closes] * len(chunks), chunks, [lags] * len(chunks)))
+        beta, c, pvalues, life = [np.concatenate(items) for items in zip(*results)]
+
+    table = pd.DataFrame({'symbol01': [symbols[i] for i in pairs[:, 0]],
+                          'symbol02': [symbols[i] for i in pairs[:, 1]],
+                          'beta': beta, 'c': c, 'half_life': life, 'pvalue': pvalues}, columns=columns)
+    table = table[table.pvalue < pvalue]
+    return table.sort_values(['pvalue', 'half_life']).reset_index(drop=True)
@@ -2,8 +2,10 @@
 # -*- coding: utf-8 -*-
 
 from etasdk import *
+from etatools import instrument
 import numpy as np
 import pandas as pd
+from etatools import FundamentalsLoader, BarPanel, RollingFactorModel
 
 '''
 股票策略：多因子选股
@@ -11,7 +13,8 @@ import pandas as pd
 策略思路：
 计算市场收益率,并对个股的账面市值比和市值进行分类,
 根据分类得到的组合计算市值加权收益率、SMB和HML. 
-对各个股票进行回归(无风险收益率等于0)得到alpha值.
+对各个股票进行回归(无风险收益率等于0)得到alpha值: 积累满60个交易日后, 用最近60日的因子日收益率做时间序列回归,
+之前用区间收益率做截面回归.
 选取alpha值小于0并为最小的10只股票进入标的池
 等权买入在标的池的股票并卖出不在标的池的股票
 回测数据:000300.IDX的成份股
@@ -25,18 +28,20 @@ def onInitialize(api):
     api.dataWindow = 20
     # 设置开仓的最大资金量
     api.ratio = 0.8
-    # 账面市值比的大/中/小分类
-    api.BM_BIG = 3.0
-    api.BM_MID = 2.0
-    api.BM_SMA = 1.0
-    # 市值大/小分类
-    api.MV_BIG = 2.0
-    api.MV_SMA = 1.0
+    # 基准指数, 用于计算市场收益率
+    api.index = "000300.IDX"
     # 持仓股票
     api.symbols_pool = []
+    # 市场/SMB/HML日收益率的滚动时间序列回归, 窗口天数
+    api.factorWindow = 60
+    api.factorModel = RollingFactorModel(api.factorWindow, ['market', 'SMB', 'HML'])
+    # 股票池日K线面板, 每天只追加一根K线
+    api.panel = BarPanel(api, api.dataWindow + 1, ETimeSpan.DAY_1, EPriceMode.FORMER)
+    # 截面基本面数据, 每个交易日一次批量请求
+    api.fundamentals = FundamentalsLoader(api, ['MKT_CAP', "PB"])
     # 设置股票池，因子以及K线类型
-    api.setRequireData(instsets=["000300.IDX"], # 000300成分股
-                       symbols=["000300.IDX"], # 000300指数
+    api.setRequireData(instsets=[api.index], # 000300成分股
+                       symbols=[api.index], # 000300指数
                        fields=['MKT_CAP', "PB"],
                        bars=[(ETimeSpan.DAY_1, api.dataWindow + 10)]
                        )
@@ -49,104 +54,56 @@ def onBeforeMarketOpen(api,tradeDate):
     # 获取股票池
     symbolPool = api.getSymbolPool()
 
-    fundamentalDf = pd.DataFrame(columns=["symbol", 'MKT_CAP', "PB"])
-    # 获取基本面数据
-    for symbol in symbolPool:
-        # 检查股票是否停牌，不交易停牌股票
-        if api.isSuspend(symbol, tradeDate):
-            continue
-        # 获取基本面数据
-        fundamentals = api.getFieldsCountDays(symbol=symbol, fields=['MKT_CAP', "PB"], count=1)
-        fundamentalDf.loc[len(fundamentalDf)] = {"symbol":symbol, "MKT_CAP": fundamentals.MKT_CAP.values[-1], "PB":fundamentals.PB.values[-1]}
+    # 股票池日K线
+    api.panel.update(tradeDate, list(symbolPool) + [api.index])
+
+    # 获取基本面数据, 当日停牌的股票在选股时排除
+    fundamentals = api.fundamentals.load(symbolPool, tradeDate).dropna()
+    fundamentalDf = pd.DataFrame({"symbol": fundamentals.index.values, 'MKT_CAP': fundamentals.MKT_CAP.values,
+                                  "PB": fundamentals.PB.values}, columns=["symbol", 'MKT_CAP', "PB"])
 
     # 计算账面市值比, PB倒数
     fundamentalDf["PB"] = (fundamentalDf['PB'] ** -1)
 
-    # 计算市值的50%的分位点, 用于分类
+    # 计算区间收益率, 数据不足或前一交易日没有K线的股票不参与
+    rows = api.panel.rows(fundamentalDf.symbol.values)
+    counts = api.panel.valid_counts(rows)
+    close = api.panel.close
+    valid = (counts >= api.dataWindow) & ~np.isnan(close[rows, -1])
+    rows = rows[valid]
+    stockReturn = close[rows, -1] / close[rows, api.panel.first_valid(rows)] - 1
+    indexClose = close[api.panel.rows([api.index])[0]]
+    market_return = indexClose[-1] / indexClose[0] - 1
+
+    # 市值按50%分位点, 账面市值比按30%和70%分位点分类
     sizeGate = fundamentalDf['MKT_CAP'].quantile(0.50)
-
-    # 计算账面市值比的30%和70%分位点,用于分类
     bm_gate = [fundamentalDf['PB'].quantile(0.30), fundamentalDf['PB'].quantile(0.70)]
-    fundamentalDf.index = fundamentalDf.symbol
-    x_return = []
-
-    # 计算return
-    tickerCloseValues = {}
-    for symbol in fundamentalDf.symbol.values:
-        price = api.getBarsHistory(symbol, timeSpan=ETimeSpan.DAY_1, count=api.dataWindow + 1, df=True, \
-                                   priceMode=EPriceMode.FORMER, skipSuspended=0)
-        if len(price) < api.dataWindow:
-            continue
-        price.fillna(method="ffill")
-
-        stockReturn = price.close.values[-1] / price.close.values[0] - 1
-        pb = fundamentalDf['PB'][symbol]
-        market_value = fundamentalDf['MKT_CAP'][symbol]
-        tickerCloseValues[symbol] = price.close.values[-1]
-        # 获取[股票代码. 股票收益率, 账面市值比的分类, 市值的分类, 流通市值]
-        if pb < bm_gate[0]:
-            if market_value < sizeGate:
-                label = [symbol, stockReturn, api.BM_SMA, api.MV_SMA, market_value]
-            else:
-                label = [symbol, stockReturn, api.BM_SMA, api.MV_BIG, market_value]
-        elif pb < bm_gate[1]:
-            if market_value < sizeGate:
-                label = [symbol, stockReturn, api.BM_MID, api.MV_SMA, market_value]
-            else:
-                label = [symbol, stockReturn, api.BM_MID, api.MV_BIG, market_value]
-        elif market_value < sizeGate:
-            label = [symbol, stockReturn, api.BM_BIG, api.MV_SMA, market_value]
-        else:
-            label = [symbol, stockReturn, api.BM_BIG, api.MV_BIG, market_value]
-
-        if len(x_return) == 0:
-            x_return = label
-        else:
-            x_return = np.vstack([x_return, label])
-
-    stocks = pd.DataFrame(data=x_return, columns=['symbol', 'return', 'BM', 'MKT_CAP', 'mv'])
-    stocks.index = stocks.symbol
-    columns = ['return', 'BM', 'MKT_CAP', 'mv']
-    for column in columns:
-        stocks[column] = stocks[column].astype(np.float64)
-
-    # 计算SMB.HML和市场收益率
-    # 获取小市值组合的市值加权组合收益率
-    smb_s = (market_weighted_return(stocks, api.MV_SMA, api.BM_SMA) +
-             market_weighted_return(stocks, api.MV_SMA, api.BM_MID) +
-             market_weighted_return(stocks, api.MV_SMA, api.BM_BIG)) / 3
-
-    # 获取大市值组合的市值加权组合收益率
-    smb_b = (market_weighted_return(stocks, api.MV_BIG, api.BM_SMA) +
-             market_weighted_return(stocks, api.MV_BIG, api.BM_MID) +
-             market_weighted_return(stocks, api.MV_BIG, api.BM_BIG)) / 3
-
-    smb = smb_s - smb_b
-    # 获取大账面市值比组合的市值加权组合收益率
-    hml_b = (market_weighted_return(stocks, api.MV_SMA, 3) +
-             market_weighted_return(stocks, api.MV_BIG, api.BM_BIG)) / 2
-    # 获取小账面市值比组合的市值加权组合收益率
-    hml_s = (market_weighted_return(stocks, api.MV_SMA, api.BM_SMA) +
-             market_weighted_return(stocks, api.MV_BIG, api.BM_SMA)) / 2
-
-    hml = hml_b - hml_s
-    close = api.getBarsHistory(symbol, timeSpan=ETimeSpan.DAY_1, count=api.dataWindow + 1, df=True, \
-                                   priceMode=EPriceMode.FORMER, skipSuspended=1)["close"].values
-    market_return = close[-1] / close[0] - 1
-    coff_pool = []
-
-    # 对每只股票进行回归获取其alpha值
-    for stock in stocks.index:
-        x_value = np.array([[market_return], [smb], [hml], [1.0]])
-        y_value = np.array([stocks['return'][stock]])
-        # OLS估计系数
-        coff = np.linalg.lstsq(x_value.T, y_value)[0][3]
-        coff_pool.append(coff)
-
-    # 获取alpha最小并且小于0的10只的股票进行操作(若少于10只则全部买入)
-    stocks['alpha'] = coff_pool
-    stocks = stocks[stocks.alpha < 0].sort_values(by='alpha').head(10)
-    api.symbols_pool = stocks.index.tolist()
+    market_value = fundamentalDf['MKT_CAP'].values[valid]
+    bm_class, mv_class = assign_buckets(fundamentalDf['PB'].values[valid], market_value, bm_gate, sizeGate)
+
+    # 计算SMB.HML
+    portfolios = portfolio_returns(stockReturn, market_value, bm_class, mv_class)
+    smb, hml = smb_hml(portfolios)
+
+    # 用前一交易日的收益率更新滚动因子模型
+    symbols = fundamentalDf.symbol.values[valid]
+    dailyReturn = close[rows, -1] / close[rows, -2] - 1
+    traded = ~np.isnan(dailyReturn)
+    daily_smb, daily_hml = smb_hml(portfolio_returns(dailyReturn[traded], market_value[traded],
+                                                     bm_class[traded], mv_class[traded]))
+    api.factorModel.update([indexClose[-1] / indexClose[-2] - 1, daily_smb, daily_hml], symbols, dailyReturn)
+
+    # 滚动窗口已满时使用时间序列回归的alpha, 否则所有股票一次截面回归获取alpha值
+    if api.factorModel.ready:
+        alpha = api.factorModel.fit(symbols)['alpha'].values
+    else:
+        alpha = factor_alphas(stockReturn, [market_return, smb, hml])
+    stocks = pd.DataFrame({'return': stockReturn, 'mv': market_value, 'alpha': alpha},
+                          index=symbols, columns=['return', 'mv', 'alpha'])
+
+    # 获取alpha最小并且小于0的10只的股票进行操作(若少于10只则全部买入), 不交易当日停牌的股票
+    stocks = stocks[stocks.alpha < 0].sort_values(by='alpha', kind='mergesort')
+    api.symbols_pool = pick_unsuspended(api, stocks.index, 10, tradeDate)
 
     # 设置当天需要交易的股票，如果历史上有过持仓了，则系统会默认自动关注
     api.setFocusSymbols(api.symbols_pool )
@@ -202,16 +159,41 @@ def onTerminate(api,exitInfo):
     LOG.INFO ("***************onTerminate*********")
     print ("***************onTerminate*********")
 
-# 计算市值加权的收益率,MV为市值的分类,BM为账目市值比的分类
-def market_weighted_return(stocksValues, MV_class, BM_class):
-    select = stocksValues[(stocksValues.MKT_CAP == MV_class) & (stocksValues.BM == BM_class)]
-    marketValue = select['mv'].values
-    mvTotal = np.sum(marketValue)
-    mvWeighted = [mv / mvTotal for mv in marketValue]
-    stock_return = select['return'].values
-    # 返回市值加权的收益率的和
-    returnTotal = []
-    for i in range(len(mvWeighted)):
-        returnTotal.append(mvWeighted[i] * stock_return[i])
-    return_total = np.sum(returnTotal)
-    return return_total
\ No newline at end of file
+# 按分位点分类: 账面市值比 0小/1中/2大, 市值 0小/1大
+def assign_buckets(bm, market_value, bm_gate, size_gate):
+    bm_class = np.searchsorted(bm_gate, bm, side='right')
+    mv_class = np.searchsorted([size_gate], market_value, side='right')
+    return bm_class, mv_class
+
+# 六个组合的市值加权收益率, 形状为(市值分类, 账面市值比分类), 没有股票的组合收益率为0
+def portfolio_returns(stock_return, market_value, bm_class, mv_class):
+    group = mv_class * 3 + bm_class
+    mv_total = np.bincount(group, weights=market_value, minlength=6)
+    return_total = np.bincount(group, weights=market_value * stock_return, minlength=6)
+    return (return_total / np.where(mv_total != 0, mv_total, 1)).reshape(2, 3)
+
+def smb_hml(portfolios):
+    # 小市值组合减大市值组合, 大账面市值比组合减小账面市值比组合
+    smb = portfolios[0].mean() - portfolios[1].mean()
+    hml = portfolios[:, 2].mean() - portfolios[:, 0].mean()
+    return smb, hml
+
+# 所有股票共用同一组因子, 用一次多右端项的最小二乘求解全部股票的系数, 返回截距alpha
+def factor_alphas(stock_return, factors):
+    x_value = np.append(factors, 1.0).reshape(1, -1)
+    coff = np.linalg.lstsq(x_value, np.reshape(stock_return, (1, -1)), rcond=None)[0]
+    return coff[-1]
+
+# 按排序依次检查当日是否停牌, 选出count只未停牌的股票; 只查询排在前面的股票
+def pick_unsuspended(api, symbols, count, trade_date):
+    chosen = []
+    for symbol in symbols:
+        if len(chosen) >= count:
+            break
+        if not api.isSuspend(symbol, trade_date):
+            chosen.append(symbol)
+    return chosen
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
@@ -1,4 +1,8 @@
 # coding=utf-8
+import os
+import sys
+# 加入仓库根目录, 以便策略使用etatools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
 from etasdk import *
 
 if __name__ == '__main__':
@@ -2,7 +2,8 @@
 from __future__ import print_function, absolute_import, unicode_literals, division
 import numpy as np
 from etasdk import *
-from talib import EMA
+from etatools import instrument
+from etatools import BarPanel, ParallelEvaluator
 
 '''
 本策略为股票个股择时，等资金分配仓位。
@@ -33,6 +34,8 @@ def onInitialize(api):
     ##  全局参数
     api.dataLen = 200  # 每次下载的数据长度
     api.setRequireBars(ETimeSpan.DAY_1, api.dataLen)
+    # 股票池日K线面板, 每天只追加一根K线
+    api.panel = BarPanel(api, api.dataLen, ETimeSpan.DAY_1, EPriceMode.FORMER)
     account = api.getAccount(symbol=api.index, market=MARKET_CHINASTOCK)
     api.capital = account.cashAvailable  # 账户初始资金（100万）
 
@@ -40,6 +43,12 @@ def onInitialize(api):
     api.windows_SMA        = 5   # 短期移动平均窗口
     api.windows_LMA        = 20  # 长期移动平均窗口
     api.windows_LLMA       = 120  # 更长周期移动平均窗口
+    # 股票池EMA信号, 每天增量更新; 全量重算的进程数, None为在当前进程内计算, 全市场股票池可设为CPU核数
+    api.signal_workers = None
+    api.engine = EMASignalEngine(api.panel, api.windows_SMA, api.windows_LMA,
+                                 evaluator=ParallelEvaluator(api.signal_workers))
+    # 持仓的收盘价和最高价缓存, 用于止损止盈; 由成交增量更新, 每20个交易日全量对账一次
+    api.holdings = HoldingsCache(api.panel, window=90, reconcile=20)
 
     ## 临界值类
     api.stop_method = 1
@@ -58,7 +67,14 @@ def onBeforeMarketOpen(api, trade_date):
     LOG.INFO("tradingday:%s", trade_date)
 
     api.tradeday.append(trade_date)
-    api.symbolPool = api.getSymbolPool()
+    api.symbolPool = list(api.getSymbolPool())
+
+    ## 更新行情数据, 已调出股票池的持仓股票也保留在面板中
+    api.holdings.begin_day(api)
+    pool = set(api.symbolPool)
+    api.panel.update(trade_date, api.symbolPool + [symbol for symbol in api.holdings.symbols if symbol not in pool])
+    api.engine.sync()
+    api.holdings.update()
 
     ## 止损平仓
     stop_loss(api)
@@ -71,14 +87,12 @@ def onBeforeMarketOpen(api, trade_date):
     api.setFocusSymbols(api.price.keys())
 
     # 根据持仓信息，处理持仓股票。平掉不在信号池中的股票
-    symbolpositions = api.getSymbolPositions()
-    print("symbol before close", len(symbolpositions))
-    for position in symbolpositions:
-        if api.isSuspend(position.symbol, api.getCurrTradeDate()):
+    print("symbol before close", len(api.holdings.symbols))
+    for symbol in list(api.holdings.symbols):
+        if api.isSuspend(symbol, api.getCurrTradeDate()):
             continue
-        if position.symbol not in api.price.keys():
-            api.targetPosition(symbol=position.symbol, qty=0, positionSide=EPositionSide.LONG,
-                               remark="not in signal pool")
+        if symbol not in api.price.keys():
+            api.holdings.order(api, symbol, 0, positionSide=EPositionSide.LONG, remark="not in signal pool")
 
 def onHandleData(api, timeExch):
 
@@ -90,11 +104,9 @@ def onHandleData(api, timeExch):
     ratio_by_index = 0.9  # %90%仓位，可根据大盘走势进行调整
     account = api.getAccount(symbol=api.index, market=MARKET_CHINASTOCK)
     capital = account.totAssets * ratio_by_index - account.marketValue
-    # 获取止损和平仓后的持仓
-    holdingPos = []
-    symbolpositions = api.getSymbolPositions()
-    for position in symbolpositions:
-        holdingPos.append(position.symbol)
+    # 获取止损和平仓后的持仓, 只查询有未完成下单的股票
+    api.holdings.settle(api)
+    holdingPos = api.holdings.symbols
     newSymbols = list(set(api.price.keys()) - set(holdingPos))
     # 检查是否有新标的需要买入
     if len(newSymbols) == 0:
@@ -116,86 +128,309 @@ def onHandleData(api, timeExch):
         finalQty = symbolPosition.posQty + int(deltaQty / 100) * 100
         finalQty = max(finalQty, 0)
 
-        api.targetPosition(symbol=symbol, qty=finalQty, positionSide=EPositionSide.LONG, remark="open new")
+        api.holdings.order(api, symbol, finalQty, positionSide=EPositionSide.LONG, remark="open new")
         print("open  new long postion:", symbol, finalQty)
         LOG.INFO("open  new long postion:" + str(symbol) + " " + str(finalQty))
 
 
 def onTerminate(api, exit_info):
-    pass
+    api.engine.close()
+
+class VectorEMA(object):
+    """
+    一组序列的EMA, 每个元素独立计算:
+    前period个有效值的均值作为初值(与talib一致), 之后 ema += alpha * (x - ema); 缺失值(nan)不更新
+    value为最新值, prev为上一次更新前的值, count为已处理的有效值个数
+    """
+
+    def __init__(self, period, size):
+        self.period = period
+        self.alpha = 2. / (period + 1)
+        self.value = np.full(size, np.nan)
+        self.prev = np.full(size, np.nan)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.total = np.zeros(size)
+
+    def reset(self, index):
+        self.value[index] = np.nan
+        self.prev[index] = np.nan
+        self.count[index] = 0
+        self.total[index] = 0.
+
+    def grow(self, size):
+        extra = size - len(self.value)
+        self.value = np.concatenate([self.value, np.full(extra, np.nan)])
+        self.prev = np.concatenate([self.prev, np.full(extra, np.nan)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(extra)])
+
+    def update(self, index, x):
+        valid = ~np.isnan(x)
+        value = self.value[index]
+        count = self.count[index] + valid
+        total = self.total[index] + np.where(valid & (count <= self.period), x, 0.)
+        self.prev[index] = np.where(valid, value, self.prev[index])
+        value = np.where(valid & (count == self.period), total / self.period, value)
+        value = np.where(valid & (count > self.period), value + self.alpha * (x - value), value)
+        self.value[index] = value
+        self.count[index] = count
+        self.total[index] = total
+        return value
+
+
+class EMAStates(object):
+    """
+    择时信号用到的全部EMA状态: 收盘价的短/长均线, 双重平滑均线和前一根K线为止的量均线
+    """
+
+    def __init__(self, size, short=5, long=20, double=8, volume=20):
+        self.ema_short = VectorEMA(short, size)
+        self.ema_long = VectorEMA(long, size)
+        self.ema_double = VectorEMA(double, size)
+        self.ema_double2 = VectorEMA(double, size)
+        self.ema_volume = VectorEMA(volume, size)
+        self.emas = (self.ema_short, self.ema_long, self.ema_double, self.ema_double2, self.ema_volume)
+        self.last_volume = np.full(size, np.nan)
+
+    def grow(self, size):
+        for ema in self.emas:
+            ema.grow(size)
+        self.last_volume = np.concatenate([self.last_volume, np.full(size - len(self.last_volume), np.nan)])
+
+    def step(self, index, close, volume):
+        self.ema_short.update(index, close)
+        self.ema_long.update(index, close)
+        double = self.ema_double.update(index, close)
+        ready = ~np.isnan(close) & (self.ema_double.count[index] >= self.ema_double.period)
+        self.ema_double2.update(index, np.where(ready, double, np.nan))
+        # 量的均线只用到前一根K线
+        self.ema_volume.update(index, self.last_volume[index])
+        self.last_volume[index] = volume
+
+    def export(self, index):
+        # 每行一个状态向量, 用于在进程间传递
+        columns = [self.last_volume[index]]
+        for ema in self.emas:
+            columns.extend([ema.value[index], ema.prev[index], ema.count[index], ema.total[index]])
+        return np.column_stack(columns)
+
+    def load(self, index, states):
+        self.last_volume[index] = states[:, 0]
+        for i, ema in enumerate(self.emas):
+            ema.value[index] = states[:, 4 * i + 1]
+            ema.prev[index] = states[:, 4 * i + 2]
+            ema.count[index] = states[:, 4 * i + 3]
+            ema.total[index] = states[:, 4 * i + 4]
+
+
+def ema_states(arrays, short, long, double, volume):
+    """
+    用完整窗口从头计算一组股票的EMA状态, 返回EMAStates.export格式的矩阵, 可以在子进程中执行
+    """
+    close = arrays['close']
+    states = EMAStates(len(close), short, long, double, volume)
+    index = np.arange(len(close))
+    for column in range(close.shape[1]):
+        states.step(index, close[:, column], arrays['volume'][:, column])
+    return states.export(index)
+
+
+class EMASignalEngine(object):
+    """
+    股票池择时信号的增量计算:
+    以BarPanel的行为下标保存全部股票的EMA状态, 面板每追加一根K线只做一次向量化更新;
+    新分配或重新下载(如复权变化)的行用面板中的完整窗口重算, 行数较多时由evaluator分给多个进程计算
+    """
+
+    def __init__(self, panel, short=5, long=20, double=8, volume=20, evaluator=None):
+        self.panel = panel
+        self.periods = (short, long, double, volume)
+        self.states = EMAStates(len(panel.symbols), *self.periods)
+        self.evaluator = evaluator if evaluator is not None else ParallelEvaluator()
+        self.version = np.full(len(panel.symbols), -1, dtype=np.int64)
+        self.last_date = None
+
+    def seed(self, index):
+        arrays = {'close': self.panel.close[index], 'volume': self.panel.volume[index]}
+        self.states.load(index, self.evaluator.map(ema_states, arrays, self.periods))
+        self.version[index] = self.panel.filled[index]
+
+    def sync(self):
+        """
+        在panel.update之后调用, 把所有行的状态推进到面板最新的K线
+        """
+        panel = self.panel
+        if len(panel.symbols) > len(self.version):
+            self.states.grow(len(panel.symbols))
+            extra = len(panel.symbols) - len(self.version)
+            self.version = np.concatenate([self.version, np.full(extra, -1, dtype=np.int64)])
+        rows = np.array(sorted(panel.slot.values()), dtype=np.int64)
+        dates = panel.trade_dates
+        if self.last_date == dates[-1]:
+            stale = self.version[rows] != panel.filled[rows]
+        elif self.last_date is not None and len(dates) > 1 and dates[-2] == self.last_date:
+            stale = self.version[rows] != panel.filled[rows]
+            fresh = rows[~stale]
+            self.states.step(fresh, panel.close[fresh, -1], panel.volume[fresh, -1])
+        else:
+            stale = np.ones(len(rows), dtype=bool)
+        if stale.any():
+            self.seed(rows[stale])
+        self.last_date = dates[-1]
+
+    def signal(self, rows):
+        """
+        短均线在长均线之上, 或放量且双重平滑均线上涨时为1
+        """
+        states = self.states
+        trend = states.ema_short.value[rows] > states.ema_long.value[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily_ret = np.log(states.ema_double2.value[rows]) - np.log(states.ema_double2.prev[rows])
+        burst = (states.last_volume[rows] > 2. * states.ema_volume.value[rows]) & (daily_ret > 0)
+        return (burst | trend) & ~np.isnan(self.panel.close[rows, -1])
+
+    def close(self):
+        self.evaluator.close()
+
 
 def timeAlgorithm(api):
     price = {}
-    for symbol in api.symbolPool:
-        ## 下载行情数据
-        HQData = api.getBarsHistory(symbol, timeSpan=ETimeSpan.DAY_1, count=api.dataLen, df=True, \
-                               priceMode=EPriceMode.FORMER, skipSuspended=0)
-        # 新股排除
-        if len(HQData) <= 120:
-            continue
-
+    rows = api.panel.rows(api.symbolPool)
+    # 新股排除
+    listed = api.panel.valid_counts(rows) > 120
+    signal = calculateSignal(api, rows) & listed
+    close = api.panel.close
+    for symbol, row in zip(np.array(api.symbolPool)[signal], rows[signal]):
         # 检查标的是否停牌
         if api.isSuspend(symbol, api.getCurrTradeDate()):
             continue
-
-        # 根据模型计算开仓信号
-        if calculateSignal(api, HQData) == 1:
-            price[symbol] = HQData.close.values[-1]
+        price[symbol] = close[row, -1]
     return price
-def calculateSignal(api,HQData):
-    if np.isnan(HQData.close.values[-1]):
-        return 0
 
-    close = HQData.close.values
-    closeSMA = EMA(close, api.windows_SMA)[-1]
-    closeLMA = EMA(close, api.windows_LMA)[-1]
+def calculateSignal(api, rows):
+    # 根据模型计算全部股票的开仓信号
+    return api.engine.signal(rows)
+
+
+class HoldingsCache(object):
+    """
+    持仓缓存, 按symbols的顺序保存每只持仓股票的数量、成本、最新收盘价、最近window根K线中的有效K线数和持仓以来的最高价:
+    策略通过order下单并记录目标仓位, settle只查询有未完成目标仓位的股票, 用成交后的持仓增量更新缓存;
+    begin_day每reconcile个交易日用getSymbolPositions全量对账一次, 处理分红送股等策略之外的持仓变化;
+    update在面板更新后用最新K线更新收盘价、最高价和K线数
+    """
 
-    signal01 = 1 if (closeSMA > closeLMA) else 0
+    def __init__(self, panel, window=90, reconcile=20):
+        self.panel = panel
+        self.window = window
+        self.reconcile = reconcile
+        self.days = None
+        self.pending = {}
+        self.symbols = []
+        self.qty = np.zeros(0)
+        self.cost = np.zeros(0)
+        self.close = np.zeros(0)
+        self.high = np.zeros(0)
+        self.bars = np.zeros(0, dtype=np.int64)
+
+    def begin_day(self, api):
+        # 盘前调用: 到了对账日全量同步, 否则只处理未完成的下单
+        if self.days is None or self.days + 1 >= self.reconcile:
+            self.sync(api.getSymbolPositions())
+            # 前一交易日收盘前下的单在今天开盘才成交, 对账后仍保留未达到的目标仓位
+            held = dict(zip(self.symbols, self.qty))
+            self.pending = dict((symbol, target) for symbol, target in self.pending.items()
+                                if held.get(symbol, 0) != target)
+            self.days = 0
+        else:
+            self.settle(api)
+            self.days += 1
+
+    def order(self, api, symbol, qty, **kwargs):
+        api.targetPosition(symbol=symbol, qty=qty, **kwargs)
+        self.pending[symbol] = qty
+
+    def settle(self, api):
+        for symbol, target in list(self.pending.items()):
+            position = api.getSymbolPosition(symbol)
+            qty = position.posQty if position else 0
+            self.apply(symbol, position if qty > 0 else None)
+            # 未成交(如停牌)的目标仓位保留到成交或重新下单
+            if qty == target:
+                del self.pending[symbol]
+
+    def apply(self, symbol, position):
+        # 用一只股票的最新持仓更新缓存, position为None表示已经平仓
+        if symbol in self.symbols:
+            i = self.symbols.index(symbol)
+            if position is None:
+                del self.symbols[i]
+                self.qty, self.cost, self.close, self.high, self.bars = [
+                    np.delete(values, i) for values in (self.qty, self.cost, self.close, self.high, self.bars)]
+                return
+            self.qty[i] = position.posQty
+            self.cost[i] = position.posPrice
+            self.high[i] = np.fmax(self.high[i], position.posHigh)
+        elif position is not None:
+            self.symbols.append(symbol)
+            self.qty = np.append(self.qty, float(position.posQty))
+            self.cost = np.append(self.cost, float(position.posPrice))
+            self.close = np.append(self.close, np.nan)
+            self.high = np.append(self.high, float(position.posHigh))
+            self.bars = np.append(self.bars, 0)
+
+    def sync(self, positions):
+        held = [position for position in positions or [] if position.posQty > 0]
+        index = dict((symbol, i) for i, symbol in enumerate(self.symbols))
+        old = np.array([index.get(position.symbol, -1) for position in held], dtype=np.int64)
+        kept = old >= 0
+        self.symbols = [position.symbol for position in held]
+        self.qty = np.array([position.posQty for position in held], dtype=np.float64)
+        self.cost = np.array([position.posPrice for position in held], dtype=np.float64)
+        high = np.array([position.posHigh for position in held], dtype=np.float64)
+        close = np.full(len(held), np.nan)
+        bars = np.zeros(len(held), dtype=np.int64)
+        if kept.any():
+            high[kept] = np.fmax(high[kept], self.high[old[kept]])
+            close[kept] = self.close[old[kept]]
+            bars[kept] = self.bars[old[kept]]
+        self.high, self.close, self.bars = high, close, bars
+
+    def update(self):
+        rows = self.panel.rows(self.symbols)
+        index = np.flatnonzero(rows >= 0)
+        rows = rows[index]
+        close = self.panel.close[rows, -1]
+        self.close[index] = np.where(np.isnan(close), self.close[index], close)
+        self.high[index] = np.fmax(self.high[index], self.panel.high[rows, -1])
+        self.bars[index] = np.count_nonzero(~np.isnan(self.panel.close[rows, -self.window:]), axis=1)
 
-    volume = HQData.volume.values
-    volumeMA = EMA(volume[:-1],20)
-    closeSMADouble08 = EMA(EMA(close, 8), 8)
-    dailyRet = np.log(closeSMADouble08[-1]) - np.log(closeSMADouble08[-2])
-    signal = 1 if (volume[-1] > 2.*volumeMA[-1]) and (dailyRet>0) else signal01
-    return signal
 
 def stop_loss(api):
-    # 移动止损止盈
-    positionQty, positionHigh, positionClose = queryPosition(api)
-    for ind in positionQty.keys():
+    # 移动止损止盈, 对全部持仓一次比较
+    holdings = api.holdings
+    if api.stop_method != 1 or not holdings.symbols:
+        return
+    listed = holdings.bars >= 60
+    with np.errstate(invalid='ignore'):
+        # 止损
+        drawdown = np.log(holdings.high / holdings.cost)
+        dropline = holdings.high * np.where(drawdown < 0.10, 0.90, 0.94)
+        stop = listed & (holdings.close <= dropline)
+        # 止盈
+        take = listed & ((holdings.close / holdings.cost) - 1 >= 0.15)
+    for i in np.flatnonzero(stop | take):
+        ind = holdings.symbols[i]
         # 检查标的是否停牌
         if api.isSuspend(ind, api.getCurrTradeDate()):
             continue
-        hist_data = api.getBarsHistory(ind, timeSpan=ETimeSpan.DAY_1, count=90, df=True,
-                                       priceMode=EPriceMode.FORMER)
-        if len(hist_data) >= 60:
-            close = hist_data.close.values
-            if api.stop_method == 1:
-                # 止损
-                drawdown = np.log(positionHigh[ind] / positionClose[ind])
-                if drawdown < 0.10:
-                    dropline = positionHigh[ind] * 0.90
-                else:
-                    dropline = positionHigh[ind] * 0.94
-                if (close[-1] <= dropline):
-                    api.targetPosition(symbol=ind, qty=0, positionSide=EPositionSide.LONG,remark="stop loss")
-                    print(api.tradeday[-1], ",stop loss:", ind)
-                # 止盈
-                if (((close[-1] / positionClose[ind]) - 1) >= 0.15):
-                    api.targetPosition(symbol=ind, qty=0, positionSide=EPositionSide.SHORT)
-                    print(api.tradeday[-1], ",stop return", ind)
-
-def queryPosition(api):
-    # #  查询持仓
-    positionQty = {}
-    positionHigh = {}
-    positionClose = {}
-    symbolpositions = api.getSymbolPositions()
-    if not symbolpositions:
-        return positionQty,positionHigh,positionClose
-    else:
-        for ind in symbolpositions:
-            positionQty[ind.symbol] = ind.posQty
-            positionHigh[ind.symbol] = ind.posHigh
-            positionClose[ind.symbol] = ind.posPrice
-        return positionQty,positionHigh,positionClose
+        if stop[i]:
+            api.holdings.order(api, ind, 0, positionSide=EPositionSide.LONG, remark="stop loss")
+            print(api.tradeday[-1], ",stop loss:", ind)
+        if take[i]:
+            api.holdings.order(api, ind, 0, positionSide=EPositionSide.SHORT)
+            print(api.tradeday[-1], ",stop return", ind)
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
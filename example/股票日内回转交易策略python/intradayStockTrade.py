@@ -3,20 +3,19 @@
 
 from __future__ import print_function, absolute_import, unicode_literals, division
 from etasdk import *
-import sys
-
-try:
-    import talib
-except:
-    print('请安装TA-Lib库')
-    sys.exit(-1)
+from etatools import instrument
+import time
+import datetime
+import numpy as np
 
 '''
-本策略为股票日内回转交易。
-1、首先买入600000.CS股票10000股底仓；
+本策略为股票日内回转交易, 支持同时对一篮子股票做T+0。
+1、首先买入每只股票10000股底仓；
 2、根据分钟数据计算MACD(12,26,9)：
 在MACD>0的时候买入100股;在MACD<0的时候卖出100股
 3、每日操作的股票数不超过原有仓位,并于收盘前把仓位调整至开盘前的仓位
+每只股票的状态(底仓、当日回转数量、收盘标志、可平仓数量、MACD)按股票序号保存在数组中,
+每次按组回调时对所有股票一次性计算信号
 撮合周期为:600000.CS分钟数据
 回测时间为:2018-09-03 到2018-10-01
 其他参数：按系统默认设置
@@ -27,92 +26,244 @@ def onInitialize(api):
     ## 全局参数设置
     print("SDK version:", GlobalConfig.getVersion())
     # 设置标的股票
-    api.symbol = '600000.CS'
+    api.symbols = ['600000.CS']
+    api.slot = dict((symbol, i) for i, symbol in enumerate(api.symbols))
     # 订阅标的
-    api.setSymbolPool(instsets=[], symbols=[api.symbol])
+    api.setSymbolPool(instsets=[], symbols=api.symbols)
     api.setGroupMode(1000, False)
     # 设置行情数据缓存条数
     api.init_data_len = 120  # 数据长度
     api.setRequireBars(ETimeSpan.MIN_1, api.init_data_len)
 
+    count = len(api.symbols)
     # 底仓
-    api.total = 10000
+    api.total = np.full(count, 10000, dtype=np.int64)
     # 用于判定第一个仓位是否成功开仓
-    api.first = 0
+    api.first = np.zeros(count, dtype=bool)
     # 日内回转每次交易100股
     api.trade_n = 100
-    # 交易日
-    api.tradeDate = [0, 0]
-    # 每日仓位
-    api.turnaround = [0, 0]
+    # 每日仓位, 第一列为累计买入, 第二列为累计卖出
+    api.turnaround = np.zeros((count, 2), dtype=np.int64)
     # 用于判断是否触发了回转逻辑的计时
-    api.ending = 0
+    api.ending = np.zeros(count, dtype=bool)
     # 当日可平仓数量
-    api.availableQty = 0
+    api.availableQty = np.zeros(count, dtype=np.int64)
+    # 最新收盘价以及本组内收到新bar的股票
+    api.last_close = np.full(count, np.nan)
+    api.updated = np.zeros(count, dtype=bool)
+    # 增量计算的MACD, 每只股票首根bar时用历史数据初始化
+    api.macd = BasketMACD(count)
+    # 交易时段时钟, 收盘前回复仓位的时间
+    api.clock = SessionClock()
+    api.ending_minute = api.clock.session_minute(1455)
 
 
 def onBeforeMarketOpen(api, trade_date):
     print("交易日：", trade_date)
     # 每日开盘前订阅行情
-    api.setFocusSymbols(api.symbol)
-    print("订阅%s的行情" % api.symbol)
+    api.setFocusSymbols(api.symbols)
+    print("订阅%s的行情" % api.symbols)
+    api.clock.set_trade_date(trade_date)
+    # 新的一天重置回转数量和收盘标志
+    api.turnaround[:] = 0
+    api.ending[:] = False
     # 查询当日可平仓数量
-    api.availableQty = api.getSymbolPosition(symbol=api.symbol, positionSide=EPositionSide.LONG)
+    for i, symbol in enumerate(api.symbols):
+        api.availableQty[i] = api.getSymbolPosition(symbol=symbol, positionSide=EPositionSide.LONG).availableQty
 
 
 def onBar(api, bar):
-    if api.first == 0:
-        # 购买10000股'600000.CS'股票
-        api.targetPosition(symbol=bar.symbol, qty=api.total, positionSide=EPositionSide.LONG,
-                           remark="open new position")
-        print("open in new long postion by market order:", bar.symbol)
-        api.first = 1.
-        api.tradeDate[-1] = bar.tradeDate
-        # 每天的仓位操作
-        api.turnaround = [0, 0]
+    i = api.slot.get(bar.symbol)
+    if i is None:
         return
+    # MACD未初始化时用历史数据初始化, 之后在按组回调中增量更新
+    if not api.macd.seeded[i]:
+        recent_data = api.getBarsHistory(bar.symbol, timeSpan=ETimeSpan.MIN_1, count=api.init_data_len, df=True,
+                                         priceMode=EPriceMode.FORMER, skipSuspended=0)
+        api.macd.seed(i, recent_data['close'].values)
+    api.last_close[i] = bar.close
+    api.updated[i] = True
 
-    # 更新最新的日期
-    api.tradeDate[0] = bar.tradeDate
-    # 若为新的一天,获取可用于回转的昨仓
-    if api.tradeDate[0] != api.tradeDate[-1]:
-        api.ending = 0
-        api.turnaround = [0, 0]
-    if api.ending == 1:
-        return
+
+def onHandleData(api, timeExch):
+    # 本组内收到新bar的股票一次性更新MACD
+    updated = np.flatnonzero(api.updated)
+    api.updated[:] = False
+    api.macd.update(updated, api.last_close[updated])
+
+    # 购买底仓
+    new = updated[~api.first[updated]]
+    for i in new:
+        api.targetPosition(symbol=api.symbols[i], qty=int(api.total[i]), positionSide=EPositionSide.LONG,
+                           remark="open new position")
+        print("open in new long postion by market order:", api.symbols[i])
+        api.first[i] = True
+    updated = np.setdiff1d(updated, new)
 
     # 若有可用的昨仓则操作
-    if api.total > 0 and api.availableQty.availableQty > 0:
-        # 获取时间序列数据
-        recent_data = api.getBarsHistory(api.symbol, timeSpan=ETimeSpan.MIN_1, count=api.init_data_len, df=True,
-                                         priceMode=EPriceMode.FORMER, skipSuspended=0)
-        # 计算MACD线
-        macd = talib.MACD(recent_data['close'].values)[0][-1]
-        # 根据MACD>0则开仓,小于0则平仓
-        if macd > 0:
-            # 多空单向操作都不能超过昨仓位,否则最后无法调回原仓位
-            if api.turnaround[0] + api.trade_n < api.total:
-                # 计算累计仓位
-                api.turnaround[0] += api.trade_n
-                volume = api.total + api.turnaround[0] - api.turnaround[1]
-                api.targetPosition(symbol=bar.symbol, qty=volume, positionSide=EPositionSide.LONG,
-                                   remark="open new position")
-                print("open in new long postion by market order:%s : %i" % (bar.symbol, api.trade_n))
-        elif macd < 0:
-            if api.turnaround[1] + api.trade_n < api.total:
-                api.turnaround[1] += api.trade_n
-                volume = api.total + api.turnaround[0] - api.turnaround[1]
-                api.targetPosition(symbol=bar.symbol, qty=volume, positionSide=EPositionSide.LONG,
-                                   remark="close position")
-                print("close long postion by market order:%s : %i" % (bar.symbol, api.trade_n))
-        # 临近收盘时若仓位数不等于昨仓则回复所有仓位
-        if int(bar.timeStr[9:13]) >= 1455:
-            print("收盘前回复仓位")
-            symbolposition = api.getSymbolPosition(symbol=api.symbol, positionSide=EPositionSide.LONG)
-            if symbolposition.posQty != api.total:
-                api.targetPosition(symbol=bar.symbol, qty=api.total, positionSide=EPositionSide.LONG,
+    active = updated[~api.ending[updated] & (api.total[updated] > 0) & (api.availableQty[updated] > 0)]
+    if len(active) == 0:
+        return
+    # 根据MACD>0则开仓,小于0则平仓, 多空单向操作都不能超过昨仓位,否则最后无法调回原仓位
+    macd = api.macd.macd[active]
+    buy = active[(macd > 0) & (api.turnaround[active, 0] + api.trade_n < api.total[active])]
+    sell = active[(macd < 0) & (api.turnaround[active, 1] + api.trade_n < api.total[active])]
+    api.turnaround[buy, 0] += api.trade_n
+    api.turnaround[sell, 1] += api.trade_n
+    # 计算累计仓位
+    volume = api.total + api.turnaround[:, 0] - api.turnaround[:, 1]
+    for i in buy:
+        api.targetPosition(symbol=api.symbols[i], qty=int(volume[i]), positionSide=EPositionSide.LONG,
+                           remark="open new position")
+        print("open in new long postion by market order:%s : %i" % (api.symbols[i], api.trade_n))
+    for i in sell:
+        api.targetPosition(symbol=api.symbols[i], qty=int(volume[i]), positionSide=EPositionSide.LONG,
+                           remark="close position")
+        print("close long postion by market order:%s : %i" % (api.symbols[i], api.trade_n))
+
+    # 临近收盘时若仓位数不等于昨仓则回复所有仓位
+    if api.clock.minute_of_session(api.timeNow()) >= api.ending_minute:
+        print("收盘前回复仓位")
+        for i in active:
+            symbolposition = api.getSymbolPosition(symbol=api.symbols[i], positionSide=EPositionSide.LONG)
+            if symbolposition.posQty != api.total[i]:
+                api.targetPosition(symbol=api.symbols[i], qty=int(api.total[i]), positionSide=EPositionSide.LONG,
                                    remark="target position")
-                print("To target position:%d" % (api.total))
-                api.ending = 1
-        # 更新过去的日期数据
-        api.tradeDate[-1] = api.tradeDate[0]
+                print("To target position:%d" % (api.total[i]))
+                api.ending[i] = True
+
+
+class MACDState(object):
+    """
+    增量计算的MACD(12,26,9), 保存快慢线和信号线的EMA状态, 每根bar O(1)更新.
+    初始化方式与talib.MACD一致: 慢线用前slow根的均值作为初值, 快线用同一位置结束的fast根均值作为初值,
+    信号线用前signal个MACD值的均值作为初值
+    """
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = fast
+        self.slow = slow
+        self.signal = signal
+        self.k_fast = 2.0 / (fast + 1)
+        self.k_slow = 2.0 / (slow + 1)
+        self.k_signal = 2.0 / (signal + 1)
+        self.count = 0
+        self.closes = []
+        self.macds = []
+        self.ema_fast = None
+        self.ema_slow = None
+        self.ema_signal = None
+        self.macd = float('nan')
+        self.macd_signal = float('nan')
+        self.macd_hist = float('nan')
+
+    def seed(self, closes):
+        for close in closes:
+            self.update(close)
+
+    def update(self, close):
+        close = float(close)
+        if self.ema_slow is None:
+            # 数据不足slow根时先缓存
+            self.closes.append(close)
+            if len(self.closes) < self.slow:
+                return self.macd
+            self.ema_slow = sum(self.closes) / self.slow
+            self.ema_fast = sum(self.closes[-self.fast:]) / self.fast
+            self.closes = None
+        else:
+            self.ema_slow += self.k_slow * (close - self.ema_slow)
+            self.ema_fast += self.k_fast * (close - self.ema_fast)
+        self.macd = self.ema_fast - self.ema_slow
+        if self.ema_signal is None:
+            self.macds.append(self.macd)
+            if len(self.macds) < self.signal:
+                return self.macd
+            self.ema_signal = sum(self.macds) / self.signal
+            self.macds = None
+        else:
+            self.ema_signal += self.k_signal * (self.macd - self.ema_signal)
+        self.macd_signal = self.ema_signal
+        self.macd_hist = self.macd - self.macd_signal
+        return self.macd
+
+
+class BasketMACD(object):
+    """
+    一篮子股票的MACD, 快慢线和信号线的EMA状态按股票序号保存在数组中,
+    每组bar对所有收到新bar的股票做一次向量化更新; 每只股票用MACDState按talib方式初始化
+    """
+
+    def __init__(self, count, fast=12, slow=26, signal=9):
+        self.k_fast = 2.0 / (fast + 1)
+        self.k_slow = 2.0 / (slow + 1)
+        self.k_signal = 2.0 / (signal + 1)
+        self.params = (fast, slow, signal)
+        self.seeded = np.zeros(count, dtype=bool)
+        self.fresh = np.zeros(count, dtype=bool)
+        self.ema_fast = np.full(count, np.nan)
+        self.ema_slow = np.full(count, np.nan)
+        self.ema_signal = np.full(count, np.nan)
+        self.macd = np.full(count, np.nan)
+
+    def seed(self, i, closes):
+        # 历史数据(含当前bar)不足以得到信号线时不算初始化完成, 下一根bar重新初始化
+        state = MACDState(*self.params)
+        state.seed(closes)
+        if state.ema_signal is None:
+            return
+        self.ema_fast[i] = state.ema_fast
+        self.ema_slow[i] = state.ema_slow
+        self.ema_signal[i] = state.ema_signal
+        self.macd[i] = state.macd
+        self.seeded[i] = True
+        self.fresh[i] = True
+
+    def update(self, index, closes):
+        # 刚初始化的股票当前bar已计入, 跳过
+        mask = self.seeded[index] & ~self.fresh[index]
+        self.fresh[index] = False
+        index = index[mask]
+        closes = closes[mask]
+        ema_fast = self.ema_fast[index]
+        ema_slow = self.ema_slow[index]
+        ema_fast += self.k_fast * (closes - ema_fast)
+        ema_slow += self.k_slow * (closes - ema_slow)
+        macd = ema_fast - ema_slow
+        self.ema_fast[index] = ema_fast
+        self.ema_slow[index] = ema_slow
+        self.macd[index] = macd
+        self.ema_signal[index] += self.k_signal * (macd - self.ema_signal[index])
+
+
+class SessionClock(object):
+    """
+    交易时段时钟：预先计算一天中每分钟对应的交易分钟序号(非交易时间为-1),
+    每个交易日只计算一次当日0点的时间戳, 之后由毫秒时间戳直接查表, 不需要解析时间字符串
+    """
+
+    def __init__(self, sessions=((930, 1130), (1300, 1500))):
+        self.table = [-1] * 1440
+        index = 0
+        for start, end in sessions:
+            for minute in range(start // 100 * 60 + start % 100, end // 100 * 60 + end % 100 + 1):
+                self.table[minute] = index
+                index += 1
+        self.day_start = 0
+
+    def set_trade_date(self, trade_date):
+        day = datetime.datetime.strptime(str(trade_date), '%Y%m%d')
+        self.day_start = int(time.mktime(day.timetuple())) * 1000
+
+    def session_minute(self, hhmm):
+        return self.table[hhmm // 100 * 60 + hhmm % 100]
+
+    def minute_of_session(self, time_ms):
+        minute = (time_ms - self.day_start) // 60000
+        if minute < 0 or minute >= 1440:
+            return -1
+        return self.table[minute]
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
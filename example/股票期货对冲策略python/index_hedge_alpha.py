@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, absolute_import, unicode_literals, division
 from etasdk import *
+from etatools import instrument
+import numpy as np
+from etatools import BarPanel, Scheduler
 
 '''
 指数对冲策略
@@ -22,54 +25,29 @@ def onInitialize(api):
     # 设置行情数据缓存条数
     api.data_len = 21
     api.setRequireBars(ETimeSpan.DAY_1, api.data_len)
+    # 股票和股指期货的日K线面板, 每天只追加一根K线
+    api.panel = BarPanel(api, api.data_len, ETimeSpan.DAY_1, EPriceMode.FORMER)
     # 设置缓存日频因子数据
     api.setRequireFields(fields=["PE"])
 
     api.stock_num = 30
-    api.trade_day_now = 0
-    api.trade_day_last = 0
     api.lots_stock = {}
+    api.symbol_stock = []
     api.futures_code = []
     api.lots_futures = 0
+    # 每月第一个交易日选股调仓
+    api.scheduler = Scheduler(api)
+    api.scheduler.monthly("rebalance", rebalance)
 
 
 def onBeforeMarketOpen(api, trade_date):
     print("日期：", trade_date)
-    # 订阅的标的代码
-    symbol_subscribe = api.getSymbolPool()
-    data_code = [ind01 for ind01 in symbol_subscribe if "CS" in ind01]
-    api.futures_code = api.getContinuousSymbol("IFZ0.CF", trade_date)
-
-    data_code.append(str(api.futures_code))
-    # 关注相关股票和股指期货
-    # api.setFocusSymbols(data_code)
     # 当前股指期货主力合约代码
     api.futures_code = api.getContinuousSymbol("IFZ0.CF", trade_date)
 
-    # 获取当前交易日
-    api.trade_day_now = api.getCurrTradeDate()
-    # 获取上一交易日
-    api.trade_day_last = api.getPrevTradeDate(trade_date)
-
-    # 如果当前是每月的第一个交易日即选股调仓并执行对冲
-    # if str(api.trade_day_now)[4:6] == str(api.trade_day_last)[4:6]: return
-    # 获取股票的PE指标数据
-    findata = api.getFieldsOneDay(data_code[:-1], ["PE"], api.trade_day_last, df=True)
-    findata.index = findata["symbol"]
-    # 获取历史行情数据
-    close = {}
-    for ind03 in data_code:
-        bars = api.getBarsHistory(ind03, ETimeSpan.DAY_1, count=api.data_len, priceMode=EPriceMode.FORMER, df=True)
-        if (len(bars) >= api.data_len) and (bars.ix[api.data_len - 1, "isSuspended"] == 0):
-            close[ind03] = bars.ix[api.data_len - 1, "close"]
-            if "CS" in ind03:
-                findata.ix[ind03, "momentum01"] = (bars.ix[api.data_len - 1, "close"] / bars.ix[0, "close"]) - 1
-    # 先按照估值PE和动量排序选出前30只股票
-    findata[["ranks_pe", "rank_mom"]] = findata.rank()[["PE", "momentum01"]]
-    findata["score"] = findata["rank_mom"] - findata["ranks_pe"]
-    findata_sorted = findata.sort_values("score", ascending=False)[:api.stock_num]
-    symbol_stock = list(findata_sorted.index.values)
-    symbol_stock.append(api.futures_code)
+    # 如果当前是每月的第一个交易日即选股调仓并执行对冲, 其余交易日沿用上次的选股结果
+    api.scheduler.run(api, trade_date)
+    symbol_stock = api.symbol_stock + [api.futures_code]
     # 关注相关股票和股指期货
     api.setFocusSymbols(symbol_stock)
 
@@ -107,28 +85,44 @@ def onBeforeMarketOpen(api, trade_date):
                     print("移仓换月，市价单平仓：", ind00.symbol)
         """
 
-    # 平均分配每只股票资金，计算每只股票仓位
-    api.lots_stock = {}
+
+def rebalance(api, trade_date):
+    # 订阅的标的代码
+    symbol_subscribe = api.getSymbolPool()
+    data_code = [ind01 for ind01 in symbol_subscribe if "CS" in ind01]
+    data_code.append(str(api.futures_code))
+
+    # 获取股票的PE指标数据
+    stock_code = data_code[:-1]
+    findata = api.getFieldsOneDay(stock_code, ["PE"], api.scheduler.calendar.prev_date(trade_date), df=True)
+    pe = findata.set_index("symbol")["PE"].reindex(stock_code).values.astype(np.float64)
+    # 获取历史行情数据
+    api.panel.update(trade_date, data_code)
+    rows = api.panel.rows(data_code)
+    counts = api.panel.valid_counts(rows)
+    tradable = (counts >= api.data_len) & (api.panel.isSuspended[rows, -1] == 0)
+    closes = api.panel.close[rows]
+    # 先按照估值PE和动量排序选出前30只股票, 并平均分配每只股票资金，计算每只股票仓位
     account_stock = api.getAccount(data_code[0])
     capital = account_stock.cashAvailable + account_stock.marketValue
-    for ind05 in close.keys():
-        if ("CS" in ind05) and (ind05 in symbol_stock):
-            api.lots_stock[ind05] = int(capital * 0.70 / close[ind05] / api.stock_num / 100.0) * 100
-        elif "CF" in ind05:
-            api.lots_futures = int(capital * 0.70 / close[ind05] / 300.0)
+    picked, lots = select_stocks(pe, closes[:-1], tradable[:-1], api.stock_num, capital)
+    api.symbol_stock = [stock_code[i] for i in picked]
+    api.lots_stock = dict(zip(api.symbol_stock, lots.tolist()))
+    if tradable[-1]:
+        api.lots_futures = int(capital * 0.70 / closes[-1, -1] / 300.0)
 
     # 1、获取当前仓位换仓
-    for ind04 in symbolpositions:
+    for ind04 in api.getSymbolPositions():
         symbol_last = ind04.symbol
         # 不在标的的股票将卖出
-        if ("CS" in symbol_last) and (symbol_last not in symbol_stock):
+        if ("CS" in symbol_last) and (symbol_last not in api.symbol_stock):
             api.targetPosition(symbol=symbol_last, qty=0)
             print("不在标的池，市价单卖出：", symbol_last)
 
 
 def onHandleData(api, timeExch):
     # 如果当前是每月的第一个交易日即选股调仓并执行对冲
-    if str(api.trade_day_now)[4:6] == str(api.trade_day_last)[4:6]:
+    if not api.scheduler.fired("rebalance"):
         return
         # 2、买入标的池股票
     for ind06 in api.lots_stock.keys():
@@ -145,3 +139,41 @@ def onHandleData(api, timeExch):
 
 def onTerminate(api, exitInfo):
     print("回测结束。。。")
+
+
+def rank_average(values):
+    """
+    升序排名(从1开始), 相同值取平均排名, nan不参与排名, 与pandas的rank()默认方式一致
+    """
+    ranks = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return ranks
+    order = valid[np.argsort(values[valid], kind='mergesort')]
+    sorted_values = values[order]
+    bounds = np.flatnonzero(np.diff(sorted_values)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(order)]])
+    ranks[order] = np.repeat((starts + ends + 1) / 2.0, ends - starts)
+    return ranks
+
+
+def select_stocks(pe, closes, tradable, stock_num, capital):
+    """
+    一次性完成选股和仓位计算:
+    pe: 各股票PE, closes: 股票 x data_len 的收盘价, tradable: 数据完整且未停牌
+    动量 = 区间收益率, 得分 = 动量排名 - PE排名, 选出得分最高的stock_num只股票
+    返回选中股票的序号(得分从高到低, 得分相同时按股票池顺序)和对应的下单股数
+    """
+    momentum = np.full(len(pe), np.nan)
+    momentum[tradable] = closes[tradable, -1] / closes[tradable, 0] - 1
+    score = rank_average(momentum) - rank_average(pe)
+    candidates = np.flatnonzero(~np.isnan(score))
+    # 得分是排名之差, 经常相同, 用稳定排序保证入选的股票不随排序算法变化
+    picked = candidates[np.argsort(-score[candidates], kind='mergesort')[:stock_num]]
+    lots = (capital * 0.70 / closes[picked, -1] / stock_num / 100.0).astype(np.int64) * 100
+    return picked, lots
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
@@ -3,14 +3,12 @@
 
 from __future__ import print_function, absolute_import
 from etasdk import *
+from etatools import instrument
 import numpy as np
-from datetime import datetime
-import sys
-try:
-    from sklearn import svm
-except:
-    print('please install scikit-learn and numpy with mkl')
-    sys.exit(-1)
+from numpy.lib.stride_tricks import as_strided
+from etatools import BarPanel, Scheduler
+# 未安装scikit-learn时modelStore给出安装提示并退出
+from modelStore import ModelStore, WalkForwardTrainer
 
 '''
 股票策略：机器学习
@@ -19,6 +17,7 @@ except:
 若已经持有仓位则在盈利大于10%的时候止盈,在星期五损失大于2%的时候止损.
 特征为:1.收盘价/均值2.现量/均量3.最高价/均价4.最低价/均价5.现量6.区间收益率7.区间标准差
 训练数据为:600036.CS招商银行,时间从20170507到20171107
+训练好的模型按训练区间和超参数缓存在用户缓存目录, 之后每月第一个交易日在后台进程中用最近同样长度的数据滚动训练
 回测时间为:20171108-20181101
 撮合周期：日K
 '''
@@ -34,116 +33,156 @@ def onInitialize(api):
     api.ratio = 0.8
     api.dataWindow = 20
     api.clf = None
-    # 设置股票池，因子以及K线类型
-    api.setRequireData(symbols=[api.symbol],
-                       bars=[(ETimeSpan.DAY_1, 1000)])
+    api.svm_params = dict(C=1.0, kernel=str('rbf'), degree=3, gamma=str('auto'), coef0=0.0, shrinking=True,
+                          probability=False, tol=0.001, cache_size=400, verbose=False, max_iter=-1,
+                          decision_function_shape=str('ovr'), random_state=None)
+    # 模型缓存与后台滚动训练, retrain_workers为0时在盘前同步训练
+    api.retrain_workers = 1
+    # 回测时滚动训练的模型固定在提交后的下一个交易日盘前生效, 结果与训练耗时和模型缓存无关;
+    # 实盘设为False, 训练完成后的第一个盘前即替换
+    api.backtest = True
+    api.model_store = ModelStore(FEATURE_VERSION)
+    api.trainer = WalkForwardTrainer(api.model_store, workers=api.retrain_workers,
+                                     lag=1 if api.backtest else None)
+    # 每月第一个交易日滚动训练, 交易日历同时用于判断星期
+    api.scheduler = Scheduler(api)
+    api.scheduler.monthly("retrain", retrain)
+    api.calendar = api.scheduler.calendar
+    # 批量模式: 用api.symbol训练的模型对整个股票池打分, 每周一买入得分最高且预测上涨的top_k只股票;
+    # 有量纲的特征先换算到api.symbol的量级, 股价和成交量不同的股票得分可以比较
+    api.batch_mode = False
+    api.instset = str("000300.IDX")
+    api.top_k = 10
+    if api.batch_mode:
+        api.setSymbolPool(instsets=[api.instset], symbols=[api.symbol])
+        api.setRequireBars(ETimeSpan.DAY_1, 1000)
+        # 股票池日K线面板, 窗口与训练集相同
+        api.panel = BarPanel(api, api.dataWindow + 1, ETimeSpan.DAY_1, EPriceMode.FORMER,
+                             fields=('high', 'low', 'close', 'totalVolume', 'isSuspended'))
+    else:
+        # 设置股票池，因子以及K线类型
+        api.setRequireData(symbols=[api.symbol],
+                           bars=[(ETimeSpan.DAY_1, 1000)])
     #设置按组回调
     api.setGroupMode(timeOutMs=10000, onlyGroup = False);
 
+# 特征计算方式改变时递增, 使缓存的旧模型失效
+FEATURE_VERSION = 1
+
+def sliding_windows(values, window):
+    # 沿最后一维长度为window的滑动窗口视图 (..., n - window + 1, window), 不拷贝数据
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    count = max(values.shape[-1] - window + 1, 0)
+    return as_strided(values, shape=values.shape[:-1] + (count, window),
+                      strides=values.strides + values.strides[-1:], writeable=False)
+
+def build_features(close, high, low, amount, window):
+    """
+    计算每个长度为window的滑窗的七个特征, 时间为最后一维:
+    输入一维序列返回 (len - window + 1, 7) 矩阵, 第i行对应以第i + window - 1根K线结尾的窗口;
+    输入 (股票 x 时间) 矩阵时返回 (股票, len - window + 1, 7)
+    """
+    close = np.asarray(close, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    volume = np.asarray(amount, dtype=np.float64) / close
+    close_win = sliding_windows(close, window)
+    last = (Ellipsis, slice(window - 1, None))
+    return np.stack([
+        close[last] / close_win.mean(axis=-1),  # 收盘价/均值
+        volume[last] / sliding_windows(volume, window).mean(axis=-1),  # 现量/均量
+        high[last] / sliding_windows(high, window).mean(axis=-1),  # 最高价/均价
+        low[last] / sliding_windows(low, window).mean(axis=-1),  # 最低价/均价
+        volume[last],  # 现量
+        close[last] / close_win[..., 0],  # 区间收益率
+        close_win.std(axis=-1),  # 区间标准差
+    ], axis=-1)
+
+def scale_features(features, close, amount, close_level, volume_level):
+    """
+    把build_features最后一个窗口的特征换算到另一只股票的量级, 时间为最后一维:
+    现量(特征5)按窗口均量、区间标准差(特征7)按窗口均价缩放到volume_level和close_level, 其余特征本身是比值
+    """
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(amount, dtype=np.float64) / close
+    features = np.array(features, dtype=np.float64)
+    features[..., 4] *= volume_level / volume.mean(axis=-1)
+    features[..., 6] *= close_level / close.mean(axis=-1)
+    return features
+
+def build_labels(close, window, horizon=5):
+    # 窗口结束后horizon个交易日的收盘价高于窗口最后一天则为1, 与build_features的前len - window + 1 - horizon行对应
+    close = np.asarray(close, dtype=np.float64)
+    return (close[window - 1 + horizon:] > close[window - 1:len(close) - horizon]).astype(int)
+
 # train
-def trainHistoryData(api):
+def trainHistoryData(api, start_date, end_date, wait=False):
+    key = api.model_store.key(api.symbol, start_date, end_date, api.svm_params)
+    if key in api.model_store:
+        api.trainer.submit(key, None, None, api.svm_params)
+        return
     # 获取目标股票的daily历史行情
     recent_data = api.getBarsHistory(api.symbol, timeSpan=ETimeSpan.DAY_1, count=1000, df=True, \
                                    priceMode=EPriceMode.FORMER, skipSuspended=0)
-    recent_data.fillna(method="ffill")
+    recent_data = recent_data.ffill()
     # 获取目标股票的训练数据集
-    recent_data = recent_data[(recent_data["tradeDate"] >= api.train_start_date) & (recent_data["tradeDate"] <= api.train_end_date)]
-    days_value = recent_data['tradeDate'].values
-    days_close = recent_data['close'].values
-    days = []
-    # 获取行情日期列表
-    print('prepare training data for SVM', api.train_start_date, " - ", api.train_end_date)
-    for i in range(len(days_value)):
-        days.append(days_value[i])
-
-    x_all = []
-    y_all = []
-    for index in range(api.dataWindow, (len(days) - 5)):
-        # 计算一个月共20个交易日相关数据
-        start_day = days[index - api.dataWindow]
-        end_day = days[index]
-        data = recent_data[(recent_data["tradeDate"] >= start_day) &(recent_data["tradeDate"] <= end_day)]
-        close = data['close'].values
-        max_x = data['high'].values
-        min_n = data['low'].values
-        amount = data['totalVolume'].values
-        volume = []
-        for i in range(len(close)):
-            volume_temp = amount[i] / close[i]
-            volume.append(volume_temp)
-
-        close_mean = close[-1] / np.mean(close)  # 收盘价/均值
-        volume_mean = volume[-1] / np.mean(volume)  # 现量/均量
-        max_mean = max_x[-1] / np.mean(max_x)  # 最高价/均价
-        min_mean = min_n[-1] / np.mean(min_n)  # 最低价/均价
-        vol = volume[-1]  # 现量
-        return_now = close[-1] / close[0]  # 区间收益率
-        std = np.std(np.array(close), axis=0)  # 区间标准差
-
-        # 将计算出的指标添加到训练集X
-        # features用于存放因子
-        features = [close_mean, volume_mean, max_mean, min_mean, vol, return_now, std]
-        x_all.append(features)
-
-    # 准备算法需要用到的数据
-    for i in range(len(days_close) - api.dataWindow - 5):
-        if days_close[i + api.dataWindow + 5] > days_close[i + api.dataWindow]:
-            label = 1
-        else:
-            label = 0
-        y_all.append(label)
+    recent_data = recent_data[(recent_data["tradeDate"] >= start_date) & (recent_data["tradeDate"] <= end_date)]
+    print('prepare training data for SVM', start_date, " - ", end_date)
+
+    # 每个窗口包含dataWindow + 1个交易日, 标签为5个交易日后的涨跌
+    window = api.dataWindow + 1
+    close = recent_data['close'].values
+    y_all = build_labels(close, window)
+    x_all = build_features(close, recent_data['high'].values, recent_data['low'].values,
+                           recent_data['totalVolume'].values, window)[:len(y_all)]
 
     x_train = x_all[: -1]
     y_train = y_all[: -1]
-    # 训练SVM
-    api.clf = svm.SVC(C=1.0, kernel=str('rbf'), degree=3, gamma=str('auto'), coef0=0.0, shrinking=True, probability=False,
-                          tol=0.001, cache_size=400, verbose=False, max_iter=-1,
-                          decision_function_shape=str('ovr'), random_state=None)
-    print(x_train, y_train)
-    api.clf.fit(x_train, y_train)
-    #print('finished training!')
+    # 训练SVM, 结果保存到模型缓存
+    api.trainer.submit(key, x_train, y_train, api.svm_params, wait=wait)
+
+# 滚动训练: 截至前一交易日, 区间长度与初始训练区间相同
+def retrain(api, trade_date):
+    calendar = api.scheduler.calendar
+    end_date = calendar.prev_date(trade_date)
+    span = calendar.to_date(api.train_end_date) - calendar.to_date(api.train_start_date)
+    start_date = int((calendar.to_date(end_date) - span).strftime('%Y%m%d'))
+    trainHistoryData(api, start_date, end_date)
 
 #盘前运行，用于选股逻辑；必须实现，用来设置当日关注的标的
 def onBeforeMarketOpen(api,tradeDate):
     print("on date", tradeDate)
-    # 设置当天需要交易的股票，如果历史上有过持仓了，则系统会默认自动关注
-    api.setFocusSymbols(api.symbol)
     # firstly time to run, need to train the system
     if not api.trainFinished:
-        trainHistoryData(api)
+        # 初始模型同步训练, 已有缓存时直接读取
+        trainHistoryData(api, api.train_start_date, api.train_end_date, wait=True)
         api.trainFinished = True
+    api.scheduler.run(api, tradeDate)
+    # 新模型在盘前整体替换, 训练期间继续使用旧模型
+    model = api.trainer.poll()
+    if model is not None:
+        api.clf = model
 
     # 当前工作日
-    weekday = datetime.strptime(str(tradeDate), '%Y%m%d').isoweekday()
+    weekday = api.calendar.weekday(int(tradeDate))
+    if api.batch_mode:
+        batchTrade(api, tradeDate, weekday)
+        return
+    # 设置当天需要交易的股票，如果历史上有过持仓了，则系统会默认自动关注
+    api.setFocusSymbols(api.symbol)
     # 获取持仓
     symbolposition = api.getSymbolPosition(api.symbol)
 
     # 获取预测用的历史数据
-    data = api.getBarsHistory(api.symbol, timeSpan=ETimeSpan.DAY_1, count=api.dataWindow, df=True, \
+    data = api.getBarsHistory(api.symbol, timeSpan=ETimeSpan.DAY_1, count=api.dataWindow + 1, df=True, \
                               priceMode=EPriceMode.FORMER, skipSuspended=0)
-    data.fillna(method="ffill")
+    data = data.ffill()
     # 如果是新的星期一且没有仓位则开始预测
     if not symbolposition or symbolposition.posQty == 0 and weekday == 1:
         close = data['close'].values
-        train_max_x = data['high'].values
-        train_min_n = data['low'].values
-        train_amount = data['totalVolume'].values
-        volume = []
-        for i in range(len(close)):
-            volume_temp = train_amount[i] / close[i]
-            volume.append(volume_temp)
-
-        close_mean = close[-1] / np.mean(close)
-        volume_mean = volume[-1] / np.mean(volume)
-        max_mean = train_max_x[-1] / np.mean(train_max_x)
-        min_mean = train_min_n[-1] / np.mean(train_min_n)
-        vol = volume[-1]
-        return_now = close[-1] / close[0]
-        std = np.std(np.array(close), axis=0)
-
-        # 得到本次输入模型的因子
-        features = [close_mean, volume_mean, max_mean, min_mean, vol, return_now, std]
-        features = np.array(features).reshape(1, -1)
+        # 得到本次输入模型的因子, 与训练集使用相同的窗口
+        features = build_features(close, data['high'].values, data['low'].values,
+                                  data['totalVolume'].values, len(close))
         if api.clf:
             prediction = api.clf.predict(features)[0]
         else:
@@ -174,7 +213,66 @@ def onBeforeMarketOpen(api,tradeDate):
             api.targetPosition(symbol=api.symbol, qty=0)
             print('stop loss, close positions for', api.symbol)
 
+def batchScores(api, symbols):
+    """
+    对symbols一次性计算特征并调用decision_function, 返回得分和最新收盘价, 数据不全或停牌的股票得分为nan;
+    模型只用api.symbol训练, 现量和区间标准差按窗口均量、均价换算到api.symbol的量级后再打分
+    """
+    rows = api.panel.rows(symbols)
+    panel = api.panel
+    close = panel.close[rows]
+    amount = panel.view('totalVolume')[rows]
+    features = build_features(close, panel.high[rows], panel.low[rows], amount, panel.lookback)[:, -1]
+    reference = panel.rows([api.symbol])[0]
+    if reference >= 0:
+        reference_close = panel.close[reference]
+        features = scale_features(features, close, amount, reference_close.mean(),
+                                  (panel.view('totalVolume')[reference] / reference_close).mean())
+    valid = (rows >= 0) & (reference >= 0) & np.isfinite(features).all(axis=1) & (panel.isSuspended[rows, -1] == 0)
+    scores = np.full(len(symbols), np.nan)
+    if api.clf and valid.any():
+        # 二分类SVC的得分大于0对应classes_[1]
+        sign = 1 if api.clf.classes_[-1] == 1 else -1
+        scores[valid] = sign * api.clf.decision_function(features[valid])
+    return scores, close[:, -1]
+
+def batchTrade(api, tradeDate, weekday):
+    symbols = list(api.getSymbolPool())
+    positions = dict((position.symbol, position) for position in api.getSymbolPositions() if position.posQty != 0)
+    held = list(positions)
+    pool = set(symbols)
+    api.panel.update(tradeDate, symbols + [symbol for symbol in held if symbol not in pool])
+
+    # 持仓止盈止损, 与单只股票的规则相同
+    if held:
+        close = api.panel.close[api.panel.rows(held), -1]
+        ratio = close / np.array([positions[symbol].posPrice for symbol in held])
+        exit_flag = (ratio >= 1.10) | ((ratio < 1.02) & (weekday == 5))
+        for i in np.flatnonzero(exit_flag):
+            api.targetPosition(symbol=held[i], qty=0)
+            print('stop win' if ratio[i] >= 1.10 else 'stop loss', 'close positions for', held[i])
+
+    # 每周一对股票池打分, 得分从高到低取预测上涨的前top_k只, 等资金买入没有持仓的股票
+    if weekday != 1:
+        return
+    scores, close = batchScores(api, symbols)
+    order = np.argsort(-np.where(np.isnan(scores), -np.inf, scores), kind='mergesort')[:api.top_k]
+    picked = order[scores[order] > 0]
+    api.setFocusSymbols([symbols[i] for i in picked])
+    if len(picked) == 0:
+        return
+    capital = api.getAccount(api.symbol).totAssets * api.ratio / len(picked)
+    lots = (np.floor(capital / close[picked] / 100) * 100).astype(int)
+    for i, qty in zip(picked, lots):
+        if symbols[i] not in positions and qty > 0:
+            api.targetPosition(symbol=symbols[i], qty=int(qty))
+
 #策略终止时响应
 def onTerminate(api,exitInfo):
+    api.trainer.close()
     LOG.INFO ("***************onTerminate*********")
     print ("***************onTerminate*********")
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
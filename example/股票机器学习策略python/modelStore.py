@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+import os
+import sys
+import hashlib
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from sklearn import svm
+except:
+    print('please install scikit-learn and numpy with mkl')
+    sys.exit(-1)
+
+'''
+模型缓存与滚动训练：
+ModelStore把训练好的模型按 股票, 特征版本, 训练区间, 超参数 保存到磁盘, 第一次用到时才读取,
+默认保存在用户缓存目录(~/.cache/etatools/models), 不写入策略源码目录;
+WalkForwardTrainer把滚动训练交给后台进程池, 进程池在第一次后台训练时才创建, 策略继续使用当前模型,
+每次poll取回已经生效的模型并保存, 由策略一次性替换当前模型; 回测时按固定的poll次数生效, 不受训练耗时影响
+'''
+
+
+def fit_model(x, y, params):
+    # 在子进程中训练, 必须是模块级函数以便序列化
+    clf = svm.SVC(**params)
+    clf.fit(x, y)
+    return clf
+
+
+def default_root():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'etatools', 'models')
+
+
+class ModelStore(object):
+    """
+    feature_version: 特征版本号, 特征计算方式改变时递增, 旧模型自动失效; root: 模型文件目录, 默认为default_root()
+    """
+
+    def __init__(self, feature_version, root=None):
+        self.root = root or default_root()
+        self.feature_version = feature_version
+        self.models = {}
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+
+    def key(self, symbol, start_date, end_date, params):
+        digest = hashlib.md5(repr(sorted(params.items())).encode('utf-8')).hexdigest()[:12]
+        return '%s_v%s_%s_%s_%s' % (symbol, self.feature_version, start_date, end_date, digest)
+
+    def path(self, key):
+        return os.path.join(self.root, key + '.pkl')
+
+    def __contains__(self, key):
+        return key in self.models or os.path.exists(self.path(key))
+
+    def get(self, key):
+        # 内存中没有时才从磁盘读取, 不存在返回None
+        model = self.models.get(key)
+        if model is None and os.path.exists(self.path(key)):
+            with open(self.path(key), 'rb') as f:
+                model = self.models[key] = pickle.load(f)
+        return model
+
+    def put(self, key, model):
+        # 先写临时文件再改名, 进程中途退出也不会留下不完整的模型文件
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+            getattr(os, 'replace', os.rename)(tmp, self.path(key))
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.models[key] = model
+
+
+class WalkForwardTrainer(object):
+    """
+    submit提交训练任务, 已有缓存的任务直接完成; poll返回最近提交且已生效的模型, 没有新模型时返回None
+    wait为True或workers为0时在当前进程内同步训练; 策略结束时调用close关闭进程池
+    lag: 为None时训练完成后的第一次poll即返回新模型(实盘), 生效时间取决于训练耗时;
+         为整数时提交后第lag次poll才返回新模型, 未训练完成则等待, 回测结果与训练耗时和缓存状态无关
+    """
+
+    def __init__(self, store, workers=1, lag=None):
+        self.store = store
+        self.workers = workers
+        self.lag = lag
+        self.executor = None
+        self.pending = []
+        self.ready = None
+        self.polls = 0
+
+    def submit(self, key, x, y, params, wait=False):
+        # 生效时的poll序号, lag为None时不固定
+        due = None if self.lag is None else self.polls + 1 + self.lag
+        if wait:
+            if key not in self.store:
+                self.store.put(key, fit_model(x, y, params))
+            self.ready = key
+        elif key in self.store or not self.workers:
+            if key not in self.store:
+                self.store.put(key, fit_model(x, y, params))
+            if due is None:
+                self.ready = key
+            else:
+                self.pending.append((key, None, due))
+        else:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.pending.append((key, self.executor.submit(fit_model, x, y, params), due))
+
+    def poll(self):
+        self.polls += 1
+        while self.pending:
+            key, future, due = self.pending[0]
+            if due is None and not future.done():
+                break
+            if due is not None and due > self.polls:
+                break
+            self.pending.pop(0)
+            try:
+                if future is not None:
+                    # 固定生效时间时在这里等待训练完成
+                    self.store.put(key, future.result())
+                self.ready = key
+            except Exception as e:
+                print('[ERR]: train model failed', key, e)
+        if self.ready is None:
+            return None
+        key, self.ready = self.ready, None
+        return self.store.get(key)
+
+    def close(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+            self.poll()
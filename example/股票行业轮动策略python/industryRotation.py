@@ -2,9 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from etasdk import *
+from etatools import instrument
 import numpy as np
-from operator import itemgetter
-from collections import OrderedDict
+from etatools import FundamentalsLoader, BarPanel
 
 '''
 股票策略：行业轮动
@@ -26,6 +26,10 @@ def onInitialize(api):
     api.capitalRatio = 0.8
     api.numberOfChosenTickers = 5
     api.chosenTickers = []
+    # 截面基本面数据, 每个交易日一次批量请求
+    api.fundamentals = FundamentalsLoader(api, ['MKT_CAP'])
+    # 行业指数日K线面板, 每天只追加一根K线
+    api.panel = BarPanel(api, api.returnWindow + 1, ETimeSpan.DAY_1, EPriceMode.FORMER)
 
     # 设置股票池，因子以及K线类型
     api.setRequireData(instsets=api.industries,
@@ -43,13 +47,15 @@ def onBeforeMarketOpen(api, tradeDate):
     # 计算各个行业指数的return
     return_index = []
 
-    for industry in api.industries:
-        bars = api.getBarsHistory(industry, timeSpan=ETimeSpan.DAY_1, count=api.returnWindow + 1, df=True,
-                                  priceMode=EPriceMode.FORMER, skipSuspended=0)
-        bars.fillna(method="ffill")
-        if len(bars) < api.returnWindow:
+    api.panel.update(tradeDate, api.industries)
+    rows = api.panel.rows(api.industries)
+    counts = api.panel.valid_counts(rows)
+    starts = api.panel.first_valid(rows)
+    close = api.panel.close
+    for industry, row, count, start in zip(api.industries, rows, counts, starts):
+        if count < api.returnWindow:
             continue
-        return_index.append(bars.close.values[-1] / bars.close.values[0] - 1)
+        return_index.append(close[row, -1] / close[row, start] - 1)
 
     # 找到return最高的行业
     chosenIndustry = api.industries[np.argmax(return_index)]
@@ -59,18 +65,17 @@ def onBeforeMarketOpen(api, tradeDate):
     industrySymbols = api.getConstituentSymbols(chosenIndustry)
 
     # 获取股票的市值
-    symbolMarketCaps = {}
-    for symbol in industrySymbols:
-        # 检查股票是否停牌，不交易停牌股票
-        if api.isSuspend(symbol, tradeDate):
-            continue
-        # 获取单个标的的市值
-        marketCapital = api.getFieldsCountDays(symbol=symbol, fields=["MKT_CAP"], count=1)
-        symbolMarketCaps[symbol] = marketCapital.MKT_CAP.values[-1]
+    fundamentals = api.fundamentals.load(industrySymbols, tradeDate)
+    symbolMarketCaps = fundamentals.MKT_CAP.dropna()
 
-    # 按照市值对股票排序
-    orderedDict = OrderedDict(sorted(symbolMarketCaps.items(), key=itemgetter(1), reverse=True))
-    api.chosenTickers = [item[0] for item in orderedDict.items()][:api.numberOfChosenTickers]
+    # 按照市值对股票排序, 只检查排在前面的股票是否停牌, 不交易停牌股票
+    orderedCaps = symbolMarketCaps.sort_values(ascending=False, kind='mergesort')
+    api.chosenTickers = []
+    for symbol in orderedCaps.index:
+        if len(api.chosenTickers) >= api.numberOfChosenTickers:
+            break
+        if not api.isSuspend(symbol, tradeDate):
+            api.chosenTickers.append(symbol)
     print("chosenTickers", api.chosenTickers)
 
     # 设置当天需要交易的股票，如果历史上有过持仓了，则系统会默认自动关注
@@ -126,3 +131,7 @@ def onHandleData(api, timeExch):
 def onTerminate(api, exitInfo):
     LOG.INFO("***************onTerminate*********")
     print("***************onTerminate*********")
+
+
+# 开启耗时统计(ETATOOLS_INSTRUMENT=1)时包装回调函数
+instrument.strategy(globals())
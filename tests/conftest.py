@@ -0,0 +1,26 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from etatools.replay import sdk
+
+
+@pytest.fixture
+def strategy():
+    """
+    按 示例目录名, 策略文件名 加载示例策略模块, etasdk由本地回放的替身提供
+    """
+    sdk.install()
+
+    def load(directory, filename):
+        folder = os.path.join(ROOT, 'example', directory)
+        if folder not in sys.path:
+            sys.path.insert(0, folder)
+        return sdk.load_strategy(os.path.join(folder, filename))
+    return load
@@ -0,0 +1,65 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+stattools = pytest.importorskip('statsmodels.tsa.stattools')
+# 新版statsmodels提示adfuller将改为返回结果对象, 这里只用前两项
+pytestmark = pytest.mark.filterwarnings('ignore:adfuller:FutureWarning')
+
+
+def random_series(seed, length=300, count=5):
+    rng = np.random.default_rng(seed)
+    walk = 3000 + rng.standard_normal((length, count)).cumsum(axis=0) * 5
+    noise = 3000 + rng.standard_normal((length, count)) * 5
+    # 一半随机游走, 一半平稳序列
+    return np.where(np.arange(count) % 2 == 0, walk, noise)
+
+
+def test_batch_adf_matches_statsmodels(strategy):
+    scanner = strategy('期货跨期套利策略python', 'pairScanner.py')
+    series = random_series(5)
+    stats = scanner.batch_adf(series)[0]
+    pvalues = scanner.adf_pvalues(stats)
+    for column in range(series.shape[1]):
+        stat, pvalue = stattools.adfuller(series[:, column], maxlag=1, regression='c', autolag=None)[:2]
+        assert stats[column] == pytest.approx(stat, rel=1e-8)
+        assert pvalues[column] == pytest.approx(pvalue, rel=1e-8)
+
+
+def test_residual_adf_uses_engle_granger_values(strategy):
+    scanner = strategy('期货跨期套利策略python', 'pairScanner.py')
+    mackinnonp = pytest.importorskip('statsmodels.tsa.adfvalues').mackinnonp
+    rng = np.random.default_rng(6)
+    x = 3000 + rng.standard_normal(400).cumsum() * 5
+    # 残差为AR(1), 半衰期约为 ln(0.5) / ln(0.8) = 3.1
+    noise = np.zeros(400)
+    for i in range(1, 400):
+        noise[i] = 0.8 * noise[i - 1] + rng.standard_normal() * 3
+    y = 1.2 * x + 50 + noise
+    series = np.column_stack([y, x])
+    beta, c, pvalues, life = scanner.evaluate_pairs(series, np.array([[0, 1]]))
+    expected_beta, expected_c = np.polyfit(x, y, 1)
+    assert beta[0] == pytest.approx(expected_beta, rel=1e-9)
+    assert c[0] == pytest.approx(expected_c, rel=1e-6)
+    stat = stattools.adfuller(y - beta[0] * x - c[0], maxlag=1, regression='c', autolag=None)[0]
+    assert pvalues[0] == pytest.approx(mackinnonp(stat, regression='c', N=2), rel=1e-8)
+    assert 1 < life[0] < 6
+
+
+def test_cointegration_test_agrees_with_scanner(strategy):
+    module = strategy('期货跨期套利策略python', 'calendarArbitrage.py')
+    rng = np.random.default_rng(7)
+    x = 3000 + rng.standard_normal(300).cumsum() * 5
+    y = 0.9 * x + 200 + rng.standard_normal(300) * 2
+    z = 3000 + rng.standard_normal(300).cumsum() * 5
+    table = module.scan_pairs(np.column_stack([y, x, z]), ['y', 'x', 'z'])
+    found = table[(table.symbol01 == 'y') & (table.symbol02 == 'x')]
+    assert len(found) == 1
+    beta, c, resid, result = module.cointegration_test(y, x)
+    assert result == 1.0
+    assert beta == pytest.approx(found.beta.iloc[0], rel=1e-9)
+    assert c == pytest.approx(found.c.iloc[0], rel=1e-6)
+    # 两个独立的随机游走不协整
+    assert module.cointegration_test(y, z)[3] == 0.0
+    assert not ((table.symbol01 == 'y') & (table.symbol02 == 'z')).any()
@@ -0,0 +1,41 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+from etatools import BarArray, BarHistory, get_bars
+from etatools.replay import ReplayApi, Broker
+from benchmarks.synthetic import SyntheticData
+
+
+class FrameOnlyApi(object):
+    # 只有getBarsHistory的api, get_bars走DataFrame转换的路径
+    def __init__(self, api):
+        self.getBarsHistory = api.getBarsHistory
+
+
+def test_get_bars_matches_dataframe_on_every_source():
+    data = SyntheticData(universe=5, days=3)
+    api = ReplayApi(data, Broker(data))
+    api.trade_calendar = data.calendar
+    api.begin_day(data.calendar[-1])
+    expected = api.getBarsHistory('600001.CS', 'DAY_1', count=30, priceMode='FORMER', df=True)
+    for source in (api, FrameOnlyApi(api), BarHistory(api)):
+        bars = get_bars(source, '600001.CS', 'DAY_1', count=30, priceMode='FORMER')
+        assert len(bars) == len(expected)
+        for field in ('open', 'high', 'low', 'close', 'volume'):
+            assert np.array_equal(getattr(bars, field), expected[field].values)
+        assert np.array_equal(bars.df['close'].values, expected['close'].values)
+        assert bars[-1].close == expected['close'].values[-1]
+        assert isinstance(bars[-5:], BarArray) and np.array_equal(bars[-5:].close, bars.close[-5:])
+
+
+def test_get_bars_fields_and_copy():
+    data = SyntheticData(universe=5, days=3)
+    api = ReplayApi(data, Broker(data))
+    api.trade_calendar = data.calendar
+    api.begin_day(data.calendar[-1])
+    history = BarHistory(api)
+    bars = get_bars(history, '600001.CS', 'DAY_1', count=10, fields=['high', 'close'])
+    assert set(bars.fields) == {'high', 'close'}
+    kept = bars.copy()
+    kept.values['close'][:] = 0
+    assert np.all(get_bars(history, '600001.CS', 'DAY_1', count=10).close > 0)
@@ -0,0 +1,123 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+
+class Position(object):
+    def __init__(self, symbol, side, qty):
+        self.symbol = symbol
+        self.positionSide = side
+        self.posQty = qty
+
+
+class PairApi(object):
+    # 记录targetPosition调用的最小api
+    def __init__(self, module, tickers, positions):
+        self.tickersCode = list(tickers)
+        self.coint_cache = module.CointegrationCache()
+        self.last_close = {}
+        self.positions = positions
+        self.targets = []
+        self.focus = None
+
+    def getSymbolPositions(self):
+        return self.positions
+
+    def targetPosition(self, symbol, qty, positionSide):
+        self.targets.append((symbol, qty, positionSide))
+
+    def setFocusSymbols(self, symbols):
+        self.focus = list(symbols)
+
+
+@pytest.fixture
+def arbitrage(strategy):
+    return strategy('期货跨期套利策略python', 'calendarArbitrage.py')
+
+
+def test_pair_switch_closes_shared_leg(arbitrage, monkeypatch):
+    long_side, short_side = arbitrage.EPositionSide.LONG, arbitrage.EPositionSide.SHORT
+    # 旧合约对[A, B]做空A做多B, 新合约对[B, C]中B变成第一条腿
+    api = PairApi(arbitrage, ['A.CF', 'B.CF'], [Position('A.CF', short_side, 1), Position('B.CF', long_side, 1)])
+    api.coint_cache.bars_since_refresh = 5
+    monkeypatch.setattr(arbitrage, 'select_pair', lambda api: ['B.CF', 'C.CF'])
+    arbitrage.onBeforeMarketOpen(api, 20171009)
+    assert sorted(api.targets) == sorted([('A.CF', 0, short_side), ('B.CF', 0, long_side)])
+    assert api.tickersCode == ['B.CF', 'C.CF'] and api.focus == ['B.CF', 'C.CF']
+    assert api.coint_cache.needs_refresh()
+
+
+def test_same_pair_keeps_positions(arbitrage, monkeypatch):
+    long_side = arbitrage.EPositionSide.LONG
+    api = PairApi(arbitrage, ['A.CF', 'B.CF'], [Position('B.CF', long_side, 1)])
+    monkeypatch.setattr(arbitrage, 'select_pair', lambda api: ['A.CF', 'B.CF'])
+    arbitrage.onBeforeMarketOpen(api, 20171009)
+    assert api.targets == []
+
+
+def cointegrated_pair(seed, length):
+    rng = np.random.RandomState(seed)
+    x = 3000 + np.cumsum(rng.normal(0, 5, length))
+    y = 0.8 * x + 500 + rng.normal(0, 3, length)
+    return y, x
+
+
+def test_rls_without_forgetting_matches_batch_ols(arbitrage):
+    y, x = cointegrated_pair(0, 500)
+    cache = arbitrage.CointegrationCache(refresh_bars=1000, drift_threshold=1e9, forgetting=1.0)
+    cache.refresh(y[:300], x[:300])
+    assert cache.result == 1.0
+    for end in range(301, 501):
+        cache.update(y[end - 1], x[end - 1])
+        if end % 50 == 0:
+            beta, c = np.polyfit(x[:end], y[:end], 1)
+            assert cache.beta == pytest.approx(beta, rel=1e-8)
+            assert cache.c == pytest.approx(c, rel=1e-6)
+            assert cache.residual(y[end - 1], x[end - 1]) == pytest.approx(y[end - 1] - beta * x[end - 1] - c,
+                                                                          abs=1e-5)
+
+
+def test_refresh_after_refresh_bars(arbitrage):
+    y, x = cointegrated_pair(1, 420)
+    cache = arbitrage.CointegrationCache(refresh_bars=120, drift_threshold=1e9)
+    assert cache.needs_refresh()
+    cache.refresh(y[:300], x[:300])
+    for i in range(119):
+        cache.update(y[300 + i], x[300 + i])
+        assert not cache.needs_refresh()
+    cache.update(y[419], x[419])
+    assert cache.needs_refresh()
+
+
+def test_refresh_on_residual_drift(arbitrage):
+    y, x = cointegrated_pair(2, 300)
+    cache = arbitrage.CointegrationCache(refresh_bars=1000, drift_span=30, drift_threshold=1.5)
+    cache.refresh(y, x)
+    base_beta, base_c = cache.beta, cache.c
+    # 残差固定在均值之上3倍标准差: 漂移统计量 3 * (1 - (1 - alpha) ^ n), 第n根超过1.5
+    alpha = 2.0 / 31
+    expected = int(np.ceil(np.log(0.5) / np.log(1 - alpha)))
+    price02 = x[-1]
+    price01 = base_beta * price02 + base_c + cache.resid_mean + 3 * cache.resid_std
+    for _ in range(expected):
+        assert not cache.needs_refresh()
+        cache.update(price01, price02)
+    assert cache.needs_refresh()
+    assert cache.drift == pytest.approx(3 * (1 - (1 - alpha) ** expected))
+    # 重新检验后漂移清零
+    cache.refresh(y, x)
+    assert not cache.needs_refresh() and cache.drift == 0
+
+
+def test_failed_test_skips_rls(arbitrage):
+    rng = np.random.RandomState(3)
+    x = 3000 + np.cumsum(rng.normal(0, 5, 300))
+    y = 3000 + np.cumsum(rng.normal(0, 5, 300))
+    cache = arbitrage.CointegrationCache(refresh_bars=5)
+    cache.refresh(y, x)
+    assert cache.result == 0.0
+    for i in range(5):
+        cache.update(y[i], x[i])
+    assert (cache.beta, cache.c) == (0.0, 0.0)
+    assert cache.needs_refresh()
@@ -0,0 +1,82 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+talib = pytest.importorskip('talib')
+
+
+class WindowPanel(object):
+    # 只提供EMASignalEngine用到的BarPanel属性, 每次move把窗口向后移动一根K线
+    def __init__(self, close, volume, lookback):
+        self.full_close = close
+        self.full_volume = volume
+        self.lookback = lookback
+        self.symbols = list(range(len(close)))
+        self.slot = dict((i, i) for i in self.symbols)
+        self.filled = np.zeros(len(close), dtype=np.int64)
+
+    def move(self, end):
+        self.close = self.full_close[:, end - self.lookback:end]
+        self.volume = self.full_volume[:, end - self.lookback:end]
+        self.trade_dates = np.arange(end - self.lookback, end)
+
+
+def reference_signal(close, volume):
+    # 原策略逐只股票用talib计算的择时信号
+    short_ema = talib.EMA(close, 5)[-1]
+    long_ema = talib.EMA(close, 20)[-1]
+    volume_ema = talib.EMA(volume[:-1], 20)[-1]
+    double = talib.EMA(talib.EMA(close, 8), 8)
+    daily_ret = np.log(double[-1]) - np.log(double[-2])
+    return (volume[-1] > 2 * volume_ema and daily_ret > 0) or short_ema > long_ema
+
+
+def test_vector_ema_matches_talib(strategy):
+    module = strategy('股票择时策略python', 'stockTiming.py')
+    rng = np.random.default_rng(4)
+    values = rng.standard_normal((5, 120)).cumsum(axis=1) + 50
+    # 上市前为nan
+    for i, start in enumerate([0, 3, 10, 30, 100]):
+        values[i, :start] = np.nan
+    ema = module.VectorEMA(20, 5)
+    index = np.arange(5)
+    for column in range(values.shape[1]):
+        ema.update(index, values[:, column])
+        for i in index:
+            series = values[i, :column + 1]
+            series = series[~np.isnan(series)]
+            expected = talib.EMA(series, 20)[-1] if len(series) else np.nan
+            if np.isnan(expected):
+                assert np.isnan(ema.value[i])
+            else:
+                assert ema.value[i] == pytest.approx(expected, rel=1e-12)
+
+
+def test_signal_engine_matches_talib_strategy(strategy):
+    module = strategy('股票择时策略python', 'stockTiming.py')
+    rng = np.random.default_rng(3)
+    count, length, lookback = 30, 320, 200
+    close = np.exp(rng.standard_normal((count, length)).cumsum(axis=1) * 0.02) * 10
+    volume = rng.lognormal(10, 0.5, (count, length))
+    for i, start in enumerate(rng.integers(0, 250, count)):
+        close[i, :start] = np.nan
+        volume[i, :start] = np.nan
+    panel = WindowPanel(close, volume, lookback)
+    engine = module.EMASignalEngine(panel)
+    rows = np.arange(count)
+    checked = 0
+    for end in range(lookback, length + 1):
+        panel.move(end)
+        if end == 260:
+            # 复权变化等原因重新下载的行用完整窗口重算
+            panel.filled[[1, 2]] += 1
+        engine.sync()
+        signal = engine.signal(rows)
+        for i in rows:
+            valid = ~np.isnan(panel.close[i])
+            if valid.sum() <= 120 or not valid[-1]:
+                continue
+            assert signal[i] == reference_signal(panel.close[i, valid], panel.volume[i, valid])
+            checked += 1
+    assert checked > 1000
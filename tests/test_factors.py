@@ -0,0 +1,54 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+from etatools import RollingFactorModel
+
+
+def lstsq_fit(factors, returns):
+    # 对单只股票直接求解 r = alpha + beta * f, 返回 alpha, beta 和 alpha 的t统计量
+    x = np.column_stack([factors, np.ones(len(factors))])
+    coef, sse = np.linalg.lstsq(x, returns, rcond=None)[:2]
+    sigma2 = sse[0] / (len(returns) - x.shape[1])
+    stderr = np.sqrt(sigma2 * np.linalg.inv(x.T.dot(x))[-1, -1])
+    return coef[-1], coef[:-1], coef[-1] / stderr
+
+
+def test_rolling_factor_model_matches_lstsq():
+    rng = np.random.default_rng(8)
+    window, factor_count, stock_count, days = 60, 3, 40, 260
+    factors = rng.normal(0, 0.01, (days, factor_count))
+    betas = rng.normal(1, 0.3, (stock_count, factor_count))
+    returns = factors.dot(betas.T) + rng.normal(0, 0.001, stock_count) + rng.normal(0, 0.01, (days, stock_count))
+    returns[100:105, 3] = np.nan
+    symbols = ['s%02d' % i for i in range(stock_count)]
+    # 容量小于股票数, 覆盖扩容; refresh不整除window, 覆盖增量更新和重算交替
+    model = RollingFactorModel(window, ['f%d' % i for i in range(factor_count)], refresh=37, capacity=8)
+    checked = 0
+    for day in range(days):
+        # 后一半股票第50天之后才出现
+        live = symbols if day >= 50 else symbols[:20]
+        model.update(factors[day], live, returns[day, :len(live)])
+        if not model.ready or day % 13:
+            continue
+        result = model.fit()
+        start = day - window + 1
+        for column, symbol in enumerate(symbols):
+            y = returns[start:day + 1, column]
+            if np.isnan(y).any() or (column >= 20 and start < 50):
+                assert result.loc[symbol].isnull().all()
+                continue
+            alpha, beta, tstat = lstsq_fit(factors[start:day + 1], y)
+            assert result.loc[symbol, 'alpha'] == pytest.approx(alpha, abs=1e-10)
+            assert result.loc[symbol, 'tstat'] == pytest.approx(tstat, rel=1e-6)
+            assert np.allclose(result.loc[symbol].values[1:-1], beta, atol=1e-10)
+            checked += 1
+    assert checked > 300
+
+
+def test_rolling_factor_model_not_ready():
+    model = RollingFactorModel(20, ['mkt'])
+    model.update([0.01], ['a'], [0.02])
+    result = model.fit()
+    assert result.empty
+    assert list(result.columns) == ['alpha', 'beta_mkt', 'tstat']
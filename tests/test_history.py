@@ -0,0 +1,73 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+from etatools import BarHistory
+from etatools.replay import ReplayApi, Broker
+from benchmarks.synthetic import SyntheticData
+
+
+@pytest.fixture
+def replay():
+    data = SyntheticData(universe=5, days=6)
+    api = ReplayApi(data, Broker(data))
+    api.trade_calendar = data.calendar
+    return data, api
+
+
+def same_frames(cached, direct):
+    return cached.shape == direct.shape and np.allclose(cached.close, direct.close) and \
+        (cached.time.values == direct.time.values).all()
+
+
+def assert_bounded(history):
+    assert history.nbytes == sum(entry.nbytes for entry in history.entries.values())
+    assert history.nbytes <= history.max_bytes or len(history.entries) == 1
+
+
+def test_bar_history_matches_direct_fetches(replay):
+    data, api = replay
+    direct = api.getBarsHistory
+    history = BarHistory(api)
+    minutes = data.bars('MIN_1', 'rb1801.CF')
+    for date in data.calendar[-6:]:
+        api.begin_day(date)
+        for span, symbol in [('DAY_1', '600001.CS'), ('DAY_1', 'rb1801.CF'), ('MIN_1', 'rb1801.CF')]:
+            for count in (50, 5, 1):
+                for mode in ('FORMER', 'REAL'):
+                    for skip in (0, 1):
+                        assert same_frames(history.getBarsHistory(symbol, span, count, mode, skip, df=True),
+                                           direct(symbol, span, count, mode, skip, df=True))
+        api.premarket = False
+        for time in minutes['time'][minutes['tradeDate'] == date][::20]:
+            api.now = int(time)
+            for count in (300, 40):
+                cached = history.getBarsHistory('rb1801.CF', 'MIN_1', count, 'FORMER', 1, fields=['close'], df=True)
+                expected = direct('rb1801.CF', 'MIN_1', count, 'FORMER', 1, df=True)
+                assert len(cached) == len(expected) and np.allclose(cached.close, expected.close)
+            bars = history.getBarsHistory('600001.CS', 'DAY_1', 2, 'FORMER', 0, df=False)
+            expected = direct('600001.CS', 'DAY_1', 2, 'FORMER', 0, df=False)
+            assert np.allclose([bar.close for bar in bars], [bar.close for bar in expected])
+    # 时间推进后应当以核对和追加为主, 而不是重新下载
+    assert history.probes > history.fetches
+    assert history.hits > 0
+
+
+def test_bar_history_stays_within_max_bytes_after_appends():
+    # 没有分钟预热数据时全部历史都在缓存中, 新K线追加后缓冲区会扩大
+    data = SyntheticData(universe=5, days=2, minute_warmup=0)
+    api = ReplayApi(data, Broker(data))
+    api.trade_calendar = data.calendar
+    history = BarHistory(api, max_bytes=30000)
+    symbols = ['rb1801.CF', 'FG1801.CF']
+    date = data.calendar[-2]
+    api.begin_day(date)
+    api.premarket = False
+    minutes = data.bars('MIN_1', 'rb1801.CF')
+    for time in minutes['time'][minutes['tradeDate'] == date]:
+        api.now = int(time)
+        for symbol in symbols:
+            bars = history.getBarsHistory(symbol, 'MIN_1', 100000, 'FORMER', 1, df=True)
+            assert np.allclose(bars.close, api.getBarsHistory(symbol, 'MIN_1', 100000, 'FORMER', 1, df=True).close)
+            assert_bounded(history)
+    assert len(history.entries) == 1
@@ -0,0 +1,154 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import contextlib
+import numpy as np
+import pytest
+from etatools.replay import ReplayApi, Broker, ReplayEngine
+from benchmarks.synthetic import SyntheticData
+
+
+@pytest.fixture
+def timing(strategy):
+    return strategy('股票择时策略python', 'stockTiming.py')
+
+
+class Market(object):
+    # 手动推进的回放: 每天结算T+1后, 对每只股票推送当日日K线撮合
+    def __init__(self, symbols):
+        self.data = SyntheticData(universe=5, days=30)
+        self.broker = Broker(self.data, fee_rate=0.)
+        self.api = ReplayApi(self.data, self.broker)
+        self.api.trade_calendar = self.data.calendar
+        self.symbols = symbols
+        self.day = len(self.data.calendar) - 30
+
+    def begin(self):
+        self.broker.settle_day()
+        self.api.begin_day(int(self.data.calendar[self.day]))
+
+    def trade(self):
+        date = self.data.calendar[self.day]
+        for symbol in self.symbols:
+            bars = self.data.bars('DAY_1', symbol)
+            row = bars[bars['tradeDate'] == date][0]
+            self.broker.on_bar(symbol, int(row['time']), row['open'], row['high'], row['low'], row['close'])
+        self.day += 1
+
+
+def cached(holdings):
+    return dict(zip(holdings.symbols, holdings.qty.tolist()))
+
+
+def held(api):
+    return dict((position.symbol, float(position.posQty)) for position in api.getSymbolPositions())
+
+
+def test_orders_update_cache_across_t_plus_one(timing):
+    market = Market(['600001.CS', '600002.CS'])
+    api = market.api
+    holdings = timing.HoldingsCache(None, reconcile=20)
+    market.begin()
+    holdings.begin_day(api)
+    holdings.order(api, '600001.CS', 1000)
+    holdings.order(api, '600002.CS', 500)
+    market.trade()
+    holdings.settle(api)
+    assert cached(holdings) == held(api) == {'600001.CS': 1000., '600002.CS': 500.}
+    assert holdings.pending == {}
+    assert holdings.cost[0] == api.getSymbolPosition('600001.CS').posPrice
+
+    # 当日买入的股票不能卖出, 目标仓位保留到成交
+    holdings.order(api, '600001.CS', 0)
+    market.day -= 1
+    market.trade()
+    holdings.settle(api)
+    assert cached(holdings) == held(api) == {'600001.CS': 1000., '600002.CS': 500.}
+    assert holdings.pending == {'600001.CS': 0}
+
+    # 次日重新下单后开盘成交, 盘前没有对账时由未完成的目标仓位更新
+    market.begin()
+    holdings.begin_day(api)
+    assert holdings.days == 1
+    holdings.order(api, '600001.CS', 0)
+    market.trade()
+    market.begin()
+    holdings.begin_day(api)
+    assert holdings.days == 2
+    assert cached(holdings) == held(api) == {'600002.CS': 500.}
+    assert holdings.pending == {}
+
+
+def test_reconcile_picks_up_changes_outside_the_strategy(timing):
+    market = Market(['600001.CS'])
+    api = market.api
+    holdings = timing.HoldingsCache(None, reconcile=3)
+    market.begin()
+    holdings.begin_day(api)
+    holdings.order(api, '600001.CS', 1000)
+    market.trade()
+    holdings.settle(api)
+    # 送股之类策略之外的持仓变化只在对账日同步
+    market.broker.position('600001.CS').posQty = 1300
+    expected_high = holdings.high[0]
+    for day in (1, 2):
+        market.begin()
+        holdings.begin_day(api)
+        assert holdings.days == day
+        assert cached(holdings) == {'600001.CS': 1000.}
+        market.trade()
+    market.begin()
+    holdings.begin_day(api)
+    assert holdings.days == 0
+    assert cached(holdings) == held(api) == {'600001.CS': 1300.}
+    assert holdings.high[0] >= expected_high
+
+
+def test_reconcile_keeps_orders_filled_after_it(timing):
+    market = Market(['600001.CS'])
+    api = market.api
+    holdings = timing.HoldingsCache(None, reconcile=2)
+    market.begin()
+    holdings.begin_day(api)
+    market.trade()
+    market.begin()
+    holdings.begin_day(api)
+    market.trade()
+    # 收盘前下的单在对账日开盘才成交
+    holdings.order(api, '600001.CS', 800)
+    market.begin()
+    holdings.begin_day(api)
+    assert holdings.days == 0
+    assert holdings.pending == {'600001.CS': 800}
+    market.trade()
+    holdings.settle(api)
+    assert cached(holdings) == held(api) == {'600001.CS': 800.}
+    assert holdings.pending == {}
+
+
+def test_cache_matches_broker_positions_in_replay(timing):
+    checks = []
+
+    def check(api):
+        checks.append(cached(api.holdings) == held(api))
+
+    before, handle = timing.onBeforeMarketOpen, timing.onHandleData
+
+    def checked_before(api, trade_date):
+        before(api, trade_date)
+        check(api)
+
+    def checked_handle(api, time):
+        handle(api, time)
+        api.holdings.settle(api)
+        check(api)
+
+    timing.onBeforeMarketOpen, timing.onHandleData = checked_before, checked_handle
+    data = SyntheticData(seed=1, universe=30, days=45)
+    engine = ReplayEngine(timing, data, start_date=int(data.calendar[300]))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        engine.run()
+    # 跨过两次对账, 每次盘前和盘中都与券商持仓一致
+    assert len(checks) == 90
+    assert all(checks)
+    assert len(engine.broker.fills) > 10
@@ -0,0 +1,67 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def hedge(strategy):
+    return strategy('股票期货对冲策略python', 'index_hedge_alpha.py')
+
+
+def test_rank_average_matches_pandas(hedge):
+    values = np.array([3., 1., np.nan, 3., 2., 1., 3., np.nan, 5.])
+    expected = pd.Series(values).rank(method='average').values
+    assert np.array_equal(np.isnan(hedge.rank_average(values)), np.isnan(expected))
+    assert np.allclose(hedge.rank_average(values), expected, equal_nan=True)
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        values = rng.randint(0, 10, 50).astype(np.float64)
+        values[rng.uniform(size=50) < 0.1] = np.nan
+        assert np.allclose(hedge.rank_average(values), pd.Series(values).rank().values, equal_nan=True)
+    assert np.isnan(hedge.rank_average(np.full(3, np.nan))).all()
+
+
+def pandas_selection(symbols, pe, closes, tradable, stock_num, capital):
+    # 原策略的DataFrame流程: PE对所有股票排名, 动量只对可交易股票计算
+    findata = pd.DataFrame({'PE': pe}, index=symbols)
+    findata['momentum01'] = np.nan
+    for i, symbol in enumerate(symbols):
+        if tradable[i]:
+            findata.loc[symbol, 'momentum01'] = closes[i, -1] / closes[i, 0] - 1
+    findata[['ranks_pe', 'rank_mom']] = findata.rank()[['PE', 'momentum01']]
+    findata['score'] = findata['rank_mom'] - findata['ranks_pe']
+    chosen = findata.dropna(subset=['score']).sort_values('score', ascending=False, kind='mergesort')[:stock_num]
+    lots = [int(capital * 0.70 / closes[symbols.index(symbol), -1] / stock_num / 100.0) * 100
+            for symbol in chosen.index]
+    return list(chosen.index), lots
+
+
+def test_select_stocks_matches_pandas_with_suspended_and_nan_rows(hedge):
+    rng = np.random.RandomState(1)
+    count, length, stock_num = 80, 21, 30
+    symbols = ['%06d.CS' % i for i in range(count)]
+    closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (count, length)), axis=1))
+    # 动量取两位小数, 制造相同的排名和得分
+    closes[:, -1] = closes[:, 0] * (1 + np.round(rng.normal(0, 0.05, count), 2))
+    pe = np.round(rng.uniform(5, 40, count))
+    pe[rng.uniform(size=count) < 0.1] = np.nan
+    tradable = rng.uniform(size=count) > 0.15
+    # 停牌或数据不足的股票收盘价可能缺失
+    closes[~tradable & (rng.uniform(size=count) < 0.5), :5] = np.nan
+    picked, lots = hedge.select_stocks(pe, closes, tradable, stock_num, 2e6)
+    expected_symbols, expected_lots = pandas_selection(symbols, pe, closes, tradable, stock_num, 2e6)
+    assert [symbols[i] for i in picked] == expected_symbols
+    assert lots.tolist() == expected_lots
+    assert tradable[picked].all() and not np.isnan(pe[picked]).any()
+
+
+def test_select_stocks_with_few_candidates(hedge):
+    closes = np.array([[10., 11.], [10., 9.], [np.nan, np.nan]])
+    pe = np.array([20., 10., 15.])
+    tradable = np.array([True, True, False])
+    picked, lots = hedge.select_stocks(pe, closes, tradable, 30, 3e6)
+    # 动量排名 2, 1; PE排名 3, 1(第三只参与PE排名) -> 得分 -1, 0
+    assert picked.tolist() == [1, 0]
+    assert lots.tolist() == [int(3e6 * 0.7 / 9 / 30 / 100) * 100, int(3e6 * 0.7 / 11 / 30 / 100) * 100]
@@ -0,0 +1,52 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def spread(strategy):
+    return strategy('期货跨市场套利策略python', 'interCommoditySpread.py')
+
+
+def legs(seed, minutes=40, missing=17):
+    # 两条腿的1分钟K线, 第二条腿缺少一根K线
+    rng = np.random.default_rng(seed)
+    times = 1504224000000 + 60000 * np.arange(minutes)
+    rb = 3800 + np.cumsum(rng.normal(0, 2, minutes))
+    hc = 3900 + np.cumsum(rng.normal(0, 2, minutes))
+    keep = np.arange(minutes) != missing
+    return (times, rb), (times[keep], hc[keep])
+
+
+def state(buffer):
+    return buffer.count, sorted(buffer.buffer.tolist()), buffer.spread_now, buffer.up, buffer.down
+
+
+def test_seed_aligns_legs_on_time_like_push(spread):
+    (rb_time, rb), (hc_time, hc) = legs(1)
+    seeded = spread.SpreadBuffer(['rb1801.CF', 'hc1801.CF'], [1.0, -1.0], window=30)
+    seeded.seed([rb_time, hc_time], [rb, hc])
+
+    pushed = spread.SpreadBuffer(['rb1801.CF', 'hc1801.CF'], [1.0, -1.0], window=30)
+    for time, close in zip(rb_time, rb):
+        pushed.push('rb1801.CF', int(time), close)
+        index = np.flatnonzero(hc_time == time)
+        if len(index):
+            pushed.push('hc1801.CF', int(time), hc[index[0]])
+
+    assert seeded.count == 30
+    assert state(seeded) == state(pushed)
+    assert not seeded.consume()
+    # 缺失的分钟不产生价差, 之后的价差仍是同一分钟的两条腿
+    last = np.searchsorted(rb_time, hc_time[-1])
+    assert seeded.spread_now == rb[last] - hc[-1]
+
+
+def test_seed_pairs_legs_by_time_not_position(spread):
+    (rb_time, rb), (hc_time, hc) = legs(2, minutes=31, missing=5)
+    buffer = spread.SpreadBuffer(['rb1801.CF', 'hc1801.CF'], [1.0, -1.0], window=30)
+    buffer.seed([rb_time, hc_time], [rb, hc])
+    keep = np.isin(rb_time, hc_time)
+    assert buffer.count == 30
+    np.testing.assert_allclose(np.sort(buffer.buffer), np.sort(rb[keep] - hc))
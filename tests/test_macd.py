@@ -0,0 +1,46 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+talib = pytest.importorskip('talib')
+
+
+def test_macd_state_matches_talib(strategy):
+    module = strategy('股票日内回转交易策略python', 'intradayStockTrade.py')
+    rng = np.random.default_rng(2)
+    close = 10 + rng.standard_normal(300).cumsum() * 0.05
+    state = module.MACDState()
+    for end in range(1, 301):
+        state.update(close[end - 1])
+        macd, signal, hist = talib.MACD(close[:end], fastperiod=12, slowperiod=26, signalperiod=9)
+        if np.isnan(macd[-1]):
+            assert np.isnan(state.macd_signal)
+            continue
+        assert state.macd == pytest.approx(macd[-1], abs=1e-10)
+        assert state.macd_signal == pytest.approx(signal[-1], abs=1e-10)
+        assert state.macd_hist == pytest.approx(hist[-1], abs=1e-10)
+
+
+def test_basket_macd_matches_talib(strategy):
+    module = strategy('股票日内回转交易策略python', 'intradayStockTrade.py')
+    rng = np.random.default_rng(3)
+    count = 6
+    basket = module.BasketMACD(count)
+    received = [[] for _ in range(count)]
+    # 每组bar只有部分股票收到新bar, 每只股票按自己收到的序列与talib比较
+    for step in range(200):
+        index = np.flatnonzero(rng.uniform(size=count) < 0.7)
+        closes = 10 + rng.standard_normal(len(index)) * 0.05 + step * 0.01
+        for i, close in zip(index, closes):
+            received[i].append(close)
+            if not basket.seeded[i]:
+                basket.seed(i, received[i])
+        basket.update(index, closes)
+        for i in index:
+            macd, signal, _ = talib.MACD(np.array(received[i]), fastperiod=12, slowperiod=26, signalperiod=9)
+            if np.isnan(signal[-1]):
+                assert not basket.seeded[i]
+                continue
+            assert basket.macd[i] == pytest.approx(macd[-1], abs=1e-10)
+            assert basket.ema_signal[i] == pytest.approx(signal[-1], abs=1e-10)
@@ -0,0 +1,123 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+
+
+@pytest.fixture
+def ml(strategy):
+    return strategy('股票机器学习策略python', 'machineLearning.py')
+
+
+def random_bars(seed, length):
+    rng = np.random.RandomState(seed)
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, length)))
+    high = close * (1 + rng.uniform(0, 0.02, length))
+    low = close * (1 - rng.uniform(0, 0.02, length))
+    amount = rng.uniform(1e6, 5e6, length)
+    return close, high, low, amount
+
+
+def loop_features(close, high, low, amount):
+    # 原策略对一个窗口逐项计算的七个特征
+    volume = [amount[i] / close[i] for i in range(len(close))]
+    return [close[-1] / np.mean(close), volume[-1] / np.mean(volume), high[-1] / np.mean(high),
+            low[-1] / np.mean(low), volume[-1], close[-1] / close[0], np.std(np.array(close), axis=0)]
+
+
+def loop_training_set(close, high, low, amount, data_window):
+    # 原策略trainHistoryData的窗口循环和标签循环
+    x_all = []
+    for index in range(data_window, len(close) - 5):
+        window = slice(index - data_window, index + 1)
+        x_all.append(loop_features(close[window], high[window], low[window], amount[window]))
+    y_all = []
+    for i in range(len(close) - data_window - 5):
+        y_all.append(1 if close[i + data_window + 5] > close[i + data_window] else 0)
+    return np.array(x_all), np.array(y_all)
+
+
+def test_training_set_matches_original_loop(ml):
+    close, high, low, amount = random_bars(0, 130)
+    data_window = 20
+    expected_x, expected_y = loop_training_set(close, high, low, amount, data_window)
+    y_all = ml.build_labels(close, data_window + 1)
+    x_all = ml.build_features(close, high, low, amount, data_window + 1)[:len(y_all)]
+    assert np.array_equal(y_all, expected_y)
+    assert x_all.shape == expected_x.shape
+    assert np.allclose(x_all, expected_x, rtol=1e-12, atol=0)
+
+
+def test_prediction_window_matches_training_window(ml):
+    close, high, low, amount = random_bars(1, 21)
+    # 预测用dataWindow + 1根K线, 与训练集的窗口长度相同
+    features = ml.build_features(close, high, low, amount, len(close))
+    assert features.shape == (1, 7)
+    assert np.allclose(features[0], loop_features(close, high, low, amount), rtol=1e-12, atol=0)
+
+
+def test_panel_features_match_single_series(ml):
+    bars = [random_bars(seed, 40) for seed in range(3)]
+    stacked = [np.vstack(field) for field in zip(*bars)]
+    panel = ml.build_features(*(stacked + [21]))
+    assert panel.shape == (3, 20, 7)
+    for i, series in enumerate(bars):
+        assert np.allclose(panel[i], ml.build_features(*(list(series) + [21])), rtol=1e-12, atol=0)
+
+
+def test_scaled_features_match_reference_stock(ml):
+    close, high, low, amount = random_bars(2, 21)
+    reference = ml.build_features(close, high, low, amount, 21)[-1]
+    # 股价10倍、成交量50倍的同一走势, 换算到参考股票的量级后七个特征都相同
+    features = ml.build_features(10 * close, 10 * high, 10 * low, 500 * amount, 21)[-1]
+    assert not np.allclose(features, reference)
+    scaled = ml.scale_features(features, 10 * close, 500 * amount, close.mean(), (amount / close).mean())
+    assert np.allclose(scaled, reference, rtol=1e-12, atol=0)
+
+
+class Panel(object):
+    def __init__(self, symbols, bars):
+        self.slot = dict((symbol, i) for i, symbol in enumerate(symbols))
+        self.close, self.high, self.low, self.amount = [np.vstack(field) for field in zip(*bars)]
+        self.isSuspended = np.zeros_like(self.close)
+        self.lookback = self.close.shape[1]
+
+    def rows(self, symbols):
+        return np.array([self.slot.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+
+    def view(self, field):
+        assert field == 'totalVolume'
+        return self.amount
+
+
+class Model(object):
+    # 得分只依赖有量纲的现量和区间标准差
+    classes_ = np.array([0, 1])
+
+    def decision_function(self, features):
+        return features[:, 4] / 1e5 + features[:, 6] - 1
+
+
+class Api(object):
+    def __init__(self, panel):
+        self.panel = panel
+        self.symbol = '600036.CS'
+        self.clf = Model()
+
+
+def test_batch_scores_compare_stocks_on_reference_scale(ml):
+    close, high, low, amount = random_bars(3, 21)
+    bars = [(close, high, low, amount), (10 * close, 10 * high, 10 * low, 500 * amount), random_bars(4, 21)]
+    panel = Panel(['600036.CS', '600519.CS', '000001.CS'], bars)
+    panel.isSuspended[2, -1] = 1
+    scores, last = ml.batchScores(Api(panel), ['600519.CS', '600036.CS', '000001.CS', '601318.CS'])
+    assert np.isclose(scores[0], scores[1], rtol=1e-12, atol=0)
+    assert np.isnan(scores[2]) and np.isnan(scores[3])
+    assert last[1] == close[-1]
+
+    # 参考股票不在面板中时无法换算, 不打分
+    panel.slot.pop('600036.CS')
+    scores, _ = ml.batchScores(Api(panel), ['600519.CS'])
+    assert np.isnan(scores).all()
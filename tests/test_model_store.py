@@ -0,0 +1,86 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+
+PARAMS = dict(C=1.0, kernel=str('rbf'), gamma=str('auto'))
+
+
+@pytest.fixture
+def store_module(strategy):
+    return strategy('股票机器学习策略python', 'modelStore.py')
+
+
+def training_set(seed=0):
+    rng = np.random.RandomState(seed)
+    x = rng.normal(size=(60, 7))
+    return x, (x[:, 0] > 0).astype(int)
+
+
+def test_store_key_and_persistence(store_module, tmp_path):
+    store = store_module.ModelStore(1, root=str(tmp_path))
+    key = store.key('600036.CS', 20170507, 20171107, PARAMS)
+    # 超参数的顺序不影响键, 特征版本、区间和超参数不同则键不同
+    assert key == store.key('600036.CS', 20170507, 20171107, dict(reversed(list(PARAMS.items()))))
+    assert key != store_module.ModelStore(2, root=str(tmp_path)).key('600036.CS', 20170507, 20171107, PARAMS)
+    assert key != store.key('600036.CS', 20170508, 20171107, PARAMS)
+    assert key != store.key('600036.CS', 20170507, 20171107, dict(PARAMS, C=2.0))
+    assert key not in store
+    x, y = training_set()
+    store.put(key, store_module.fit_model(x, y, PARAMS))
+    assert os.listdir(str(tmp_path)) == [key + '.pkl']
+    # 新的实例从磁盘读取
+    reloaded = store_module.ModelStore(1, root=str(tmp_path))
+    assert key in reloaded
+    assert (reloaded.get(key).predict(x) == store.get(key).predict(x)).all()
+
+
+def test_default_root_is_outside_source_tree(store_module, tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    store = store_module.ModelStore(1)
+    assert store.root == os.path.join(str(tmp_path), 'etatools', 'models')
+    assert os.path.isdir(store.root)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_lagged_swap_does_not_depend_on_timing_or_cache(store_module, tmp_path, cached):
+    store = store_module.ModelStore(1, root=str(tmp_path))
+    trainer = store_module.WalkForwardTrainer(store, workers=1, lag=1)
+    x, y = training_set()
+    key = store.key('600036.CS', 1, 2, PARAMS)
+    if cached:
+        store.put(key, store_module.fit_model(x, y, PARAMS))
+    try:
+        trainer.submit(key, x, y, PARAMS)
+        if trainer.pending[0][1] is not None:
+            trainer.pending[0][1].result()
+        # 提交当天即使训练已经完成或模型已有缓存也不替换, 下一次盘前才生效
+        assert trainer.poll() is None
+        model = trainer.poll()
+        assert model is not None and key in store
+        assert trainer.poll() is None
+    finally:
+        trainer.close()
+
+
+def test_unlagged_swap_uses_cache_immediately(store_module, tmp_path):
+    store = store_module.ModelStore(1, root=str(tmp_path))
+    trainer = store_module.WalkForwardTrainer(store, workers=1)
+    x, y = training_set()
+    key = store.key('600036.CS', 1, 2, PARAMS)
+    store.put(key, store_module.fit_model(x, y, PARAMS))
+    trainer.submit(key, x, y, PARAMS)
+    assert trainer.poll() is store.get(key)
+    assert trainer.executor is None
+
+
+def test_synchronous_initial_model(store_module, tmp_path):
+    store = store_module.ModelStore(1, root=str(tmp_path))
+    trainer = store_module.WalkForwardTrainer(store, workers=1, lag=1)
+    x, y = training_set()
+    trainer.submit('initial', x, y, PARAMS, wait=True)
+    assert trainer.poll() is store.get('initial')
+    assert trainer.executor is None
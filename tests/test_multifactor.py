@@ -0,0 +1,33 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+from etatools.replay import ReplayEngine
+from benchmarks.synthetic import SyntheticData
+
+
+def before_open(module, suspended_today=()):
+    # 回放到最后一个交易日的盘前, suspended_today中的股票在该日视为停牌
+    data = SyntheticData(universe=40, days=3)
+    engine = ReplayEngine(module, data)
+    api = engine.api
+    module.onInitialize(api)
+    dates = engine.trade_dates('DAY_1')
+    is_suspend = api.isSuspend
+
+    def patched(symbol, date=None):
+        if symbol in suspended_today and date == dates[-1]:
+            return True
+        return is_suspend(symbol, date)
+    api.isSuspend = patched
+    api.begin_day(dates[-1])
+    module.onBeforeMarketOpen(api, dates[-1])
+    return api
+
+
+def test_stock_suspended_today_is_not_picked(strategy):
+    module = strategy('股票多因子选股策略python', 'multiFactor.py')
+    picked = before_open(module).symbols_pool
+    assert picked
+    api = before_open(module, suspended_today=picked[:2])
+    assert not set(picked[:2]) & set(api.symbols_pool)
+    # 停牌股票之后的股票依次补入
+    assert api.symbols_pool[:len(picked) - 2] == picked[2:]
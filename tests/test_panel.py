@@ -0,0 +1,39 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+from etatools import BarPanel
+from etatools.replay import ReplayApi, Broker
+from benchmarks.synthetic import SyntheticData
+
+
+def test_first_valid_skips_only_leading_gaps():
+    panel = BarPanel(None, lookback=6, time_span='DAY_1', price_mode='FORMER', capacity=4)
+    nan = np.nan
+    panel.close[:] = [[1, 2, 3, 4, 5, 6],
+                      [nan, nan, 3, 4, 5, 6],
+                      [1, nan, nan, 4, 5, 6],
+                      [nan, 2, nan, nan, 5, nan]]
+    rows = np.arange(4)
+    # 中间停牌的空缺不影响起点
+    assert list(panel.first_valid(rows)) == [0, 2, 0, 1]
+    assert list(panel.valid_counts(rows)) == [6, 4, 4, 2]
+
+
+def test_panel_matches_direct_fetches_while_rolling():
+    data = SyntheticData(universe=8, days=8)
+    api = ReplayApi(data, Broker(data))
+    api.trade_calendar = data.calendar
+    symbols = ['6000%02d.CS' % i for i in range(1, 9)]
+    panel = BarPanel(api, lookback=30, time_span='DAY_1', price_mode='FORMER', capacity=4)
+    for day, date in enumerate(data.calendar[-8:]):
+        api.begin_day(date)
+        # 股票池成分每天变化, 覆盖行的复用和扩容
+        pool = symbols[day % 3:day % 3 + 6]
+        panel.update(date, pool)
+        rows = panel.rows(pool)
+        for symbol, row in zip(pool, rows):
+            bars = api.getBarsHistory(symbol, 'DAY_1', count=30, priceMode='FORMER', skipSuspended=0, df=True)
+            assert len(bars)
+            position = np.searchsorted(panel.trade_dates, bars['tradeDate'].values)
+            assert np.allclose(panel.close[row, position], bars['close'].values)
+            assert np.count_nonzero(~np.isnan(panel.close[row])) == len(bars)
@@ -0,0 +1,58 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+from etatools import ParallelEvaluator
+from etatools import parallel
+
+pytestmark = pytest.mark.skipif(parallel.shared_memory is None, reason='shared_memory not available')
+
+
+def window_stats(arrays, window):
+    # 按行计算最近window根K线的均值和成交量加权均价, 用于检查分片拼接的顺序
+    close = arrays['close'][:, -window:]
+    volume = arrays['volume'][:, -window:]
+    return np.column_stack([np.nanmean(close, axis=1), np.nansum(close * volume, axis=1) / np.nansum(volume, axis=1)])
+
+
+def panel_arrays(rows, columns, seed):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (rows, columns)), axis=1))
+    close[rng.random((rows, columns)) < 0.05] = np.nan
+    volume = rng.integers(100, 10000, (rows, columns)).astype(np.float64)
+    return {'close': close, 'volume': volume}
+
+
+def test_two_workers_match_in_process():
+    evaluator = ParallelEvaluator(workers=2, min_rows_per_worker=16)
+    try:
+        # 第二次更多的行需要重新分配共享内存, 第三次更少的行复用已有的共享内存
+        for rows, seed in ((50, 1), (90, 2), (33, 3)):
+            arrays = panel_arrays(rows, 40, seed)
+            assert evaluator.shards(rows) == 2
+            expected = ParallelEvaluator().map(window_stats, arrays, (20,))
+            np.testing.assert_array_equal(evaluator.map(window_stats, arrays, (20,)), expected)
+        assert evaluator.executor is not None
+    finally:
+        evaluator.close()
+    assert evaluator.executor is None and evaluator.blocks == {}
+
+
+def test_ema_states_match_in_process(strategy):
+    timing = strategy('股票择时策略python', 'stockTiming.py')
+    arrays = panel_arrays(64, 130, 4)
+    periods = (5, 20, 8, 20)
+    evaluator = ParallelEvaluator(workers=2, min_rows_per_worker=16)
+    try:
+        result = evaluator.map(timing.ema_states, arrays, periods)
+    finally:
+        evaluator.close()
+    np.testing.assert_array_equal(result, ParallelEvaluator(workers=1).map(timing.ema_states, arrays, periods))
+
+
+def test_small_pools_stay_in_process():
+    evaluator = ParallelEvaluator(workers=4, min_rows_per_worker=200)
+    arrays = panel_arrays(300, 10, 5)
+    assert evaluator.shards(300) == 1
+    np.testing.assert_array_equal(evaluator.map(window_stats, arrays, (5,)), window_stats(arrays, 5))
+    assert evaluator.executor is None and evaluator.blocks == {}
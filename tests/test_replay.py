@@ -0,0 +1,142 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import os
+import pytest
+from etatools.replay import Broker, LocalData, ReplayEngine
+
+DATES = [20180102, 20180103, 20180104, 20180105]
+
+
+def write_csv(path, header, rows):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(','.join(header) + '\n')
+        for row in rows:
+            f.write(','.join(str(value) for value in row) + '\n')
+
+
+@pytest.fixture
+def data(tmp_path):
+    """
+    股票A.CS第三天停牌; 期货F.CF合约乘数10, 最小变动价位1, 保证金比例10%
+    """
+    root = str(tmp_path)
+    header = ['tradeDate', 'open', 'high', 'low', 'close', 'volume', 'isSuspended']
+    write_csv(os.path.join(root, 'bars', 'DAY_1', 'A.CS.csv'), header,
+              [[DATES[0], 10, 11.5, 9.5, 11, 100, 0],
+               [DATES[1], 12, 12.5, 11, 12, 100, 0],
+               [DATES[2], 12, 12, 12, 12, 0, 1],
+               [DATES[3], 13, 14, 12.5, 14, 100, 0]])
+    write_csv(os.path.join(root, 'bars', 'DAY_1', 'F.CF.csv'), header,
+              [[DATES[0], 3000, 3020, 2990, 3010, 100, 0],
+               [DATES[1], 3020, 3030, 3000, 3005, 100, 0],
+               [DATES[2], 3000, 3000, 2980, 2990, 100, 0],
+               [DATES[3], 2990, 3000, 2980, 2995, 100, 0]])
+    write_csv(os.path.join(root, 'refdata.csv'), ['symbol', 'market', 'valuePerUnit', 'priceTick', 'marginRatio'],
+              [['A.CS', 'stock', 1, 0.01, 1], ['F.CF', 'future', 10, 1, 0.1]])
+    return LocalData(root)
+
+
+def bar(broker, data, symbol, day):
+    row = data.bars('DAY_1', symbol)[day]
+    broker.on_bar(symbol, int(row['time']), row['open'], row['high'], row['low'], row['close'])
+
+
+def test_stock_t_plus_one_and_cash(data):
+    broker = Broker(data, cash=100000., fee_rate=0.001)
+    broker.target('A.CS', 1000)
+    bar(broker, data, 'A.CS', 0)
+    position = broker.position('A.CS')
+    # 以开盘价10成交, 手续费 10000 * 0.001 = 10
+    assert (position.posQty, position.posPrice, position.availableQty) == (1000, 10., 0)
+    assert broker.cash == pytest.approx(100000 - 10000 - 10)
+    account = broker.account()
+    assert account.marketValue == pytest.approx(1000 * 11)
+    assert account.totAssets == pytest.approx(89990 + 11000)
+    # 当日买入不可卖出
+    broker.target('A.CS', 0)
+    bar(broker, data, 'A.CS', 0)
+    assert broker.position('A.CS').posQty == 1000
+    assert len(broker.fills) == 1
+    # 次日可以卖出, 以开盘价12成交
+    broker.settle_day()
+    assert broker.position('A.CS').availableQty == 1000
+    broker.target('A.CS', 400)
+    bar(broker, data, 'A.CS', 1)
+    position = broker.position('A.CS')
+    assert (position.posQty, position.availableQty) == (400, 400)
+    assert broker.cash == pytest.approx(89990 + 600 * 12 - 600 * 12 * 0.001)
+    # 股票不能开空仓
+    broker.target('A.CS', 100, 'SHORT')
+    bar(broker, data, 'A.CS', 1)
+    assert broker.position('A.CS', 'SHORT').posQty == 0
+
+
+def test_future_pnl_margin_and_slippage(data):
+    broker = Broker(data, cash=100000., fee_rate=0., slippage=1)
+    broker.target('F.CF', 2, 'LONG')
+    broker.target('F.CF', 1, 'SHORT')
+    bar(broker, data, 'F.CF', 0)
+    long_position = broker.position('F.CF', 'LONG')
+    short_position = broker.position('F.CF', 'SHORT')
+    # 开多向上滑一个价位, 开空向下滑一个价位
+    assert long_position.posPrice == 3001 and short_position.posPrice == 2999
+    # 期货开仓不占用现金, T+0
+    assert broker.cash == 100000 and long_position.availableQty == 2
+    account = broker.account()
+    # 收盘价3010: 多头浮盈 (3010 - 3001) * 2 * 10 = 180, 空头浮亏 (2999 - 3010) * 1 * 10 = -110
+    assert account.totAssets == pytest.approx(100000 + 180 - 110)
+    # 保证金 3010 * 10 * 0.1 * 3 = 9030
+    assert account.cashAvailable == pytest.approx(100000 + 70 - 9030)
+    assert account.marketValue == pytest.approx(3010 * 10 * 3)
+
+    # 次日开盘3020: 平多1手向下滑到3019, 平空向上滑到3021
+    broker.target('F.CF', 1, 'LONG')
+    broker.target('F.CF', 0, 'SHORT')
+    bar(broker, data, 'F.CF', 1)
+    assert [(fill.qty, fill.price) for fill in broker.fills[-2:]] == [(-1, 3019), (-1, 3021)]
+    # 平仓盈亏: (3019 - 3001) * 10 - (3021 - 2999) * 10 = 180 - 220
+    assert broker.cash == pytest.approx(100000 - 40)
+    assert broker.position('F.CF', 'LONG').posPrice == 3001
+    assert broker.account().totAssets == pytest.approx(100000 - 40 + (3005 - 3001) * 10)
+
+
+class OrderOnFirstBar(object):
+    # 第一根K线下单买入, 之后只记录推送的K线
+    def __init__(self):
+        self.seen = []
+
+    def onInitialize(self, api):
+        api.setSymbolPool(symbols=['A.CS'])
+        api.setRequireBars('DAY_1', 5)
+
+    def onBar(self, api, bar):
+        self.seen.append((bar.tradeDate, bar.close))
+        if len(self.seen) == 1:
+            api.targetPosition('A.CS', 100)
+
+
+def test_engine_fills_at_next_open_and_skips_suspended_bars(data):
+    strategy = OrderOnFirstBar()
+    engine = ReplayEngine(strategy, data, cash=10000., fee_rate=0.)
+    result = engine.run()
+    # 停牌的K线不推送
+    assert strategy.seen == [(DATES[0], 11), (DATES[1], 12), (DATES[3], 14)]
+    fills = [(fill.symbol, fill.qty, fill.price) for fill in result.fills]
+    assert fills == [('A.CS', 100, 12)]
+    # 每日收盘后的总资产, 停牌日按最新价估值
+    assert list(result.equity.index) == DATES
+    assert list(result.equity.values) == [10000, 10000, 10000, 10000 + 100 * 2]
+
+
+def test_engine_keeps_order_pending_over_suspension(data):
+    class OrderOnSecondBar(OrderOnFirstBar):
+        def onBar(self, api, bar):
+            self.seen.append((bar.tradeDate, bar.close))
+            if len(self.seen) == 2:
+                api.targetPosition('A.CS', 100)
+
+    result = ReplayEngine(OrderOnSecondBar(), data, cash=10000., fee_rate=0.).run()
+    # 第三天停牌, 第四天开盘才成交
+    assert [(fill.time, fill.price) for fill in result.fills] == [(int(data.bars('DAY_1', 'A.CS')['time'][3]), 13)]
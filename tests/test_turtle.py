@@ -0,0 +1,35 @@
+# coding=utf-8
+from __future__ import print_function, absolute_import, unicode_literals, division
+import numpy as np
+import pytest
+
+talib = pytest.importorskip('talib')
+
+
+def test_turtle_indicator_matches_talib(strategy):
+    module = strategy('期货海龟交易策略python', 'turtleTradingRule.py')
+    rng = np.random.default_rng(1)
+    close = 3000 + rng.standard_normal(400).cumsum()
+    high = close + rng.uniform(0, 3, 400)
+    low = close - rng.uniform(0, 3, 400)
+    indicator = module.TurtleIndicator(don_open=56, don_close=21, ma_short=11, ma_long=61, atr_period=20)
+    indicator.seed(high[:100], low[:100], close[:100])
+    for end in range(100, 401):
+        if end > 100:
+            indicator.update(high[end - 1], low[end - 1], close[end - 1])
+        h, l, c = high[:end], low[:end], close[:end]
+        assert indicator.atr == pytest.approx(talib.ATR(h, l, c, timeperiod=20)[-1], rel=1e-9)
+        assert indicator.upper_band == talib.MAX(c[:-1], timeperiod=56)[-1]
+        assert indicator.lower_band == talib.MIN(c[:-1], timeperiod=21)[-1]
+        assert indicator.ma_short == pytest.approx(talib.MA(c, timeperiod=11)[-1], rel=1e-9)
+        assert indicator.ma_long == pytest.approx(talib.MA(c, timeperiod=61)[-1], rel=1e-9)
+
+
+def test_turtle_indicator_short_history_is_nan(strategy):
+    module = strategy('期货海龟交易策略python', 'turtleTradingRule.py')
+    indicator = module.TurtleIndicator(don_open=56, don_close=21, ma_short=11, ma_long=61, atr_period=20)
+    closes = np.linspace(10., 12., 15)
+    indicator.seed(closes + 1, closes - 1, closes)
+    assert np.isnan(indicator.atr)
+    assert np.isnan(indicator.upper_band)
+    assert np.isnan(indicator.ma_long)